@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 {
     'name': 'Gestión de Asignación en Tránsito (Control Tower)',
-    'version': '19.0.4.0.0',
+    'version': '19.0.4.3.0',
     'category': 'Inventory/Logistics',
     'summary': 'Torre de control para gestión de contenedores y asignación de pedidos',
     'description': """
@@ -20,13 +20,21 @@
         'security/transit_security.xml',
         'security/ir.model.access.csv',
         'data/ir_sequence_data.xml',
+        'data/ir_cron_data.xml',
         'views/stock_transit_voyage_views.xml',
         'views/stock_picking_views.xml',
         'views/sale_order_views.xml',
         'views/purchase_order_views.xml',
-        'views/to_be_purchased_views.xml', 
+        'views/to_be_purchased_views.xml',
+        'views/transit_auto_match_views.xml',
+        'views/transit_atp_views.xml',
+        'views/transit_reassign_job_views.xml',
         'wizard/transit_reassign_wizard_views.xml',
         'wizard/sale_order_consolidate_purchase_views.xml',
+        'wizard/transit_simulation_result_views.xml',
+        'wizard/transit_rebalance_wizard_views.xml',
+        'wizard/transit_carrier_event_import_views.xml',
+        'wizard/transit_dimension_check_views.xml',
     ],
     'assets': {
         'web.assets_backend': [
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+import hashlib
+
+from odoo import fields, http
+from odoo.http import request
+
+
+class TransitTrackingController(http.Controller):
+    """
+    Endpoint JSON compacto de seguimiento (portal de servicio al cliente / Power BI).
+
+    GET /stock_transit_allocation/tracking?partner_id=<id>|order_id=<id>[&after_id=<id>&limit=<n>]
+
+    - Solo los campos listados abajo (sin search_read de registros completos).
+    - Paginación por id (keyset): 'next_after_id' se pasa como 'after_id' en la siguiente llamada.
+    - ETag calculado con MAX(write_date) + conteo: si coincide con If-None-Match se
+      responde 304 sin ejecutar la consulta de la página.
+    """
+
+    _line_fields = [
+        'voyage_id', 'container_number', 'product_id', 'lot_id', 'product_uom_qty',
+        'allocation_status', 'order_id', 'partner_id', 'voyage_status', 'eta',
+    ]
+    _voyage_fields = [
+        'name', 'custom_status', 'container_number', 'bl_number', 'shipping_line',
+        'vessel_name', 'etd', 'eta', 'arrival_date',
+    ]
+    _default_limit = 200
+    _max_limit = 1000
+
+    @http.route('/stock_transit_allocation/tracking', type='http', auth='user', methods=['GET'], readonly=True)
+    def tracking(self, partner_id=None, order_id=None, after_id=0, limit=None, **kwargs):
+        try:
+            partner_id = int(partner_id or 0)
+            order_id = int(order_id or 0)
+            after_id = int(after_id or 0)
+            limit = min(int(limit or self._default_limit), self._max_limit)
+        except ValueError:
+            return request.make_json_response({'error': 'Parámetros numéricos inválidos'}, status=400)
+        if not partner_id and not order_id:
+            return request.make_json_response({'error': 'Se requiere partner_id u order_id'}, status=400)
+
+        domain = []
+        if order_id:
+            domain.append(('order_id', '=', order_id))
+        if partner_id:
+            domain.append(('partner_id', 'child_of', partner_id))
+
+        etag = self._compute_etag(domain, after_id, limit)
+        headers = [('ETag', f'"{etag}"'), ('Cache-Control', 'private, no-cache')]
+        if request.httprequest.if_none_match.contains(etag):
+            return request.make_response('', headers=headers, status=304)
+
+        Line = request.env['stock.transit.line']
+        lines = Line.search_fetch(domain + [('id', '>', after_id)], self._line_fields, order='id', limit=limit + 1)
+        has_more = len(lines) > limit
+        lines = lines[:limit]
+        voyages = request.env['stock.transit.voyage'].search_fetch(
+            [('id', 'in', lines.voyage_id.ids)], self._voyage_fields, order='id')
+
+        payload = {
+            'voyages': [self._serialize(voyage, self._voyage_fields) for voyage in voyages],
+            'lines': [self._serialize(line, self._line_fields) for line in lines],
+            'next_after_id': lines[-1].id if has_more else None,
+        }
+        return request.make_json_response(payload, headers=headers)
+
+    def _compute_etag(self, domain, after_id, limit):
+        """Huella barata del conjunto: dos agregados indexados, sin leer las filas."""
+        [(line_count, line_date)] = request.env['stock.transit.line']._read_group(
+            domain, [], ['__count', 'write_date:max'])
+        [(voyage_date,)] = request.env['stock.transit.voyage']._read_group(
+            [('line_ids', 'any', domain)], [], ['write_date:max'])
+        key = f"{line_count}|{line_date}|{voyage_date}|{after_id}|{limit}|{request.env.uid}"
+        return hashlib.sha1(key.encode()).hexdigest()
+
+    def _serialize(self, record, field_names):
+        values = {'id': record.id}
+        for name in field_names:
+            field = record._fields[name]
+            value = record[name]
+            if field.type == 'many2one':
+                values[name] = [value.id, value.display_name] if value else None
+            elif field.type == 'date':
+                values[name] = fields.Date.to_string(value) if value else None
+            else:
+                values[name] = value
+        return values
@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+def migrate(cr, version):
+    """Rellena stock_picking.transit_reception_voyage_id desde reception_picking_id."""
+    cr.execute("""
+        UPDATE stock_picking p
+           SET transit_reception_voyage_id = v.id
+          FROM stock_transit_voyage v
+         WHERE v.reception_picking_id = p.id
+           AND p.transit_reception_voyage_id IS NULL
+    """)
+    _logger.info(f"transit_reception_voyage_id: {cr.rowcount} recepciones enlazadas")
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+def migrate(cr, version):
+    """Vuelca el qty_received almacenado de cada allocation como movimiento inicial del libro."""
+    cr.execute("""
+        SELECT 1 FROM information_schema.columns
+         WHERE table_name = 'purchase_order_line_allocation' AND column_name = 'qty_received'
+    """)
+    if not cr.fetchone():
+        return
+    cr.execute("""
+        INSERT INTO purchase_order_line_allocation_receipt
+               (allocation_id, event_type, quantity, date, purchase_order_id, sale_order_id,
+                partner_id, product_id, create_uid, create_date, write_uid, write_date)
+        SELECT a.id,
+               CASE WHEN a.state IN ('partial', 'done') THEN 'reception' ELSE 'transit' END,
+               a.qty_received,
+               COALESCE(a.write_date, now() at time zone 'UTC'),
+               a.purchase_order_id, a.sale_order_id, a.partner_id, a.product_id,
+               1, now() at time zone 'UTC', 1, now() at time zone 'UTC'
+          FROM purchase_order_line_allocation a
+         WHERE a.qty_received > 0
+           AND NOT EXISTS (
+                SELECT 1 FROM purchase_order_line_allocation_receipt r WHERE r.allocation_id = a.id
+           )
+    """)
+    _logger.info(f"Libro de recepciones: {cr.rowcount} saldos iniciales migrados")
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+def migrate(cr, version):
+    """
+    Elimina los índices parciales '_purchase_open_idx' con el predicado anterior
+    (sin IS NULL); el ORM los vuelve a crear con la definición actual.
+    """
+    cr.execute("""
+        SELECT indexname
+          FROM pg_indexes
+         WHERE tablename IN ('stock_transit_voyage', 'purchase_order_line_allocation')
+           AND indexname LIKE '%%purchase_open_idx'
+           AND indexdef NOT LIKE '%%IS NULL%%'
+    """)
+    for index_name, in cr.fetchall():
+        cr.execute(f'DROP INDEX IF EXISTS "{index_name}"')
+        _logger.info(f"Índice {index_name} eliminado para recrearlo con el nuevo predicado")
@@ -6,3 +6,6 @@ from . import stock_picking
 from . import sale_order_inherit
 from . import purchase_order_inherit
 from . import to_be_purchased
+from . import transit_auto_match
+from . import transit_atp
+from . import transit_reassign_job
@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
-from odoo import models, fields, api
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError
+from collections import defaultdict
 
 class PurchaseOrderLineAllocation(models.Model):
     """
@@ -10,6 +12,11 @@ class PurchaseOrderLineAllocation(models.Model):
     _description = 'Asignación de Línea de Compra a Venta'
     _rec_name = 'display_name'
 
+    # Asignaciones abiertas de una OC (carga de viajes y recepciones). IS NULL en el
+    # predicado: el ORM traduce 'not in' a "(col NOT IN (...) OR col IS NULL)"
+    _purchase_open_idx = models.Index("(purchase_order_id, product_id) WHERE state IS NULL OR state NOT IN ('done', 'cancelled')")
+    _purchase_state_idx = models.Index("(purchase_order_id, state)")
+
     purchase_line_id = fields.Many2one(
         'purchase.order.line', 
         string='Línea de Compra', 
@@ -63,10 +70,16 @@ class PurchaseOrderLineAllocation(models.Model):
         ('cancelled', 'Cancelado')
     ], string='Estado', default='pending', tracking=True)
     
+    # Derivada del libro de recepciones (append-only): sin read-modify-write
     qty_received = fields.Float(
         string='Cantidad Recibida',
         digits='Product Unit of Measure',
-        default=0.0
+        compute='_compute_qty_received'
+    )
+    receipt_ids = fields.One2many(
+        'purchase.order.line.allocation.receipt',
+        'allocation_id',
+        string='Historial de Recepciones'
     )
     
     display_name = fields.Char(compute='_compute_display_name', store=True)
@@ -76,16 +89,157 @@ class PurchaseOrderLineAllocation(models.Model):
         for rec in self:
             rec.display_name = f"{rec.sale_order_id.name or '?'} - {rec.partner_id.name or '?'} ({rec.quantity})"
 
+    @api.depends('quantity', 'receipt_ids.quantity')
+    def _compute_qty_received(self):
+        """Suma del libro de recepciones (una consulta agregada), tope en la cantidad asignada."""
+        totals = {}
+        stored = self.filtered(lambda a: a._origin.id)
+        if stored:
+            self.env['purchase.order.line.allocation.receipt'].flush_model(['allocation_id', 'quantity'])
+            self.env.cr.execute("""
+                SELECT allocation_id, SUM(quantity)
+                  FROM purchase_order_line_allocation_receipt
+                 WHERE allocation_id IN %s
+                 GROUP BY allocation_id
+            """, (tuple(stored._origin.ids),))
+            totals = dict(self.env.cr.fetchall())
+        for rec in self:
+            rec.qty_received = min(totals.get(rec._origin.id, 0.0), rec.quantity)
+
     def action_mark_in_transit(self):
         self.write({'state': 'in_transit'})
 
-    def action_mark_received(self, qty=0):
-        for rec in self:
-            new_received = rec.qty_received + qty
-            if new_received >= rec.quantity:
-                rec.write({'qty_received': rec.quantity, 'state': 'done'})
-            elif new_received > 0:
-                rec.write({'qty_received': new_received, 'state': 'partial'})
+    def action_mark_received(self, qty=0, picking=False, voyage=False):
+        self._register_receipts([{
+            'allocation_id': rec.id,
+            'event_type': 'reception',
+            'quantity': qty,
+            'picking_id': picking.id if picking else False,
+            'voyage_id': voyage.id if voyage else False,
+        } for rec in self if qty > 0])
+
+    @api.model
+    def _register_receipts(self, receipt_vals_list):
+        """
+        Registra eventos de recepción en el libro. Solo hay INSERTs (libro y cola):
+        la fila de la allocation no se bloquea ni se reescribe, así que las
+        recepciones concurrentes no se esperan entre sí. qty_received se lee del
+        libro al momento; el estado lo sincroniza el cron desde la cola.
+        """
+        if not receipt_vals_list:
+            return self.env['purchase.order.line.allocation.receipt']
+        receipts = self.env['purchase.order.line.allocation.receipt'].create(receipt_vals_list)
+        self.env['purchase.order.line.allocation.queue']._enqueue(receipts.allocation_id.ids)
+        cron = self.env.ref('stock_transit_allocation.ir_cron_sync_allocation_states', raise_if_not_found=False)
+        if cron:
+            cron.sudo()._trigger()
+        return receipts
+
+    @api.model
+    def _cron_sync_allocation_states(self):
+        """Sincroniza el estado de las allocations encoladas por nuevas recepciones."""
+        allocation_ids = self.env['purchase.order.line.allocation.queue']._pop()
+        self.browse(allocation_ids).exists()._sync_state_from_ledger()
+
+    def _sync_state_from_ledger(self):
+        """
+        Deriva el estado desde el agregado del libro: con recepción física ->
+        'done'/'partial'; solo carga en tránsito -> 'in_transit'. Las canceladas
+        no se tocan. Lo ejecuta el cron (un solo proceso a la vez); los cambios se
+        escriben por el ORM para conservar el seguimiento (tracking).
+        """
+        allocations = self.filtered(lambda a: a.state != 'cancelled')
+        if not allocations.ids:
+            return
+        self.env['purchase.order.line.allocation.receipt'].flush_model()
+        allocations.flush_recordset(['quantity'])
+        self.env.cr.execute("""
+            SELECT r.allocation_id,
+                   CASE
+                       WHEN bool_or(r.event_type = 'reception') THEN
+                           CASE WHEN SUM(r.quantity) >= MAX(al.quantity) THEN 'done' ELSE 'partial' END
+                       ELSE 'in_transit'
+                   END AS new_state
+              FROM purchase_order_line_allocation_receipt r
+              JOIN purchase_order_line_allocation al ON al.id = r.allocation_id
+             WHERE r.allocation_id IN %s
+             GROUP BY r.allocation_id
+        """, (tuple(allocations.ids),))
+        new_states = dict(self.env.cr.fetchall())
+
+        by_state = defaultdict(lambda: self.browse())
+        for allocation in allocations:
+            new_state = new_states.get(allocation.id)
+            if new_state and new_state != allocation.state:
+                by_state[new_state] |= allocation
+        for new_state, records in by_state.items():
+            records.write({'state': new_state})
+
+
+class PurchaseOrderLineAllocationQueue(models.Model):
+    """
+    Allocations con recepciones pendientes de sincronizar su estado.
+    Solo INSERT desde las transacciones de usuario; el cron la vacía.
+    """
+    _name = 'purchase.order.line.allocation.queue'
+    _description = 'Cola de Sincronización de Asignaciones'
+    _log_access = False
+
+    allocation_id = fields.Many2one('purchase.order.line.allocation', string='Asignación', required=True, ondelete='cascade')
+
+    @api.model
+    def _enqueue(self, allocation_ids):
+        if not allocation_ids:
+            return
+        self.env.cr.execute(
+            f"INSERT INTO {self._table} (allocation_id) SELECT unnest(%s::int[])",
+            (sorted(allocation_ids),))
+
+    @api.model
+    def _pop(self):
+        """Vacía la cola y devuelve los ids de allocation (sin duplicados)."""
+        self.env.cr.execute(f"DELETE FROM {self._table} RETURNING allocation_id")
+        return sorted({row[0] for row in self.env.cr.fetchall()})
+
+
+class PurchaseOrderLineAllocationReceipt(models.Model):
+    """
+    Libro append-only de recepciones por allocation: una fila por evento
+    (carga en tránsito o recepción física). qty_received y state de la
+    allocation se derivan de este libro.
+    """
+    _name = 'purchase.order.line.allocation.receipt'
+    _description = 'Historial de Recepción de Asignación'
+    _order = 'date desc, id desc'
+
+    _allocation_date_idx = models.Index("(allocation_id, date)")
+
+    allocation_id = fields.Many2one(
+        'purchase.order.line.allocation',
+        string='Asignación',
+        required=True,
+        ondelete='cascade',
+        index=True
+    )
+    event_type = fields.Selection([
+        ('transit', 'Carga en Tránsito'),
+        ('reception', 'Recepción Física'),
+    ], string='Evento', required=True, default='reception')
+    quantity = fields.Float(string='Cantidad', digits='Product Unit of Measure', required=True)
+    date = fields.Datetime(string='Fecha', required=True, default=fields.Datetime.now, index=True)
+    picking_id = fields.Many2one('stock.picking', string='Picking', index='btree_not_null')
+    voyage_id = fields.Many2one('stock.transit.voyage', string='Viaje', index='btree_not_null')
+
+    purchase_order_id = fields.Many2one(related='allocation_id.purchase_order_id', store=True, index=True)
+    sale_order_id = fields.Many2one(related='allocation_id.sale_order_id', store=True)
+    partner_id = fields.Many2one(related='allocation_id.partner_id', store=True)
+    product_id = fields.Many2one(related='allocation_id.product_id', store=True)
+
+    def write(self, vals):
+        raise UserError(_("El historial de recepciones no se puede modificar; registre un nuevo movimiento."))
+
+    def unlink(self):
+        raise UserError(_("El historial de recepciones no se puede eliminar."))
 
 
 class PurchaseOrderLine(models.Model):
@@ -107,29 +261,104 @@ class PurchaseOrderLine(models.Model):
         compute='_compute_allocation_summary'
     )
 
+    # Número de clientes mostrados en el resumen antes de "(+N)"
+    _allocation_summary_top = 3
+
     @api.depends('allocation_ids', 'allocation_ids.quantity', 'allocation_ids.partner_id')
     def _compute_allocation_summary(self):
+        """
+        Resumen por conjunto: una consulta agrupada por (línea, cliente) para todo
+        el recordset. Los clientes se ordenan por cantidad desc., nombre e id
+        para que el texto sea determinista.
+        """
+        qty_by_line = defaultdict(lambda: defaultdict(float))
+        stored_lines = self.filtered(lambda l: l._origin.id)
+        if stored_lines:
+            groups = self.env['purchase.order.line.allocation']._read_group(
+                [('purchase_line_id', 'in', stored_lines._origin.ids)],
+                ['purchase_line_id', 'partner_id'],
+                ['quantity:sum'],
+            )
+            for po_line, partner, qty in groups:
+                qty_by_line[po_line.id][partner] += qty
+        # Líneas nuevas (onchange): se usan las asignaciones en memoria
+        for line in self - stored_lines:
+            for alloc in line.allocation_ids:
+                qty_by_line[line.id][alloc.partner_id] += alloc.quantity
+
+        top = self._allocation_summary_top
         for line in self:
-            if line.allocation_ids:
-                partners = line.allocation_ids.mapped('partner_id.name')
-                line.allocation_summary = ', '.join(filter(None, partners[:3]))
-                if len(partners) > 3:
-                    line.allocation_summary += f" (+{len(partners)-3})"
-                line.total_allocated = sum(line.allocation_ids.mapped('quantity'))
-            else:
+            partner_qty = qty_by_line.get(line._origin.id or line.id)
+            if not partner_qty:
                 line.allocation_summary = 'Sin asignar'
                 line.total_allocated = 0.0
+                continue
+            ranked = sorted(
+                (partner for partner in partner_qty if partner),
+                key=lambda p: (-partner_qty[p], p.name or '', p.id),
+            )
+            summary = ', '.join(filter(None, (p.name for p in ranked[:top])))
+            if len(ranked) > top:
+                summary += f" (+{len(ranked) - top})"
+            line.allocation_summary = summary
+            line.total_allocated = sum(partner_qty.values())
+
+    # Parámetro de sistema: dividir el movimiento de entrada por allocation
+    _split_moves_param = 'stock_transit_allocation.split_moves_by_allocation'
 
     def _prepare_stock_moves(self, picking):
         res = super(PurchaseOrderLine, self)._prepare_stock_moves(picking)
+        if not self.allocation_ids:
+            return res
+
+        split = self.env['ir.config_parameter'].sudo().get_param(self._split_moves_param)
+        if split and split.lower() not in ('0', 'false'):
+            return self._split_move_vals_by_allocation(res)
         
         for move_vals in res:
-            if self.allocation_ids:
-                first_alloc = self.allocation_ids[0]
-                move_vals['sale_line_id'] = first_alloc.sale_line_id.id
-                
-                order = first_alloc.sale_order_id
-                if order and hasattr(order, 'procurement_group_id') and order.procurement_group_id:
-                    move_vals['group_id'] = order.procurement_group_id.id
+            first_alloc = self.allocation_ids[0]
+            move_vals['sale_line_id'] = first_alloc.sale_line_id.id
+            
+            order = first_alloc.sale_order_id
+            if order and hasattr(order, 'procurement_group_id') and order.procurement_group_id:
+                move_vals['group_id'] = order.procurement_group_id.id
         
-        return res
\ No newline at end of file
+        return res
+
+    def _split_move_vals_by_allocation(self, move_vals_list):
+        """
+        Divide cada movimiento de entrada en una parte por allocation (con su
+        sale_line_id y grupo de abastecimiento) y un resto sin venta si sobra.
+        Descuenta lo ya planificado en movimientos previos de esta línea para
+        no duplicar cuando la OC se modifica tras confirmar.
+        """
+        planned = defaultdict(float)
+        for move in self.move_ids.filtered(lambda m: m.state != 'cancel' and m.sale_line_id):
+            planned[move.sale_line_id.id] += move.product_uom_qty
+
+        pending = []
+        for alloc in self.allocation_ids.filtered(lambda a: a.state != 'cancelled').sorted('id'):
+            qty = alloc.quantity - planned[alloc.sale_line_id.id]
+            if qty > 0:
+                pending.append([alloc, qty])
+
+        result = []
+        for move_vals in move_vals_list:
+            to_split = move_vals.get('product_uom_qty', 0.0)
+            for item in pending:
+                alloc, alloc_qty = item
+                if to_split <= 0:
+                    break
+                if alloc_qty <= 0:
+                    continue
+                part = min(alloc_qty, to_split)
+                part_vals = dict(move_vals, product_uom_qty=part, sale_line_id=alloc.sale_line_id.id)
+                order = alloc.sale_order_id
+                if order and hasattr(order, 'procurement_group_id') and order.procurement_group_id:
+                    part_vals['group_id'] = order.procurement_group_id.id
+                result.append(part_vals)
+                item[1] -= part
+                to_split -= part
+            if to_split > 0:
+                result.append(dict(move_vals, product_uom_qty=to_split))
+        return result
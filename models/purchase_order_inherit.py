@@ -1,5 +1,5 @@
 # -*- coding: utf-8 -*-
-from odoo import models, fields, api
+from odoo import models, fields, api, Command
 
 class PurchaseOrder(models.Model):
     _inherit = 'purchase.order'
@@ -13,27 +13,38 @@ class PurchaseOrder(models.Model):
 
     @api.depends('order_line.allocation_ids.sale_order_id')
     def _compute_sale_order_ids(self):
+        # Una sola consulta agrupada para todas las OCs del recordset
+        sale_ids_by_po = {}
+        stored = self.filtered(lambda po: po._origin.id)
+        if stored:
+            groups = self.env['purchase.order.line.allocation']._read_group(
+                [('purchase_order_id', 'in', stored._origin.ids)],
+                ['purchase_order_id'],
+                ['sale_order_id:array_agg'],
+            )
+            sale_ids_by_po = {po.id: sorted(set(filter(None, sale_ids))) for po, sale_ids in groups}
         for po in self:
-            allocations = self.env['purchase.order.line.allocation'].search([
-                ('purchase_order_id', '=', po.id)
-            ])
-            po.sale_order_ids = allocations.mapped('sale_order_id')
+            po.sale_order_ids = [Command.set(sale_ids_by_po.get(po._origin.id, []))]
 
     def button_confirm(self):
         res = super(PurchaseOrder, self).button_confirm()
-        for po in self:
-            allocations = self.env['purchase.order.line.allocation'].search([
-                ('purchase_order_id', '=', po.id)
-            ])
-            if allocations:
-                # CORRECCIÓN: Se eliminó 'state': 'draft'
-                voyage = self.env['stock.transit.voyage'].create({
-                    'purchase_id': po.id,
-                    'custom_status': 'solicitud',
-                    'container_number': 'TBD (En Solicitud)',
-                    'vessel_name': 'Por Definir',
-                    'bl_number': po.partner_ref or po.name,
-                })
-                voyage.action_load_from_purchase()
-                allocations.write({'state': 'pending'})
-        return res
\ No newline at end of file
+
+        # Una sola búsqueda de allocations para todas las OCs confirmadas
+        allocations = self.env['purchase.order.line.allocation'].search([
+            ('purchase_order_id', 'in', self.ids)
+        ])
+        if not allocations:
+            return res
+
+        purchases = allocations.purchase_order_id
+        # CORRECCIÓN: Se eliminó 'state': 'draft'
+        voyages = self.env['stock.transit.voyage'].create([{
+            'purchase_id': po.id,
+            'custom_status': 'solicitud',
+            'container_number': 'TBD (En Solicitud)',
+            'vessel_name': 'Por Definir',
+            'bl_number': po.partner_ref or po.name,
+        } for po in purchases])
+        voyages._load_from_purchases(allocations)
+        allocations.write({'state': 'pending'})
+        return res
@@ -6,14 +6,15 @@ class SaleOrder(models.Model):
     _inherit = 'sale.order'
 
     def unlink(self):
-        for order in self:
-            # Buscar si tiene líneas en tránsito que ya tengan lote (recepción física iniciada)
-            transit_lines = self.env['stock.transit.line'].search([
-                ('order_id', '=', order.id),
-                ('lot_id', '!=', False)
-            ])
-            if transit_lines:
-                raise UserError(_("No puede eliminar el pedido %s porque ya tiene mercancía recibida en tránsito (Torre de Control).") % order.name)
+        # Una sola consulta agrupada para todo el lote (índice _order_lot_idx de
+        # stock.transit.line). Se incluyen líneas archivadas: la mercancía ya se recibió.
+        blocking = self.env['stock.transit.line'].sudo().with_context(active_test=False)._read_group(
+            [('order_id', 'in', self.ids), ('lot_id', '!=', False)],
+            ['order_id'],
+        )
+        if blocking:
+            names = ', '.join(sorted(order.name for order, in blocking))
+            raise UserError(_("No puede eliminar los pedidos %s porque ya tienen mercancía recibida en tránsito (Torre de Control).") % names)
         return super(SaleOrder, self).unlink()
 
 class SaleOrderLine(models.Model):
@@ -24,4 +25,23 @@ class SaleOrderLine(models.Model):
         default=False,
         help="Si está marcado, se considerará para la asignación automática en la Torre de Control "
              "cuando se genere la compra."
-    )
\ No newline at end of file
+    )
+
+    transit_promise_date = fields.Date(
+        string='Promesa (ATP)',
+        compute='_compute_transit_promise_date',
+        help="Primera fecha en que existencias libres, tránsito sin asignar y compras abiertas "
+             "cubren la cantidad pendiente de la línea."
+    )
+
+    @api.depends('product_id', 'product_uom_qty', 'qty_delivered')
+    def _compute_transit_promise_date(self):
+        ATP = self.env['stock.transit.atp']
+        timelines = ATP._get_timelines(self.product_id.ids)
+        for line in self:
+            if not line.product_id or line.display_type:
+                line.transit_promise_date = False
+                continue
+            dates, cumulatives = timelines[line.product_id.id]
+            line.transit_promise_date = ATP._find_promise_date(
+                dates, cumulatives, line.product_uom_qty - line.qty_delivered)
@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 from odoo import models, fields, api, _
 from odoo.exceptions import UserError
+from collections import defaultdict
+from markupsafe import Markup
 import logging
 
 _logger = logging.getLogger(__name__)
@@ -12,6 +14,9 @@ class StockPicking(models.Model):
     transit_count = fields.Integer(compute='_compute_transit_count')
     transit_container_number = fields.Char(string='No. Contenedor (Ref)')
     transit_bl_number = fields.Char(string='BL Number (Tránsito)')
+    transit_reception_voyage_id = fields.Many2one('stock.transit.voyage', string='Viaje (Recepción Física)',
+        readonly=True, copy=False, index='btree_not_null',
+        help="Viaje cuya Recepción Física (Worksheet) es este picking")
     transit_sale_order_ids = fields.Many2many('sale.order', string='Pedidos Consolidados', compute='_compute_transit_sale_orders', store=True)
 
     @api.depends('move_ids.sale_line_id')
@@ -38,20 +43,11 @@ class StockPicking(models.Model):
         _logger.info(f"[TC_DEBUG] Sincronizando Picking {self.name} con Viaje...")
 
         # 1. Encontrar el viaje que generó este picking
-        voyage = self.env['stock.transit.voyage'].search([
-            ('reception_picking_id', '=', self.id)
-        ], limit=1)
+        voyage = self.transit_reception_voyage_id
 
         if not voyage:
-            # Fallback: intentar por el nombre en el origen si se perdió el enlace directo
-            if self.origin:
-                origin_ref = self.origin.split(' ')[0] # Ej: "VOY/2026/005"
-                voyage = self.env['stock.transit.voyage'].search([
-                    ('name', 'ilike', origin_ref)
-                ], limit=1)
-        
-        if not voyage:
-            raise UserError(_("No se encontró un Viaje de Tránsito vinculado a esta recepción para sincronizar."))
+            raise UserError(_("No se encontró un Viaje de Tránsito vinculado a esta recepción para sincronizar. "
+                              "Use 'Reparar Enlace con Embarque' si el enlace se perdió."))
 
         # 2. Limpiar líneas de detalle existentes (stock.move.line)
         # Esto permite re-sincronizar si hubo cambios en el viaje antes de validar
@@ -59,73 +55,143 @@ class StockPicking(models.Model):
             self.move_line_ids.unlink()
 
         # 3. Inyectar Lotes desde el Viaje
-        lines_created = 0
-        for line in voyage.line_ids:
-            if not line.lot_id or line.product_uom_qty <= 0:
-                continue
-
-            # Buscar el movimiento de demanda (stock.move) correspondiente a este producto
-            move = self.move_ids.filtered(lambda m: m.product_id.id == line.product_id.id and m.state not in ['done', 'cancel'])
-            
-            target_move = False
-            
-            if move:
-                target_move = move[0]
-            else:
-                # === FIX: AUTO-CREACIÓN DE DEMANDA ===
-                # Si no existe la demanda en el picking (ej. se creó vacío o cambió el viaje), la creamos.
-                _logger.info(f"[TC_FIX] Creando demanda faltante para {line.product_id.name} en {self.name}")
-                try:
-                    target_move = self.env['stock.move'].create({
+        valid_lines = voyage.line_ids.filtered(lambda l: l.lot_id and l.product_uom_qty > 0)
+        errors = []
+
+        # 3.1 Mapa producto -> movimiento de demanda (stock.move), construido una vez
+        move_by_product = {}
+        for move in self.move_ids:
+            if move.state not in ['done', 'cancel'] and move.product_id.id not in move_by_product:
+                move_by_product[move.product_id.id] = move
+
+        # 3.2 === FIX: AUTO-CREACIÓN DE DEMANDA ===
+        # Si no existe la demanda en el picking (ej. se creó vacío o cambió el viaje),
+        # la creamos para todos los productos faltantes y se confirma en un solo paso.
+        missing_qty = defaultdict(float)
+        for line in valid_lines:
+            if line.product_id.id not in move_by_product:
+                missing_qty[line.product_id] += line.product_uom_qty
+
+        if missing_qty:
+            _logger.info(f"[TC_FIX] Creando demanda faltante para {len(missing_qty)} productos en {self.name}")
+            try:
+                with self.env.cr.savepoint():
+                    new_moves = self.env['stock.move'].create([{
                         'picking_id': self.id,
-                        'product_id': line.product_id.id,
-                        'product_uom': line.product_id.uom_id.id,
-                        'product_uom_qty': line.product_uom_qty, # Cantidad planeada
+                        'product_id': product.id,
+                        'product_uom': product.uom_id.id,
+                        'product_uom_qty': qty, # Cantidad planeada
                         'location_id': self.location_id.id,
                         'location_dest_id': self.location_dest_id.id,
                         'company_id': self.company_id.id,
                         # 'name' omitido para compatibilidad con Odoo 19
-                    })
-                    # Confirmamos el movimiento para que pase a 'confirmed'/'assigned'
-                    target_move._action_confirm()
-                except Exception as e:
-                    _logger.error(f"[TC_ERROR] No se pudo crear demanda para {line.product_id.name}: {e}")
-                    continue
-
-            # Crear la línea de detalle (Move Line) con el lote y la cantidad hecha
-            try:
-                self.env['stock.move.line'].create({
-                    'picking_id': self.id,
-                    'move_id': target_move.id,
-                    'product_id': line.product_id.id,
-                    'product_uom_id': line.product_id.uom_id.id,
-                    'lot_id': line.lot_id.id,
-                    'location_id': target_move.location_id.id,
-                    'location_dest_id': target_move.location_dest_id.id,
-                    'quantity': line.product_uom_qty, 
-                })
-                lines_created += 1
+                    } for product, qty in missing_qty.items()])
+                    # Confirmamos los movimientos para que pasen a 'confirmed'/'assigned'
+                    new_moves._action_confirm()
+                for move in new_moves:
+                    move_by_product.setdefault(move.product_id.id, move)
             except Exception as e:
-                _logger.error(f"[TC_ERROR] Error creando linea de sincronización para lote {line.lot_id.name}: {e}")
+                _logger.error(f"[TC_ERROR] No se pudo crear la demanda faltante en {self.name}: {e}")
+                errors.extend(
+                    _("%(product)s: no se pudo crear la demanda (%(error)s)", product=product.display_name, error=e)
+                    for product in missing_qty
+                )
+
+        # 3.3 Preparar todas las líneas de detalle (Move Line) con lote y cantidad hecha
+        move_line_vals = []
+        for line in valid_lines:
+            target_move = move_by_product.get(line.product_id.id)
+            if not target_move:
+                continue
+            move_line_vals.append({
+                'picking_id': self.id,
+                'move_id': target_move.id,
+                'product_id': line.product_id.id,
+                'product_uom_id': line.product_id.uom_id.id,
+                'lot_id': line.lot_id.id,
+                'location_id': target_move.location_id.id,
+                'location_dest_id': target_move.location_dest_id.id,
+                'quantity': line.product_uom_qty,
+            })
+
+        # 3.4 Creación en bloque; si falla, se reintenta línea a línea para aislar los errores
+        lines_created = 0
+        MoveLine = self.env['stock.move.line']
+        try:
+            with self.env.cr.savepoint():
+                lines_created = len(MoveLine.create(move_line_vals))
+        except Exception as e:
+            _logger.warning(f"[TC_ERROR] Creación en bloque fallida en {self.name}, reintentando por línea: {e}")
+            for vals in move_line_vals:
+                try:
+                    with self.env.cr.savepoint():
+                        MoveLine.create(vals)
+                    lines_created += 1
+                except Exception as line_error:
+                    lot_name = self.env['stock.lot'].browse(vals['lot_id']).name
+                    errors.append(_("Lote %(lot)s: %(error)s", lot=lot_name, error=line_error))
+
+        if errors:
+            _logger.error(f"[TC_ERROR] Sincronización de {self.name} con {len(errors)} errores")
 
         # 4. Resultado y Notificación
         if lines_created > 0:
+            if errors:
+                # Solo se publica cuando no hay excepción: un UserError revertiría el mensaje
+                self.message_post(body=Markup("{title}<br/>{errors}").format(
+                    title=_("Errores de sincronización con el Viaje %s:", voyage.name),
+                    errors=Markup("<br/>").join(f"- {err}" for err in errors),
+                ))
             msg = f"Sincronización completada. {lines_created} líneas de lotes cargadas desde el Viaje {voyage.name}."
             self.message_post(body=msg)
-            
+
+            message = _('Los lotes han sido cargados. Verifique las cantidades y presione Validar.')
+            if errors:
+                message = _('%(count)s lotes cargados, %(errors)s con error (ver historial del picking).',
+                            count=lines_created, errors=len(errors))
             return {
                 'type': 'ir.actions.client',
                 'tag': 'display_notification',
                 'params': {
                     'title': _('Sincronización Exitosa'),
-                    'message': _('Los lotes han sido cargados. Verifique las cantidades y presione Validar.'),
-                    'type': 'success',
-                    'sticky': False,
+                    'message': message,
+                    'type': 'warning' if errors else 'success',
+                    'sticky': bool(errors),
                 }
             }
+        elif errors:
+            raise UserError(_("No se pudo sincronizar ninguna línea:\n%s") % "\n".join(errors))
         else:
             raise UserError(_("No se encontraron líneas válidas (con lote y cantidad > 0) en el viaje para sincronizar."))
 
+    def action_repair_transit_voyage_link(self):
+        """
+        Reparación explícita del enlace Recepción Física -> Viaje cuando se perdió.
+        Busca por reception_picking_id y, como último recurso, por la referencia
+        del viaje en el origen del picking (ej. "EMBARQUE/2026/0005 (Recepción Física)").
+        """
+        self.ensure_one()
+        Voyage = self.env['stock.transit.voyage']
+        voyage = Voyage.search([('reception_picking_id', '=', self.id)], limit=1)
+
+        if not voyage and self.origin:
+            origin_ref = self.origin.split(' ')[0]
+            voyage = Voyage.search([('name', '=', origin_ref)], limit=1)
+            if not voyage:
+                candidates = Voyage.search([('name', 'ilike', origin_ref)], limit=2)
+                if len(candidates) > 1:
+                    raise UserError(_("La referencia '%s' coincide con varios viajes. Vincule el viaje manualmente.") % origin_ref)
+                voyage = candidates
+
+        if not voyage:
+            raise UserError(_("No se encontró un Viaje de Tránsito para esta recepción."))
+
+        self.transit_reception_voyage_id = voyage
+        if not voyage.reception_picking_id:
+            voyage.reception_picking_id = self
+        self.message_post(body=_("Enlace con el Viaje %s reparado.") % voyage.name)
+        return True
+
     # -------------------------------------------------------------------------
     # SOBREESCRITURAS DE COMPORTAMIENTO (VALIDACIÓN Y ASIGNACIÓN)
     # -------------------------------------------------------------------------
@@ -134,35 +200,38 @@ class StockPicking(models.Model):
         """
         Sobreescritura: Al validar la Recepción Física (Internal: Transit->Stock), 
         buscamos el Delivery Order correspondiente y forzamos la reserva del lote recibido.
+        Soporta lotes de pickings: las entradas a tránsito se procesan en bloque.
         """
-        _logger.info(f"=== [TC_DEBUG] VALIDATE BUTTON CLICKED - Picking {self.name} (ID: {self.id}) ===")
+        _logger.info(f"=== [TC_DEBUG] VALIDATE BUTTON CLICKED - Pickings {self.mapped('name')} ===")
         
         # 1. Ejecutar validación estándar de Odoo (mueve el stock a físico)
         res = super(StockPicking, self).button_validate()
         
-        for pick in self:
-            # A) Lógica de Entrada (Crear Viaje al recibir PO -> Tránsito)
-            is_transit_loc = False
-            dest_loc = pick.location_dest_id
-            if dest_loc and (dest_loc.id == 128 or any(x in dest_loc.name for x in ['Transit', 'Tránsito', 'Trancit'])):
-                is_transit_loc = True
-            
-            if is_transit_loc and pick.picking_type_code == 'incoming':
-                _logger.info(f"[TC_DEBUG] Picking {pick.name} detectado como Entrada a Tránsito. Creando/Actualizando Viaje...")
-                pick._create_automatic_transit_voyage()
-
-            # B) Lógica de Recepción Física (Tránsito -> Stock) -> Asignar a Entrega
-            # Esta lógica se ejecuta SOLO cuando el usuario valida manualmente (después de sincronizar)
-            if pick.picking_type_code == 'internal' and pick.state == 'done':
-                _logger.info(f"[TC_DEBUG] Picking {pick.name} validado (Internal/Done). Iniciando lógica de asignación a Ventas...")
-                try:
-                    pick._assign_lots_to_delivery_orders()
-                except Exception as e:
-                    _logger.error(f"[TC_ERROR] Falló la asignación automática en {pick.name}: {str(e)}", exc_info=True)
+        # A) Lógica de Entrada (Crear Viaje al recibir PO -> Tránsito), agrupada por OC
+        transit_receipts = self.filtered(
+            lambda p: p.picking_type_code == 'incoming' and p.state == 'done' and p._is_transit_destination()
+        )
+        if transit_receipts:
+            _logger.info(f"[TC_DEBUG] {len(transit_receipts)} entradas a Tránsito detectadas. Creando/Actualizando Viajes...")
+            transit_receipts._create_automatic_transit_voyages()
+
+        # B) Lógica de Recepción Física (Tránsito -> Stock) -> Asignar a Entrega
+        # Esta lógica se ejecuta SOLO cuando el usuario valida manualmente (después de sincronizar)
+        for pick in self.filtered(lambda p: p.picking_type_code == 'internal' and p.state == 'done'):
+            _logger.info(f"[TC_DEBUG] Picking {pick.name} validado (Internal/Done). Iniciando lógica de asignación a Ventas...")
+            try:
+                pick._assign_lots_to_delivery_orders()
+            except Exception as e:
+                _logger.error(f"[TC_ERROR] Falló la asignación automática en {pick.name}: {str(e)}", exc_info=True)
 
-        _logger.info(f"=== [TC_DEBUG] VALIDATION FINISHED - Picking {self.name} ===")
+        _logger.info(f"=== [TC_DEBUG] VALIDATION FINISHED - Pickings {self.mapped('name')} ===")
         return res
 
+    def _is_transit_destination(self):
+        self.ensure_one()
+        dest_loc = self.location_dest_id
+        return bool(dest_loc and (dest_loc.id == 128 or any(x in dest_loc.name for x in ['Transit', 'Tránsito', 'Trancit'])))
+
     def _assign_lots_to_delivery_orders(self):
         """
         Reserva forzosamente los lotes en la Orden de Entrega del cliente.
@@ -172,9 +241,7 @@ class StockPicking(models.Model):
         _logger.info(f"[TC_DEBUG] _assign_lots_to_delivery_orders START for {self.name}")
         
         # 1. Buscar si esta recepción pertenece a un Voyage (Torre de Control)
-        voyage = self.env['stock.transit.voyage'].search([
-            ('reception_picking_id', '=', self.id)
-        ], limit=1)
+        voyage = self.transit_reception_voyage_id
 
         if not voyage:
             _logger.info(f"[TC_DEBUG] El picking {self.name} NO está vinculado como recepción de ningún Viaje de Tránsito. Saltando.")
@@ -191,14 +258,13 @@ class StockPicking(models.Model):
         _logger.info(f"[TC_DEBUG] Mapa de Asignación (Lote -> SO): {len(lot_to_so_map)} reglas encontradas en el viaje.")
 
         # 3. Recorrer lo que ACABAMOS de recibir (Move Lines del Picking actual)
-        count_success = 0
+        received = []
         for move_line in self.move_line_ids:
             if not move_line.lot_id:
                 continue
-            
+
             # ODOO 19 FIX: usar 'quantity' en lugar de 'qty_done'
             qty_just_moved = move_line.quantity if move_line.quantity > 0 else move_line.qty_done
-            
             if qty_just_moved <= 0:
                 continue
 
@@ -207,123 +273,210 @@ class StockPicking(models.Model):
             if not target_so:
                 _logger.info(f"[TC_DEBUG] Lote {move_line.lot_id.name} recibido, pero NO tenía asignación reservada en el Viaje. Queda Libre.")
                 continue
+            received.append((move_line, target_so, qty_just_moved))
 
-            _logger.info(f"--- [TC_DEBUG] Procesando Lote: {move_line.lot_id.name} ---")
-            _logger.info(f"    > Destino Comercial: {target_so.name}")
-            _logger.info(f"    > Ubicación Física Actual: {move_line.location_dest_id.display_name}")
-            _logger.info(f"    > Cantidad: {qty_just_moved}")
-
-            # 4. Buscar la Entrega (Delivery) pendiente de esa SO
-            domain_delivery = [
-                ('picking_type_code', '=', 'outgoing'),
-                ('state', 'in', ['confirmed', 'assigned', 'partially_available']),
-                ('company_id', '=', self.company_id.id)
-            ]
-            
-            # Estrategia 1: Buscar por sale_id
-            delivery_picking = self.env['stock.picking'].search(
-                domain_delivery + [('sale_id', '=', target_so.id)], 
-                limit=1
-            )
-            
-            if not delivery_picking:
-                # Estrategia 2: Fallback por Origin
-                delivery_picking = self.env['stock.picking'].search(
-                    domain_delivery + [('origin', '=', target_so.name)], 
-                    limit=1
-                )
+        if not received:
+            _logger.info(f"[TC_DEBUG] Proceso finalizado. 0 lotes asignados.")
+            return
 
+        # 4. Buscar las Entregas (Delivery) pendientes de TODAS las SO en una sola búsqueda
+        target_sos = self.env['sale.order'].union(*[so for __, so, __ in received])
+        deliveries = self.env['stock.picking'].search([
+            ('picking_type_code', '=', 'outgoing'),
+            ('state', 'in', ['confirmed', 'assigned', 'partially_available']),
+            ('company_id', '=', self.company_id.id),
+            '|', ('sale_id', 'in', target_sos.ids), ('origin', 'in', target_sos.mapped('name')),
+        ])
+
+        # Estrategia 1: por sale_id; Estrategia 2: fallback por Origin
+        delivery_by_so = {}
+        so_by_name = {so.name: so for so in target_sos}
+        for delivery in deliveries.filtered('sale_id'):
+            if delivery.sale_id in target_sos:
+                delivery_by_so.setdefault(delivery.sale_id.id, delivery)
+        for delivery in deliveries:
+            so = so_by_name.get(delivery.origin)
+            if so:
+                delivery_by_so.setdefault(so.id, delivery)
+
+        # 5. Índice de movimientos de las entregas por (picking, producto)
+        move_by_picking_product = {}
+        for move in deliveries.move_ids:
+            if move.state not in ['done', 'cancel']:
+                move_by_picking_product.setdefault((move.picking_id.id, move.product_id.id), move)
+
+        # Resolver el movimiento objetivo de cada lote recibido
+        assignments = []
+        for move_line, target_so, qty_just_moved in received:
+            delivery_picking = delivery_by_so.get(target_so.id)
             if not delivery_picking:
                 _logger.warning(f"    [!] No se encontró Entrega (Delivery) pendiente para {target_so.name}.")
                 continue
-
-            # 5. Buscar el Movimiento (Stock Move) del producto en la Entrega
-            target_move = delivery_picking.move_ids.filtered(
-                lambda m: m.product_id.id == move_line.product_id.id and m.state not in ['done', 'cancel']
-            )
-
+            target_move = move_by_picking_product.get((delivery_picking.id, move_line.product_id.id))
             if not target_move:
                 _logger.warning(f"    [!] El producto {move_line.product_id.name} no está en la entrega {delivery_picking.name}.")
                 continue
-            
-            target_move = target_move[0]
-            _logger.info(f"    > Move Objetivo ID: {target_move.id} (Pide: {target_move.product_uom_qty})")
-
-            # =========================================================
-            # PASO CRÍTICO: LIMPIEZA DE RESERVAS PREVIAS
-            # =========================================================
-            if target_move.state in ['partially_available', 'assigned']:
-                try:
-                    _logger.info(f"    > Liberando reservas previas en {target_move.id}...")
-                    target_move._do_unreserve()
-                except Exception as e:
-                    _logger.warning(f"    [!] Error al des-reservar: {e}")
-
-            # =========================================================
-            # PASO CRÍTICO: INYECCIÓN DE LA RESERVA
-            # =========================================================
-            try:
-                # Verificamos si ya existe la línea exacta
-                existing_reserved = self.env['stock.move.line'].search([
-                    ('move_id', '=', target_move.id),
-                    ('lot_id', '=', move_line.lot_id.id),
-                    ('picking_id', '=', delivery_picking.id)
-                ], limit=1)
-
-                if existing_reserved:
-                    new_qty = existing_reserved.quantity + qty_just_moved
-                    existing_reserved.write({
-                        'quantity': new_qty,
-                        'location_id': move_line.location_dest_id.id, 
-                    })
-                    _logger.info(f"    [OK] Reserva ACTUALIZADA en {delivery_picking.name}")
-                else:
-                    self.env['stock.move.line'].create({
-                        'picking_id': delivery_picking.id,
-                        'move_id': target_move.id,
-                        'product_id': move_line.product_id.id,
-                        'lot_id': move_line.lot_id.id,
-                        'product_uom_id': move_line.product_uom_id.id,
-                        'location_id': move_line.location_dest_id.id, # CRUCIAL: Donde está ahora
-                        'location_dest_id': target_move.location_dest_id.id,
-                        'quantity': qty_just_moved, 
-                    })
-                    _logger.info(f"    [OK] Reserva CREADA en {delivery_picking.name}")
-                
-                count_success += 1
+            assignments.append((move_line, delivery_picking, target_move, qty_just_moved))
+
+        if not assignments:
+            _logger.info(f"[TC_DEBUG] Proceso finalizado. 0 lotes asignados.")
+            return
 
+        target_moves = self.env['stock.move'].union(*[move for __, __, move, __ in assignments])
+
+        # =========================================================
+        # PASO CRÍTICO: LIMPIEZA DE RESERVAS PREVIAS (en bloque)
+        # =========================================================
+        to_unreserve = target_moves.filtered(lambda m: m.state in ['partially_available', 'assigned'])
+        if to_unreserve:
+            try:
+                _logger.info(f"    > Liberando reservas previas en {len(to_unreserve)} movimientos...")
+                with self.env.cr.savepoint():
+                    to_unreserve._do_unreserve()
             except Exception as e:
-                _logger.error(f"    [TC_ERROR] Error crítico asignando lote {move_line.lot_id.name}: {e}")
+                _logger.warning(f"    [!] Error al des-reservar: {e}")
+
+        # =========================================================
+        # PASO CRÍTICO: INYECCIÓN DE LA RESERVA (en bloque)
+        # =========================================================
+        # Líneas de reserva ya existentes para (movimiento, lote), en una sola búsqueda
+        existing_by_key = {}
+        existing_lines = self.env['stock.move.line'].search([
+            ('move_id', 'in', target_moves.ids),
+            ('lot_id', 'in', [ml.lot_id.id for ml, __, __, __ in assignments]),
+        ])
+        for existing in existing_lines:
+            existing_by_key.setdefault((existing.move_id.id, existing.lot_id.id), existing)
+
+        create_vals = {}
+        update_vals = {}
+        for move_line, delivery_picking, target_move, qty_just_moved in assignments:
+            key = (target_move.id, move_line.lot_id.id)
+            existing_reserved = existing_by_key.get(key)
+            if existing_reserved:
+                vals = update_vals.setdefault(existing_reserved, {
+                    'quantity': existing_reserved.quantity,
+                    'location_id': move_line.location_dest_id.id,
+                })
+                vals['quantity'] += qty_just_moved
+            elif key in create_vals:
+                create_vals[key]['quantity'] += qty_just_moved
+            else:
+                create_vals[key] = {
+                    'picking_id': delivery_picking.id,
+                    'move_id': target_move.id,
+                    'product_id': move_line.product_id.id,
+                    'lot_id': move_line.lot_id.id,
+                    'product_uom_id': move_line.product_uom_id.id,
+                    'location_id': move_line.location_dest_id.id, # CRUCIAL: Donde está ahora
+                    'location_dest_id': target_move.location_dest_id.id,
+                    'quantity': qty_just_moved,
+                }
+
+        count_success = 0
+        try:
+            with self.env.cr.savepoint():
+                for existing_reserved, vals in update_vals.items():
+                    existing_reserved.write(vals)
+                if create_vals:
+                    self.env['stock.move.line'].create(list(create_vals.values()))
+            count_success = len(update_vals) + len(create_vals)
+            _logger.info(f"    [OK] Reservas: {len(create_vals)} creadas, {len(update_vals)} actualizadas")
+        except Exception as e:
+            # Reintento lote a lote para aislar el fallo: un lote con error no deja
+            # sin reserva al resto de entregas
+            _logger.warning(f"    [TC_ERROR] Asignación en bloque fallida en {self.name}, reintentando por lote: {e}")
+            failed_moves = self.env['stock.move']
+            for existing_reserved, vals in update_vals.items():
+                try:
+                    with self.env.cr.savepoint():
+                        existing_reserved.write(vals)
+                    count_success += 1
+                except Exception as lot_error:
+                    failed_moves |= existing_reserved.move_id
+                    _logger.error(f"    [TC_ERROR] Lote {existing_reserved.lot_id.name}: {lot_error}")
+            for (move_id, lot_id), vals in create_vals.items():
+                try:
+                    with self.env.cr.savepoint():
+                        self.env['stock.move.line'].create(vals)
+                    count_success += 1
+                except Exception as lot_error:
+                    failed_moves |= self.env['stock.move'].browse(move_id)
+                    _logger.error(f"    [TC_ERROR] Lote {self.env['stock.lot'].browse(lot_id).name}: {lot_error}")
+
+            # Los movimientos cuyo lote no se pudo inyectar recuperan su reserva estándar
+            if failed_moves:
+                try:
+                    with self.env.cr.savepoint():
+                        failed_moves._action_assign()
+                except Exception as assign_error:
+                    _logger.error(f"    [TC_ERROR] No se pudo re-reservar {failed_moves.ids}: {assign_error}")
 
         _logger.info(f"[TC_DEBUG] Proceso finalizado. {count_success} lotes asignados exitosamente.")
 
     def _create_automatic_transit_voyage(self):
         self.ensure_one()
+        self._create_automatic_transit_voyages()
+
+    def _create_automatic_transit_voyages(self):
+        """
+        Crea o actualiza los viajes de un lote de entradas a tránsito:
+        un viaje por OC (búsqueda única), creación en un solo create y
+        carga combinada de las líneas de todos los pickings.
+        """
         Voyage = self.env['stock.transit.voyage']
-        
-        voyage = Voyage.search([
-            ('purchase_id', '=', self.purchase_id.id),
-            ('custom_status', '!=', 'cancel')
-        ], limit=1)
+        purchases = self.purchase_id
 
-        if voyage:
-            voyage.write({
-                'picking_id': self.id,
-                'container_number': self.transit_container_number or voyage.container_number,
-                'bl_number': self.transit_bl_number or voyage.bl_number,
-                'custom_status': 'on_sea'
-            })
-            voyage.action_load_from_picking()
-        else:
-            voyage = Voyage.create({
-                'picking_id': self.id,
-                'purchase_id': self.purchase_id.id,
-                'container_number': self.transit_container_number or 'TBD',
-                'bl_number': self.transit_bl_number or self.origin,
-                'etd': fields.Date.today(),
-                'custom_status': 'on_sea'
-            })
-            voyage.action_load_from_picking()
+        # Serializa validaciones concurrentes de la misma OC para no duplicar viajes
+        if purchases:
+            self.env.cr.execute(
+                "SELECT id FROM purchase_order WHERE id IN %s FOR NO KEY UPDATE",
+                (tuple(purchases.ids),)
+            )
+
+        voyage_by_purchase = {}
+        if purchases:
+            for voyage in Voyage.search([
+                ('purchase_id', 'in', purchases.ids),
+                ('custom_status', '!=', 'cancel')
+            ]):
+                voyage_by_purchase.setdefault(voyage.purchase_id.id, voyage)
+
+        # Sin OC cada picking tiene su propio viaje; con OC se agrupan
+        groups = [pick for pick in self if not pick.purchase_id]
+        groups += [pickings for purchase, pickings in self.grouped('purchase_id').items() if purchase]
+
+        pickings_by_voyage = {}
+        create_groups = []
+        for pickings in groups:
+            last_picking = pickings[-1]
+            containers = ', '.join(filter(None, pickings.mapped('transit_container_number')))
+            bl_number = next(iter(filter(None, pickings.mapped('transit_bl_number'))), False)
+            voyage = voyage_by_purchase.get(last_picking.purchase_id.id) if last_picking.purchase_id else False
+            if voyage:
+                voyage.write({
+                    'picking_id': last_picking.id,
+                    'container_number': containers or voyage.container_number,
+                    'bl_number': bl_number or voyage.bl_number,
+                    'custom_status': 'on_sea'
+                })
+                pickings_by_voyage[voyage] = pickings
+            else:
+                create_groups.append((pickings, {
+                    'picking_id': last_picking.id,
+                    'purchase_id': last_picking.purchase_id.id,
+                    'container_number': containers or 'TBD',
+                    'bl_number': bl_number or last_picking.origin,
+                    'etd': fields.Date.today(),
+                    'custom_status': 'on_sea'
+                }))
+
+        if create_groups:
+            new_voyages = Voyage.create([vals for __, vals in create_groups])
+            for voyage, (pickings, __) in zip(new_voyages, create_groups):
+                pickings_by_voyage[voyage] = pickings
+
+        Voyage._load_from_pickings(pickings_by_voyage)
 
     def action_view_transit_voyage(self):
         self.ensure_one()
@@ -2,6 +2,8 @@
 from odoo import models, fields, api, _
 from odoo.exceptions import ValidationError
 from odoo.tools import drop_view_if_exists
+from collections import defaultdict
+from datetime import timedelta
 import logging
 
 _logger = logging.getLogger(__name__)
@@ -10,14 +12,23 @@ class StockTransitLine(models.Model):
     _name = 'stock.transit.line'
     _description = 'Línea de Stock en Tránsito'
     _rec_name = 'lot_id'
+
+    # Planes de consulta que justifican estos índices: doc/index_plans.md
+    # Guardia de SaleOrder.unlink: líneas de un pedido con lote físico
+    _order_lot_idx = models.Index("(order_id, lot_id) WHERE lot_id IS NOT NULL")
+    # Filas vivas (no archivadas): búsquedas de stock libre y de asignaciones por pedido
+    _active_product_idx = models.Index("(product_id, allocation_status) WHERE active")
+    _active_order_idx = models.Index("(order_id, partner_id) WHERE active")
+    # Respaldo de eventos de naviera: contenedor de la línea sin distinguir mayúsculas
+    _container_upper_idx = models.Index("(upper(container_number)) WHERE container_number IS NOT NULL")
     
-    voyage_id = fields.Many2one('stock.transit.voyage', string='Viaje', required=True, ondelete='cascade')
+    voyage_id = fields.Many2one('stock.transit.voyage', string='Viaje', required=True, ondelete='cascade', index=True)
     company_id = fields.Many2one(related='voyage_id.company_id', store=True)
     product_id = fields.Many2one('product.product', string='Descripción / Producto', required=True)
     
-    lot_id = fields.Many2one('stock.lot', string='Lote / Placa', required=False)
+    lot_id = fields.Many2one('stock.lot', string='Lote / Placa', required=False, index='btree_not_null')
     container_number = fields.Char(string='Contenedor')
-    quant_id = fields.Many2one('stock.quant', string='Quant Físico')
+    quant_id = fields.Many2one('stock.quant', string='Quant Físico', index='btree_not_null')
 
     x_grosor = fields.Float(related='lot_id.x_grosor', string='Grosor', readonly=True)
     x_alto = fields.Float(related='lot_id.x_alto', string='Alto', readonly=True)
@@ -52,7 +63,7 @@ class StockTransitLine(models.Model):
         domain="[('id', 'in', eligible_order_ids)]"
     )
 
-    allocation_id = fields.Many2one('purchase.order.line.allocation', string='Asignación Origen')
+    allocation_id = fields.Many2one('purchase.order.line.allocation', string='Asignación Origen', index='btree_not_null')
 
     allocation_status = fields.Selection([
         ('available', 'Disponible (Stock)'),
@@ -74,14 +85,79 @@ class StockTransitLine(models.Model):
     qty_proforma = fields.Float(string='Metraje Proforma', compute='_compute_po_so_qty', store=True)
     qty_original_demand = fields.Float(string='Metraje Pedido Original', compute='_compute_po_so_qty', store=True)
 
-    voyage_status = fields.Selection(related='voyage_id.custom_status', string='Status', store=True)
-    shipping_line = fields.Char(related='voyage_id.shipping_line', string='Naviera', store=True)
-    bl_number = fields.Char(related='voyage_id.bl_number', string='Factura de Carga / BL', store=True)
-    etd = fields.Date(related='voyage_id.etd', string='ETD', store=True)
-    eta = fields.Date(related='voyage_id.eta', string='ETA', store=True)
-    arrival_date = fields.Date(related='voyage_id.arrival_date', string='Llegada Real', store=True)
+    # Copias desnormalizadas de la cabecera del viaje. No son 'related': se
+    # rellenan al crear la línea y StockTransitVoyage._propagate_header_to_lines
+    # las sincroniza con un único UPDATE cuando cambia el viaje.
+    voyage_status = fields.Selection(
+        selection=lambda self: self.env['stock.transit.voyage']._fields['custom_status'].selection,
+        string='Status', readonly=True)
+    shipping_line = fields.Char(string='Naviera', readonly=True)
+    bl_number = fields.Char(string='Factura de Carga / BL', readonly=True)
+    etd = fields.Date(string='ETD', readonly=True)
+    eta = fields.Date(string='ETA', readonly=True)
+    arrival_date = fields.Date(string='Llegada Real', readonly=True)
+    active = fields.Boolean(string='Activo', default=True, readonly=True,
+        help="Se archiva junto con su viaje")
+
+    # Resultado de la última validación de medidas (DimensionValidator)
+    dimension_area = fields.Float(string='m² Calculados (Alto × Ancho)', digits='Product Unit of Measure', readonly=True, copy=False)
+    dimension_diff = fields.Float(string='Diferencia m²', digits='Product Unit of Measure', readonly=True, copy=False)
+    dimension_flag = fields.Selection([
+        ('missing', 'Sin medidas'),
+        ('mismatch', 'Fuera de tolerancia'),
+        ('outlier', 'Atípica'),
+    ], string='Observación de Medidas', readonly=True, copy=False, index='btree_not_null')
     notes = fields.Text(string='Comentarios')
 
+    # Campo del viaje -> campo desnormalizado en la línea
+    _voyage_header_fields = {
+        'custom_status': 'voyage_status',
+        'shipping_line': 'shipping_line',
+        'bl_number': 'bl_number',
+        'etd': 'etd',
+        'eta': 'eta',
+        'arrival_date': 'arrival_date',
+        'active': 'active',
+    }
+
+    # Campos cuya escritura obliga a refrescar la sábana / reconstruir el ATP
+    _sheet_trigger_fields = frozenset({
+        'voyage_id', 'product_id', 'partner_id', 'order_id', 'container_number', 'product_uom_qty',
+        'allocation_id', 'voyage_status', 'shipping_line', 'bl_number', 'etd', 'eta', 'arrival_date', 'active',
+    })
+    _atp_trigger_fields = frozenset({
+        'voyage_id', 'product_id', 'partner_id', 'order_id', 'allocation_status', 'product_uom_qty',
+        'eta', 'voyage_status', 'active',
+    })
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        self._add_voyage_header_vals(vals_list)
+        lines = super(StockTransitLine, self).create(vals_list)
+        self.env['stock.transit.sheet']._schedule_refresh()
+        self.env['stock.transit.atp']._schedule_rebuild(lines.product_id.ids)
+        return lines
+
+    def unlink(self):
+        product_ids = self.product_id.ids
+        res = super(StockTransitLine, self).unlink()
+        self.env['stock.transit.sheet']._schedule_refresh()
+        self.env['stock.transit.atp']._schedule_rebuild(product_ids)
+        return res
+
+    @api.model
+    def _add_voyage_header_vals(self, vals_list):
+        """Copia la cabecera del viaje en los vals que no la traen explícitamente."""
+        voyage_ids = {vals['voyage_id'] for vals in vals_list if vals.get('voyage_id')}
+        voyages = self.env['stock.transit.voyage'].browse(voyage_ids)
+        for vals in vals_list:
+            if not vals.get('voyage_id'):
+                continue
+            voyage = voyages.browse(vals['voyage_id']).with_prefetch(voyages._prefetch_ids)
+            for voyage_field, line_field in self._voyage_header_fields.items():
+                if line_field not in vals:
+                    vals[line_field] = voyage._fields[voyage_field].convert_to_write(voyage[voyage_field], voyage)
+
     # =========================================================================
     # CÓMPUTOS PARA DOMINIOS DINÁMICOS
     # =========================================================================
@@ -173,92 +249,150 @@ class StockTransitLine(models.Model):
         """
         Override write para detectar cambios en partner_id/order_id
         y ejecutar la lógica de reserva automáticamente.
+        Los cambios se procesan por lotes (ver _process_assignment_changes).
         """
-        # Detectar si hay cambio de asignación
-        assignment_changed = 'partner_id' in vals or 'order_id' in vals
+        # Detectar si hay cambio de asignación (TransitManager gestiona sus propias
+        # reservas y desactiva esta lógica con 'transit_skip_assignment_logic')
+        assignment_changed = ('partner_id' in vals or 'order_id' in vals) \
+            and not self.env.context.get('transit_skip_assignment_logic')
         
         # Guardar estado previo para comparación
         old_assignments = {}
         if assignment_changed:
             for line in self:
-                old_assignments[line.id] = {
-                    'partner_id': line.partner_id.id if line.partner_id else False,
-                    'order_id': line.order_id.id if line.order_id else False,
-                }
+                old_assignments[line.id] = (line.partner_id.id, line.order_id.id)
         
+        if vals.get('voyage_id'):
+            vals = dict(vals)
+            self._add_voyage_header_vals([vals])
+
+        # Productos afectados en la línea de tiempo ATP (antes y después del cambio)
+        atp_product_ids = set()
+        if self._atp_trigger_fields.intersection(vals):
+            atp_product_ids.update(self.product_id.ids)
+            if vals.get('product_id'):
+                atp_product_ids.add(vals['product_id'])
+
         # Ejecutar write estándar
         res = super(StockTransitLine, self).write(vals)
         
-        # Procesar cambios de asignación
+        # Procesar cambios de asignación (solo las líneas que realmente cambiaron)
         if assignment_changed:
-            for line in self:
-                old = old_assignments.get(line.id, {})
-                new_partner = line.partner_id
-                new_order = line.order_id
-                
-                # Verificar si realmente cambió
-                if old.get('partner_id') != (new_partner.id if new_partner else False) or \
-                   old.get('order_id') != (new_order.id if new_order else False):
-                    
-                    # Actualizar estado de asignación
-                    new_status = 'reserved' if (new_partner and new_order) else 'available'
-                    if line.allocation_status != new_status:
-                        super(StockTransitLine, line).write({'allocation_status': new_status})
-                    
-                    # Ejecutar lógica de reserva/liberación
-                    if new_partner and new_order:
-                        line._execute_reservation_logic(new_partner, new_order)
-                    elif not new_partner:
-                        line._execute_release_logic()
-                    
-                    # Log en el viaje
-                    if line.voyage_id:
-                        if new_partner and new_order:
-                            msg = f"🔄 <b>Asignación:</b> {line.lot_id.name or line.product_id.name}<br/>"
-                            msg += f"→ {new_partner.name} / {new_order.name}"
-                        else:
-                            msg = f"🔓 <b>Liberado a Stock:</b> {line.lot_id.name or line.product_id.name}"
-                        line.voyage_id.message_post(body=msg)
-        
+            changed_lines = self.filtered(
+                lambda l: old_assignments.get(l.id) != (l.partner_id.id, l.order_id.id)
+            )
+            if changed_lines:
+                changed_lines._process_assignment_changes()
+
+        # Notas, medidas validadas, etc. no alteran la sábana ni el ATP
+        if self._sheet_trigger_fields.intersection(vals):
+            self.env['stock.transit.sheet']._schedule_refresh()
+        self.env['stock.transit.atp']._schedule_rebuild(atp_product_ids)
         return res
 
+    def _process_assignment_changes(self):
+        """
+        Camino por lotes para cambios de asignación:
+        1. Estado de asignación en un write por valor.
+        2. Liberación: una búsqueda de holds para todas las líneas liberadas.
+        3. Reserva: una orden de reserva por (cliente, orden).
+        4. Un solo mensaje de chatter por viaje.
+        """
+        assigned = self.filtered(lambda l: l.partner_id and l.order_id)
+        unassigned = self - assigned
+
+        # 1. Actualizar estado de asignación
+        to_reserve = assigned.filtered(lambda l: l.allocation_status != 'reserved')
+        if to_reserve:
+            super(StockTransitLine, to_reserve).write({'allocation_status': 'reserved'})
+        to_free = unassigned.filtered(lambda l: l.allocation_status != 'available')
+        if to_free:
+            super(StockTransitLine, to_free).write({'allocation_status': 'available'})
+
+        # 2. Liberación (sin cliente)
+        unassigned.filtered(lambda l: not l.partner_id)._execute_release_logic()
+
+        # 3. Reserva agrupada por destino
+        groups = defaultdict(lambda: self.browse())
+        for line in assigned:
+            groups[(line.partner_id, line.order_id)] |= line
+        for (partner, order), lines in groups.items():
+            lines._execute_reservation_logic(partner, order)
+
+        # 4. Log agregado en cada viaje
+        for voyage, lines in self.grouped('voyage_id').items():
+            if voyage:
+                voyage.message_post(body=lines._get_assignment_log_message())
+
+    def _get_assignment_log_message(self):
+        """Mensaje HTML con las asignaciones/liberaciones de este conjunto de líneas."""
+        by_target = defaultdict(list)
+        released = []
+        for line in self:
+            label = line.lot_id.name or line.product_id.name
+            if line.partner_id and line.order_id:
+                by_target[(line.partner_id.name, line.order_id.name)].append(label)
+            else:
+                released.append(label)
+
+        parts = []
+        for (partner_name, order_name), labels in by_target.items():
+            parts.append(f"🔄 <b>Asignación:</b> {', '.join(labels)}<br/>→ {partner_name} / {order_name}")
+        if released:
+            parts.append(f"🔓 <b>Liberado a Stock:</b> {', '.join(released)}")
+        return '<br/>'.join(parts)
+
+    def _get_active_holds_by_quant(self):
+        """Holds activos de los quants de estas líneas, en una sola búsqueda."""
+        holds_by_quant = defaultdict(lambda: self.env['stock.lot.hold'])
+        quants = self.mapped('quant_id')
+        if not quants:
+            return holds_by_quant
+        holds = self.env['stock.lot.hold'].search([
+            ('quant_id', 'in', quants.ids),
+            ('estado', '=', 'activo')
+        ])
+        for hold in holds:
+            holds_by_quant[hold.quant_id.id] |= hold
+        return holds_by_quant
+
     def _execute_reservation_logic(self, partner, order):
         """
         Ejecuta la lógica de reserva cuando se asigna a un cliente/orden.
-        Crea Hold Order si hay lote físico.
+        Crea una sola Hold Order para todas las líneas con lote físico.
+        Quants y holds se resuelven una sola vez y se reutilizan en la reserva.
         """
-        self.ensure_one()
-        
-        if not self.lot_id or not self.quant_id:
-            _logger.info(f"TransitLine {self.id}: Sin lote físico, solo asignación visual")
+        from .utils.transit_manager import TransitManager
+
+        physical_lines = self.filtered('lot_id')
+        if not physical_lines:
+            _logger.info(f"TransitLines {self.ids}: Sin lote físico, solo asignación visual")
             return
-        
-        # Verificar si ya existe hold activo para este quant
-        existing_hold = self.env['stock.lot.hold'].search([
-            ('quant_id', '=', self.quant_id.id),
-            ('estado', '=', 'activo')
-        ], limit=1)
-        
-        if existing_hold:
-            _logger.info(f"TransitLine {self.id}: Ya existe hold activo, verificando...")
-            # Si ya está reservado para el mismo cliente, no hacer nada
-            if existing_hold.order_id and existing_hold.order_id.partner_id == partner:
-                return
-            # Cancelar el hold anterior si es de otro cliente
-            try:
-                existing_hold.action_cancelar_hold()
-            except Exception as e:
-                _logger.warning(f"No se pudo cancelar hold existente: {e}")
-        
-        # Crear nuevo Hold Order usando TransitManager
+
+        quant_by_line, holds_by_quant = TransitManager.resolve_quants_and_holds(self.env, physical_lines)
+        to_reserve = self.browse()
+        for line in physical_lines:
+            quant = quant_by_line.get(line.id)
+            if not quant:
+                continue
+            # Holds de otro cliente se cancelan; si ya está reservado para este, no se duplica
+            own_holds, other_holds = TransitManager.split_holds_by_partner(holds_by_quant[quant.id], partner)
+            TransitManager.cancel_holds(other_holds)
+            if not own_holds:
+                to_reserve |= line
+
+        if not to_reserve:
+            return
+
+        # Crear una Hold Order para todo el grupo usando TransitManager
         try:
-            from .utils.transit_manager import TransitManager
-            TransitManager.reassign_lot(
+            TransitManager.reserve_lines(
                 self.env,
-                self,
+                to_reserve,
                 partner,
                 order,
-                notes="Asignación directa desde Torre de Control"
+                notes="Asignación directa desde Torre de Control",
+                quant_by_line=quant_by_line,
             )
         except Exception as e:
             _logger.error(f"Error creando reserva: {e}")
@@ -268,22 +402,14 @@ class StockTransitLine(models.Model):
         Ejecuta la lógica de liberación cuando se quita el cliente.
         Cancela Hold Orders existentes.
         """
-        self.ensure_one()
-        
-        if not self.quant_id:
-            return
-        
-        existing_holds = self.env['stock.lot.hold'].search([
-            ('quant_id', '=', self.quant_id.id),
-            ('estado', '=', 'activo')
-        ])
-        
-        for hold in existing_holds:
-            try:
-                hold.action_cancelar_hold()
-                _logger.info(f"TransitLine {self.id}: Hold cancelado")
-            except Exception as e:
-                _logger.error(f"Error cancelando hold: {e}")
+        holds_by_quant = self.filtered('quant_id')._get_active_holds_by_quant()
+        for holds in holds_by_quant.values():
+            for hold in holds:
+                try:
+                    hold.action_cancelar_hold()
+                    _logger.info(f"Hold {hold.id} cancelado (quant {hold.quant_id.id})")
+                except Exception as e:
+                    _logger.error(f"Error cancelando hold: {e}")
 
     # =========================================================================
     # MÉTODOS LEGACY (mantener compatibilidad)
@@ -291,16 +417,37 @@ class StockTransitLine(models.Model):
 
     @api.depends('purchase_id', 'order_id', 'product_id', 'allocation_id')
     def _compute_po_so_qty(self):
+        """
+        Cálculo por conjunto: las cantidades de OC y SO se obtienen con dos
+        consultas agrupadas por (orden, producto) para todo el lote de líneas.
+        """
+        without_alloc = self.filtered(lambda l: not l.allocation_id)
+        po_qty_map = self._get_order_product_qty_map(
+            'purchase.order.line', 'product_qty', without_alloc.mapped('purchase_id'), without_alloc)
+        so_qty_map = self._get_order_product_qty_map(
+            'sale.order.line', 'product_uom_qty', without_alloc.mapped('order_id'), without_alloc)
+
         for line in self:
-            po_qty = line.allocation_id.quantity if line.allocation_id else 0.0
-            so_qty = line.allocation_id.quantity if line.allocation_id else 0.0
-            if not line.allocation_id:
-                if line.purchase_id:
-                    po_qty = sum(line.purchase_id.order_line.filtered(lambda l: l.product_id == line.product_id).mapped('product_qty'))
-                if line.order_id:
-                    so_qty = sum(line.order_id.order_line.filtered(lambda l: l.product_id == line.product_id).mapped('product_uom_qty'))
-            line.qty_proforma = po_qty
-            line.qty_original_demand = so_qty
+            if line.allocation_id:
+                line.qty_proforma = line.allocation_id.quantity
+                line.qty_original_demand = line.allocation_id.quantity
+                continue
+            product_id = line.product_id._origin.id
+            line.qty_proforma = po_qty_map.get((line.purchase_id._origin.id, product_id), 0.0)
+            line.qty_original_demand = so_qty_map.get((line.order_id._origin.id, product_id), 0.0)
+
+    def _get_order_product_qty_map(self, line_model, qty_field, orders, lines):
+        """{(order_id, product_id): cantidad} sumada sobre las líneas de las órdenes dadas."""
+        order_ids = [oid for oid in orders._origin.ids if oid]
+        product_ids = [pid for pid in lines.mapped('product_id')._origin.ids if pid]
+        if not order_ids or not product_ids:
+            return {}
+        groups = self.env[line_model]._read_group(
+            [('order_id', 'in', order_ids), ('product_id', 'in', product_ids)],
+            ['order_id', 'product_id'],
+            [f'{qty_field}:sum'],
+        )
+        return {(order.id, product.id): qty for order, product, qty in groups}
 
     @api.constrains('partner_id', 'order_id')
     def _check_order_assignment(self):
@@ -346,10 +493,24 @@ class StockTransitSheet(models.Model):
     qty_original_demand = fields.Float(string='Metraje Pedido Original', readonly=True)
     salesperson_id = fields.Many2one('res.users', string='Vendedor', readonly=True)
 
+    active = fields.Boolean(string='Activo', readonly=True)
+    refreshed_at = fields.Datetime(string='Actualizado', readonly=True,
+        help="Momento del último refresco de la sábana materializada")
+
+    # Segundos de espera antes de refrescar tras un cambio (agrupa ráfagas de escrituras)
+    _refresh_debounce_param = 'stock_transit_allocation.sheet_refresh_debounce'
+
     def init(self):
-        drop_view_if_exists(self.env.cr, self._table)
+        # La sábana es una vista materializada: se elimina la versión previa
+        # (vista simple o materializada) antes de recrearla.
+        self.env.cr.execute("SELECT relkind FROM pg_class WHERE relname = %s", (self._table,))
+        row = self.env.cr.fetchone()
+        if row and row[0] == 'm':
+            self.env.cr.execute(f"DROP MATERIALIZED VIEW IF EXISTS {self._table} CASCADE")
+        else:
+            drop_view_if_exists(self.env.cr, self._table)
         self.env.cr.execute("""
-            CREATE OR REPLACE VIEW stock_transit_sheet AS (
+            CREATE MATERIALIZED VIEW stock_transit_sheet AS (
                 SELECT
                     MIN(l.id) as id,
                     l.voyage_id,
@@ -370,10 +531,57 @@ class StockTransitSheet(models.Model):
                     MAX(l.salesperson_id) as salesperson_id,
                     SUM(l.product_uom_qty) as product_uom_qty,
                     MAX(l.qty_proforma) as qty_proforma,
-                    MAX(l.qty_original_demand) as qty_original_demand
+                    MAX(l.qty_original_demand) as qty_original_demand,
+                    BOOL_OR(l.active) as active,
+                    (now() at time zone 'UTC') as refreshed_at
                 FROM
                     stock_transit_line l
                 GROUP BY
                     l.voyage_id, l.product_id, l.order_id, l.purchase_id, l.partner_id, l.container_number
             )
-        """)
\ No newline at end of file
+        """)
+        # Índice único requerido por REFRESH ... CONCURRENTLY + índices de filtrado
+        self.env.cr.execute("""
+            CREATE UNIQUE INDEX stock_transit_sheet_id_uniq ON stock_transit_sheet (id);
+            CREATE INDEX stock_transit_sheet_eta_idx ON stock_transit_sheet (eta) WHERE active;
+            CREATE INDEX stock_transit_sheet_voyage_id_idx ON stock_transit_sheet (voyage_id);
+            CREATE INDEX stock_transit_sheet_partner_id_idx ON stock_transit_sheet (partner_id);
+            CREATE INDEX stock_transit_sheet_order_id_idx ON stock_transit_sheet (order_id);
+        """)
+
+    @api.model
+    def _refresh_sheet(self):
+        """Refresca la sábana sin bloquear lecturas (REFRESH ... CONCURRENTLY)."""
+        self.env['stock.transit.line'].flush_model()
+        self.env['stock.transit.voyage'].flush_model()
+        self.env.cr.execute(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {self._table}")
+        self.invalidate_model()
+        _logger.info("Sábana de Seguimiento refrescada")
+
+    @api.model
+    def _cron_refresh_sheet(self):
+        self._refresh_sheet()
+
+    @api.model
+    def _schedule_refresh(self):
+        """
+        Programa un refresco diferido de la sábana tras cambios en viajes/líneas.
+        Solo se crea un disparador por transacción; el cron agrupa los pendientes.
+        """
+        precommit_data = self.env.cr.precommit.data
+        if precommit_data.get('stock_transit_sheet.refresh_scheduled'):
+            return
+        precommit_data['stock_transit_sheet.refresh_scheduled'] = True
+
+        cron = self.env.ref('stock_transit_allocation.ir_cron_refresh_transit_sheet', raise_if_not_found=False)
+        if not cron:
+            return
+        debounce = int(self.env['ir.config_parameter'].sudo().get_param(self._refresh_debounce_param, 60))
+        cron.sudo()._trigger(at=fields.Datetime.now() + timedelta(seconds=debounce))
+
+    def action_refresh_sheet(self):
+        self._refresh_sheet()
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'reload',
+        }
@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
 import logging
+from collections import defaultdict
+from datetime import timedelta
 from odoo import models, fields, api, _
 from odoo.exceptions import UserError
 
@@ -11,7 +13,22 @@ class StockTransitVoyage(models.Model):
     _inherit = ['mail.thread', 'mail.activity.mixin']
     _order = 'eta asc'
 
+    # Búsqueda del viaje activo de una OC (button_confirm / recepción a tránsito).
+    # El predicado incluye IS NULL: el ORM traduce '!=' a "(col != x OR col IS NULL)"
+    _purchase_open_idx = models.Index("(purchase_id, custom_status) WHERE custom_status IS NULL OR custom_status != 'cancel'")
+    # Tablero y búsquedas por defecto: solo viajes no archivados
+    _active_status_idx = models.Index("(custom_status, eta) WHERE active")
+    # Búsqueda de eventos de naviera: 'Contenedor(es)' puede traer varios números
+    # (separados por espacios, comas, ';' o '/'), sin distinguir mayúsculas
+    _container_tokens_idx = models.Index(
+        "USING gin (regexp_split_to_array(upper(container_number), '[[:space:],;/]+'))")
+    _bl_upper_idx = models.Index("(upper(bl_number))")
+
+    # Días tras la entrega/cancelación para archivar un viaje
+    _archive_days_param = 'stock_transit_allocation.archive_after_days'
+
     name = fields.Char(string='Referencia Viaje', required=True, copy=False, readonly=True, default=lambda self: _('Nuevo'))
+    active = fields.Boolean(string='Activo', default=True, tracking=True)
     
     custom_status = fields.Selection([
         ('solicitud', 'Solicitud Enviada'),
@@ -41,13 +58,14 @@ class StockTransitVoyage(models.Model):
         domain=[('picking_type_code', '=', 'incoming')], help="Recepción administrativa en ubicación de tránsito")
     
     reception_picking_id = fields.Many2one('stock.picking', string='Recepción Física (Bodega)',
-        domain=[('picking_type_code', '=', 'internal')], readonly=True,
+        domain=[('picking_type_code', '=', 'internal')], readonly=True, index='btree_not_null',
         help="Transferencia interna para ingreso físico y validación de medidas (Worksheet)")
 
     purchase_id = fields.Many2one('purchase.order', string='Orden de Compra Origen', readonly=True)
     
     company_id = fields.Many2one('res.company', string='Compañía', default=lambda self: self.env.company)
-    line_ids = fields.One2many('stock.transit.line', 'voyage_id', string='Contenido (Lotes)')
+    line_ids = fields.One2many('stock.transit.line', 'voyage_id', string='Contenido (Lotes)',
+        context={'active_test': False})
     
     total_m2 = fields.Float(string='Total m²', compute='_compute_totals', store=True)
     allocated_m2 = fields.Float(string='Asignado m²', compute='_compute_totals', store=True)
@@ -56,11 +74,98 @@ class StockTransitVoyage(models.Model):
 
     @api.model_create_multi
     def create(self, vals_list):
-        for vals in vals_list:
-            if vals.get('name', _('Nuevo')) == _('Nuevo'):
-                vals['name'] = self.env['ir.sequence'].next_by_code('stock.transit.voyage') or _('Nuevo')
+        to_name = [vals for vals in vals_list if vals.get('name', _('Nuevo')) == _('Nuevo')]
+        if to_name:
+            for vals, name in zip(to_name, self._reserve_sequence_names(len(to_name))):
+                vals['name'] = name
         return super(StockTransitVoyage, self).create(vals_list)
 
+    @api.model
+    def _reserve_sequence_names(self, count):
+        """
+        Reserva 'count' referencias de viaje de una sola vez. Con la secuencia
+        'standard' (secuencia de PostgreSQL) es un único nextval sobre
+        generate_series: no bloquea confirmaciones concurrentes.
+        """
+        sequence = self.env['ir.sequence'].sudo().search([
+            ('code', '=', 'stock.transit.voyage'),
+            ('company_id', 'in', [self.env.company.id, False])
+        ], order='company_id', limit=1)
+        if not sequence:
+            return [_('Nuevo')] * count
+        if sequence.implementation != 'standard' or sequence.use_date_range:
+            return [sequence.next_by_id() for __ in range(count)]
+        self.env.cr.execute(
+            "SELECT nextval(%s) FROM generate_series(1, %s)",
+            ('ir_sequence_%03d' % sequence.id, count)
+        )
+        return [sequence.get_next_char(row[0]) for row in self.env.cr.fetchall()]
+
+    def write(self, vals):
+        res = super(StockTransitVoyage, self).write(vals)
+        header_fields = [f for f in self.env['stock.transit.line']._voyage_header_fields if f in vals]
+        if header_fields:
+            self._propagate_header_to_lines(header_fields)
+            self.env['stock.transit.sheet']._schedule_refresh()
+        if 'eta' in vals or 'custom_status' in vals or 'purchase_id' in vals:
+            self.env['stock.transit.atp']._schedule_rebuild(self.line_ids.product_id.ids)
+        return res
+
+    @api.model
+    def _cron_archive_delivered(self):
+        """
+        Archiva (con sus líneas) los viajes entregados o cancelados hace más de N días
+        (parámetro 'stock_transit_allocation.archive_after_days', 180 por defecto).
+        Siguen accesibles con el filtro 'Archivados'.
+        """
+        days = int(self.env['ir.config_parameter'].sudo().get_param(self._archive_days_param, 180))
+        cutoff = fields.Date.today() - timedelta(days=days)
+        voyages = self.search([
+            '|',
+                '&', ('custom_status', '=', 'delivered'),
+                     '|', ('arrival_date', '<', cutoff),
+                          '&', ('arrival_date', '=', False), ('write_date', '<', cutoff),
+                '&', ('custom_status', '=', 'cancel'), ('write_date', '<', cutoff),
+        ])
+        if voyages:
+            voyages.write({'active': False})
+            _logger.info(f"Archivados {len(voyages)} viajes entregados/cancelados antes de {cutoff}")
+        return voyages
+
+    def _propagate_header_to_lines(self, header_fields):
+        """
+        Replica los campos de cabecera indicados en todas las líneas de estos
+        viajes con un solo UPDATE ... FROM, sin pasar por el ORM línea a línea.
+        Después se invalida la caché de las líneas para esos campos.
+        Medición frente a la escritura por línea: doc/header_propagation.md.
+        """
+        if not self.ids:
+            return
+        Line = self.env['stock.transit.line']
+        mapping = Line._voyage_header_fields
+        self.flush_recordset(header_fields)
+        Line.flush_model([mapping[f] for f in header_fields] + ['voyage_id'])
+
+        assignments = ', '.join(f'"{mapping[f]}" = v."{f}"' for f in header_fields)
+        self.env.cr.execute(f"""
+            UPDATE stock_transit_line l
+               SET {assignments},
+                   write_uid = %s,
+                   write_date = (now() at time zone 'UTC')
+              FROM stock_transit_voyage v
+             WHERE l.voyage_id = v.id
+               AND v.id IN %s
+         RETURNING l.id
+        """, (self.env.uid, tuple(self.ids)))
+        lines = Line.browse(row[0] for row in self.env.cr.fetchall())
+        _logger.info(f"Cabecera {header_fields} propagada a {len(lines)} líneas de {len(self)} viajes")
+
+        line_fields = [mapping[f] for f in header_fields]
+        Line.invalidate_model(line_fields + ['write_uid', 'write_date'])
+        # El UPDATE no pasa por el ORM: se notifican los campos para que se
+        # recalculen los computados (de este u otros módulos) que dependan de ellos
+        lines.modified(line_fields)
+
     @api.depends('line_ids.product_uom_qty', 'line_ids.allocation_status')
     def _compute_totals(self):
         for rec in self:
@@ -118,9 +223,16 @@ class StockTransitVoyage(models.Model):
             'arrival_date': fields.Date.today(),
             'custom_status': 'delivered'
         })
-        for line in self.line_ids:
-            if line.allocation_id and line.allocation_id.state != 'done':
-                line.allocation_id.action_mark_received(line.product_uom_qty)
+        self.env['purchase.order.line.allocation']._register_receipts([{
+            'allocation_id': line.allocation_id.id,
+            'event_type': 'reception',
+            'quantity': line.product_uom_qty,
+            'picking_id': self.reception_picking_id.id,
+            'voyage_id': self.id,
+        } for line in self.line_ids
+            # Saldo leído del libro: el estado 'done' puede no estar sincronizado aún
+            if line.allocation_id and line.allocation_id.qty_received < line.allocation_id.quantity
+            and line.product_uom_qty > 0])
 
     def action_cancel(self):
         self.write({'custom_status': 'cancel'})
@@ -167,6 +279,7 @@ class StockTransitVoyage(models.Model):
             'location_id': source_location.id,
             'location_dest_id': picking_type.default_location_dest_id.id,
             'origin': f"{self.name} (Recepción Física)",
+            'transit_reception_voyage_id': self.id,
             'company_id': self.company_id.id,
             'move_type': 'direct',
             'supplier_bl_number': self.bl_number if hasattr(self.env['stock.picking'], 'supplier_bl_number') else False,
@@ -220,17 +333,32 @@ class StockTransitVoyage(models.Model):
         self.ensure_one()
         if not self.purchase_id:
             return
+        self._load_from_purchases()
+
+    def _load_from_purchases(self, allocations=None):
+        """
+        Crea las líneas 'PENDIENTE' de varios viajes a partir de las allocations
+        de sus OCs con un solo create. 'allocations' permite reutilizar una
+        búsqueda ya hecha por el llamador.
+        """
+        voyages = self.filtered('purchase_id')
+        if not voyages:
+            return
         
-        existing_alloc_ids = self.line_ids.mapped('allocation_id.id')
-        allocations = self.env['purchase.order.line.allocation'].search([
-            ('purchase_order_id', '=', self.purchase_id.id),
-            ('id', 'not in', existing_alloc_ids)
-        ])
+        existing_alloc_ids = set(voyages.line_ids.allocation_id.ids)
+        if allocations is None:
+            allocations = self.env['purchase.order.line.allocation'].search([
+                ('purchase_order_id', 'in', voyages.purchase_id.ids),
+            ])
+        voyage_by_purchase = {voyage.purchase_id.id: voyage for voyage in voyages}
         
         transit_lines = []
         for alloc in allocations:
+            voyage = voyage_by_purchase.get(alloc.purchase_order_id.id)
+            if not voyage or alloc.id in existing_alloc_ids:
+                continue
             transit_lines.append({
-                'voyage_id': self.id,
+                'voyage_id': voyage.id,
                 'product_id': alloc.product_id.id,
                 'product_uom_qty': alloc.quantity,
                 'partner_id': alloc.partner_id.id,
@@ -246,42 +374,137 @@ class StockTransitVoyage(models.Model):
         self.ensure_one()
         if not self.picking_id:
             return
-        
-        placeholder_lines = self.line_ids.filtered(lambda l: not l.lot_id)
-        placeholder_lines.unlink()
+        self._load_from_pickings({self: self.picking_id})
 
-        transit_lines = []
+    def action_simulate_load_from_picking(self):
+        """Vista previa (sin escribir) de lo que haría 'Sincronizar Lotes (Picking)'."""
+        self.ensure_one()
+        if not self.picking_id:
+            raise UserError(_("El viaje no tiene un picking de entrada para simular la carga."))
+        plan = self._plan_load_from_pickings({self: self.picking_id})
+        diff = self._simulate_load_plan(plan)
         from .utils.transit_manager import TransitManager
-        containers_found = set()
-        
-        purchase = self.picking_id.purchase_id
-        allocations_map = {}
+        result = self.env['transit.simulation.result'].create({
+            'name': _("Simulación de carga - %s") % self.name,
+            'summary_html': TransitManager.render_simulation_html(diff),
+        })
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': 'transit.simulation.result',
+            'res_id': result.id,
+            'view_mode': 'form',
+            'target': 'new',
+        }
+
+    @api.model
+    def _simulate_load_plan(self, plan):
+        """Convierte un plan de carga en el diff estructurado de simulación."""
+        from .utils.transit_manager import TransitManager
+        diff = TransitManager.empty_simulation()
+        Lot = self.env['stock.lot']
+        Product = self.env['product.product']
+        Partner = self.env['res.partner']
+        Order = self.env['sale.order']
+
+        for vals in plan['line_vals']:
+            lot = Lot.browse(vals['lot_id'])
+            product = Product.browse(vals['product_id'])
+            if not vals['partner_id']:
+                diff['unmatched'].append({
+                    'lot': lot.name, 'product': product.display_name, 'reason': _("Sin asignación pendiente"),
+                })
+            elif not vals['quant_id']:
+                diff['unmatched'].append({
+                    'lot': lot.name, 'product': product.display_name, 'reason': _("Sin quant físico"),
+                })
+            else:
+                diff['hold_lines'].append({
+                    'lot': lot.name,
+                    'product': product.display_name,
+                    'partner': Partner.browse(vals['partner_id']).name,
+                    'order': Order.browse(vals['order_id']).name,
+                    'qty': vals['product_uom_qty'],
+                })
+
+        allocations = self.env['purchase.order.line.allocation'].browse(list(plan['allocation_consumed']))
+        for alloc in allocations:
+            diff['allocation_deltas'].append({
+                'allocation': alloc.display_name,
+                'qty_before': alloc.qty_received,
+                'qty_after': min(alloc.qty_received + plan['allocation_consumed'][alloc.id], alloc.quantity),
+                'state': 'in_transit',
+            })
+        return diff
+
+    @api.model
+    def _load_from_pickings(self, pickings_by_voyage):
+        """
+        Carga las líneas de varios viajes a partir de sus pickings de entrada
+        en una sola operación combinada: {viaje: pickings}.
+        """
+        plan = self._plan_load_from_pickings(pickings_by_voyage)
+        return self._apply_load_plan(plan)
+
+    @api.model
+    def _plan_load_from_pickings(self, pickings_by_voyage):
+        """
+        Calcula (sin escribir nada) las líneas de tránsito a crear, el consumo
+        de allocations y los contenedores detectados para cada viaje.
+        """
+        voyages = self.browse([voyage.id for voyage in pickings_by_voyage])
+        all_pickings = self.env['stock.picking'].union(*pickings_by_voyage.values())
+        purchases = all_pickings.purchase_id
+
+        # Allocations abiertas de todas las OCs, en una sola búsqueda
+        allocations_map = defaultdict(list)
+        allocation_by_sale_line = {}
         allocation_consumed = {}
-        
-        if purchase:
+        if purchases:
             allocations = self.env['purchase.order.line.allocation'].search([
-                ('purchase_order_id', '=', purchase.id),
+                ('purchase_order_id', 'in', purchases.ids),
                 ('state', 'not in', ['done', 'cancelled'])
             ], order='id asc')
             
             for alloc in allocations:
-                if alloc.product_id.id not in allocations_map:
-                    allocations_map[alloc.product_id.id] = []
-                allocations_map[alloc.product_id.id].append(alloc)
+                allocations_map[(alloc.purchase_order_id.id, alloc.product_id.id)].append(alloc)
+                allocation_by_sale_line.setdefault((alloc.purchase_order_id.id, alloc.sale_line_id.id), alloc)
                 allocation_consumed[alloc.id] = 0.0
 
-        for move_line in self.picking_id.move_line_ids:
-            if not move_line.lot_id:
-                continue
-            
-            partner_to_assign = False
-            order_to_assign = False
-            allocation_to_use = False
-            product_id = move_line.product_id.id
-            qty_done = move_line.quantity # ODOO 19 FIX: Use quantity
-            
-            if product_id in allocations_map:
-                for alloc in allocations_map[product_id]:
+        # Quants destino de todos los lotes recibidos, en una sola búsqueda
+        quant_map = {}
+        lot_move_lines = all_pickings.move_line_ids.filtered('lot_id')
+        if lot_move_lines:
+            for quant in self.env['stock.quant'].search([
+                ('lot_id', 'in', lot_move_lines.lot_id.ids),
+                ('product_id', 'in', lot_move_lines.product_id.ids),
+                ('quantity', '>', 0),
+                ('location_id', 'in', lot_move_lines.location_dest_id.ids)
+            ]):
+                quant_map.setdefault((quant.lot_id.id, quant.product_id.id, quant.location_id.id), quant)
+
+        transit_lines = []
+        containers_found = defaultdict(set)
+        receipt_events = defaultdict(float)
+
+        for voyage, pickings in pickings_by_voyage.items():
+            for move_line in pickings.move_line_ids:
+                if not move_line.lot_id:
+                    continue
+                
+                partner_to_assign = False
+                order_to_assign = False
+                allocation_to_use = False
+                purchase_id = move_line.picking_id.purchase_id.id
+                product_id = move_line.product_id.id
+                qty_done = move_line.quantity # ODOO 19 FIX: Use quantity
+                
+                # Movimiento dividido por allocation: enlace directo vía sale_line_id
+                candidates = allocations_map.get((purchase_id, product_id), [])
+                direct_alloc = allocation_by_sale_line.get((purchase_id, move_line.move_id.sale_line_id.id))
+                if direct_alloc:
+                    candidates = [direct_alloc] + [a for a in candidates if a != direct_alloc]
+
+                for alloc in candidates:
                     already_received = alloc.qty_received
                     consumed_this_load = allocation_consumed.get(alloc.id, 0.0)
                     total_consumed = already_received + consumed_this_load
@@ -301,51 +524,61 @@ class StockTransitVoyage(models.Model):
                                 continue
                         
                         allocation_consumed[alloc.id] = consumed_this_load + qty_done
+                        receipt_events[(alloc.id, voyage.id, move_line.picking_id.id)] += qty_done
                         break
 
-            found_quant = self.env['stock.quant'].search([
-                ('lot_id', '=', move_line.lot_id.id), 
-                ('product_id', '=', move_line.product_id.id),
-                ('quantity', '>', 0),
-                ('location_id', '=', move_line.location_dest_id.id)
-            ], limit=1)
-
-            if move_line.lot_id.ref:
-                containers_found.add(move_line.lot_id.ref)
-
-            line_vals = {
-                'voyage_id': self.id,
-                'product_id': move_line.product_id.id,
-                'lot_id': move_line.lot_id.id,
-                'quant_id': found_quant.id if found_quant else False,
-                'product_uom_qty': qty_done,
-                'partner_id': partner_to_assign.id if partner_to_assign else False,
-                'order_id': order_to_assign.id if order_to_assign else False,
-                'allocation_status': 'reserved' if partner_to_assign else 'available',
-                'container_number': move_line.lot_id.ref,
-                'allocation_id': allocation_to_use.id if allocation_to_use else False,
-            }
-            transit_lines.append(line_vals)
-        
-        created_lines = self.env['stock.transit.line'].create(transit_lines)
+                found_quant = quant_map.get(
+                    (move_line.lot_id.id, move_line.product_id.id, move_line.location_dest_id.id))
+
+                if move_line.lot_id.ref:
+                    containers_found[voyage.id].add(move_line.lot_id.ref)
+
+                transit_lines.append({
+                    'voyage_id': voyage.id,
+                    'product_id': move_line.product_id.id,
+                    'lot_id': move_line.lot_id.id,
+                    'quant_id': found_quant.id if found_quant else False,
+                    'product_uom_qty': qty_done,
+                    'partner_id': partner_to_assign.id if partner_to_assign else False,
+                    'order_id': order_to_assign.id if order_to_assign else False,
+                    'allocation_status': 'reserved' if partner_to_assign else 'available',
+                    'container_number': move_line.lot_id.ref,
+                    'allocation_id': allocation_to_use.id if allocation_to_use else False,
+                })
+
+        return {
+            'voyages': voyages,
+            'placeholder_lines': voyages.line_ids.filtered(lambda l: not l.lot_id),
+            'line_vals': transit_lines,
+            'containers': containers_found,
+            'allocation_consumed': {k: v for k, v in allocation_consumed.items() if v > 0},
+            'receipt_events': receipt_events,
+        }
+
+    @api.model
+    def _apply_load_plan(self, plan):
+        """Escribe un plan de carga: líneas, contenedores, allocations y reservas."""
+        from .utils.transit_manager import TransitManager
+
+        plan['placeholder_lines'].unlink()
+        created_lines = self.env['stock.transit.line'].create(plan['line_vals'])
         
-        if containers_found:
-            new_conts = ', '.join(list(containers_found))
-            self.write({'container_number': new_conts[:50]})
+        for voyage_id, containers in plan['containers'].items():
+            new_conts = ', '.join(list(containers))
+            self.browse(voyage_id).write({'container_number': new_conts[:50]})
 
-        for alloc_id, qty_consumed in allocation_consumed.items():
-            if qty_consumed > 0:
-                alloc = self.env['purchase.order.line.allocation'].browse(alloc_id)
-                new_received = alloc.qty_received + qty_consumed
-                alloc.write({'qty_received': min(new_received, alloc.quantity), 'state': 'in_transit'})
+        self.env['purchase.order.line.allocation']._register_receipts([{
+            'allocation_id': alloc_id,
+            'event_type': 'transit',
+            'quantity': qty,
+            'voyage_id': voyage_id,
+            'picking_id': picking_id,
+        } for (alloc_id, voyage_id, picking_id), qty in plan['receipt_events'].items() if qty > 0])
 
-        lines_by_order = {}
+        lines_by_order = defaultdict(lambda: self.env['stock.transit.line'])
         for line in created_lines:
             if line.partner_id and line.order_id:
-                key = (line.partner_id, line.order_id)
-                if key not in lines_by_order:
-                    lines_by_order[key] = []
-                lines_by_order[key].append(line)
+                lines_by_order[(line.partner_id, line.order_id)] |= line
         
         for (partner, order), lines in lines_by_order.items():
             hold_order = self.env['stock.lot.hold.order'].create({
@@ -355,9 +588,9 @@ class StockTransitVoyage(models.Model):
                 'fecha_orden': fields.Datetime.now(),
                 'notas': f"Asignación Automática - Pedido {order.name} (Desde Tránsito)",
             })
-            for line in lines:
-                TransitManager.reassign_lot(self.env, line, partner, order, notes=False, hold_order_obj=hold_order)
+            TransitManager.reserve_lines(self.env, lines, partner, order, hold_order_obj=hold_order)
             if hold_order.hold_line_ids:
                 hold_order.action_confirm()
             else:
-                hold_order.unlink()
\ No newline at end of file
+                hold_order.unlink()
+        return created_lines
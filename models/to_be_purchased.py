@@ -14,7 +14,17 @@ class ToBePurchasedLogic(models.AbstractModel):
             ('display_type', '=', False)
         ])
         
-        sale_lines = all_sale_lines.filtered(lambda l: l.qty_delivered < l.product_uom_qty)
+        # m² ya cubiertos por stock en tránsito emparejado automáticamente. Se descuentan
+        # de la demanda y, para no contarlos dos veces, también de la existencia
+        # (A / I / P) donde está hoy la placa emparejada.
+        matched = defaultdict(float)
+        matched_supply = defaultdict(lambda: defaultdict(float))
+        for match in self.env['stock.transit.auto.match']._get_pending_matches(all_sale_lines.ids):
+            matched[match.sale_line_id.id] += match.qty
+            for bucket in self._get_supply_buckets(match.line_id):
+                matched_supply[match.product_id.id][bucket] += match.qty
+        sale_lines = all_sale_lines.filtered(
+            lambda l: l.qty_delivered + matched.get(l.id, 0.0) < l.product_uom_qty)
         
         product_ids = sale_lines.mapped('product_id.id')
         products = self.env['product.product'].browse(product_ids)
@@ -25,9 +35,7 @@ class ToBePurchasedLogic(models.AbstractModel):
             
             qty_a = sum(quants.filtered(lambda q: q.location_id.usage == 'internal').mapped('quantity'))
             
-            qty_i = sum(quants.filtered(lambda q: q.location_id.usage == 'transit' or 
-                                               'transit' in q.location_id.name.lower() or 
-                                               'tránsito' in q.location_id.name.lower()).mapped('quantity'))
+            qty_i = sum(quants.filtered(lambda q: self._is_transit_location(q.location_id)).mapped('quantity'))
             
             all_po_lines = self.env['purchase.order.line'].search([
                 ('product_id', '=', product.id),
@@ -36,12 +44,17 @@ class ToBePurchasedLogic(models.AbstractModel):
             po_lines_open = all_po_lines.filtered(lambda pol: pol.product_qty > pol.qty_received)
             qty_p = sum(po_lines_open.mapped('product_qty')) - sum(po_lines_open.mapped('qty_received'))
 
+            reserved_by_match = matched_supply[product.id]
+            qty_a = max(0, qty_a - reserved_by_match['qty_a'])
+            qty_i = max(0, qty_i - reserved_by_match['qty_i'])
+            qty_p = max(0, qty_p - reserved_by_match['qty_p'])
+
             product_sale_lines = sale_lines.filtered(lambda l: l.product_id.id == product.id)
             so_details = []
             total_demanded = 0
             
             for sol in product_sale_lines:
-                pending = sol.product_uom_qty - sol.qty_delivered
+                pending = sol.product_uom_qty - sol.qty_delivered - matched.get(sol.id, 0.0)
                 total_demanded += pending
                 
                 allocation = self.env['purchase.order.line.allocation'].search([
@@ -75,6 +88,7 @@ class ToBePurchasedLogic(models.AbstractModel):
                     'qty_orig': sol.product_uom_qty,
                     'qty_assigned': sol.qty_delivered,
                     'qty_pending': pending,
+                    'qty_transit_matched': matched.get(sol.id, 0.0),
                     'note': sol.order_id.note or '',
                     'po_name': po_name,
                     'po_qty': po_qty,
@@ -110,6 +124,25 @@ class ToBePurchasedLogic(models.AbstractModel):
             })
         return result
 
+    @api.model
+    def _is_transit_location(self, location):
+        return location.usage == 'transit' or 'transit' in location.name.lower() \
+            or 'tránsito' in location.name.lower()
+
+    @api.model
+    def _get_supply_buckets(self, line):
+        """Columnas de existencia (A / I / P) en las que hoy cuentan los m² de una línea en tránsito."""
+        quant = line.quant_id
+        if not quant:
+            # Sin recepción física todavía: la placa es parte de lo pendiente de la OC
+            return ['qty_p']
+        buckets = []
+        if quant.location_id.usage == 'internal':
+            buckets.append('qty_a')
+        if self._is_transit_location(quant.location_id):
+            buckets.append('qty_i')
+        return buckets
+
     @api.model
     def get_open_purchase_orders(self, vendor_id):
         if not vendor_id:
@@ -169,9 +202,10 @@ class ToBePurchasedLogic(models.AbstractModel):
             })
         
         # CONSOLIDACIÓN POR PRODUCTO
+        matched = self.env['stock.transit.auto.match']._get_matched_qty_by_sale_line(sale_lines.ids)
         lines_by_product = defaultdict(list)
         for line in sale_lines:
-            qty_pending = line.product_uom_qty - line.qty_delivered
+            qty_pending = line.product_uom_qty - line.qty_delivered - matched.get(line.id, 0.0)
             if qty_pending > 0:
                 lines_by_product[line.product_id.id].append({
                     'sale_line': line,
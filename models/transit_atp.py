@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+from odoo import models, fields, api, _
+from collections import defaultdict
+import bisect
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+class StockTransitAtp(models.Model):
+    """
+    Línea de tiempo de disponible para prometer (ATP) por producto.
+
+    Una fila por (producto, fecha) con la oferta libre que entra ese día y el
+    acumulado hasta esa fecha. Fuentes:
+      - Existencias: quants internos no reservados (fecha = hoy).
+      - Tránsito: líneas sin asignar de viajes abiertos (fecha = ETA).
+      - Compras: pendiente de recibir de OCs abiertas, menos lo asignado a
+        ventas y lo ya cargado en sus viajes (fecha = fecha prevista).
+    Solo se reconstruyen los productos afectados por cada cambio, y siempre
+    desde el cron: las transacciones de usuario solo encolan el producto.
+    """
+    _name = 'stock.transit.atp'
+    _description = 'Disponible para Prometer (Tránsito)'
+    _order = 'product_id, date'
+    _log_access = False
+
+    _product_date_uniq = models.Constraint(
+        'UNIQUE(product_id, date)',
+        "Solo puede existir un registro ATP por producto y fecha.",
+    )
+
+    product_id = fields.Many2one('product.product', string='Producto', required=True, ondelete='cascade', readonly=True)
+    date = fields.Date(string='Fecha', required=True, readonly=True)
+    qty_onhand = fields.Float(string='Existencias', digits='Product Unit of Measure', readonly=True)
+    qty_transit = fields.Float(string='Tránsito', digits='Product Unit of Measure', readonly=True)
+    qty_purchase = fields.Float(string='Compras', digits='Product Unit of Measure', readonly=True)
+    qty = fields.Float(string='Entrada', digits='Product Unit of Measure', readonly=True)
+    cumulative_qty = fields.Float(string='Acumulado', digits='Product Unit of Measure', readonly=True)
+
+    _last_run_param = 'stock_transit_allocation.atp_last_run'
+    # Incluir solicitudes de presupuesto (borrador/enviadas) como oferta de compra
+    _include_rfq_param = 'stock_transit_allocation.atp_include_rfq'
+
+    # -------------------------------------------------------------------------
+    # CONSTRUCCIÓN
+    # -------------------------------------------------------------------------
+
+    @api.model
+    def _rebuild(self, product_ids=None):
+        """Reconstruye la línea de tiempo de los productos indicados (todos si None)."""
+        cr = self.env.cr
+        if product_ids is not None:
+            product_ids = list(product_ids)
+            if not product_ids:
+                return
+        for model in ('stock.quant', 'stock.transit.line', 'stock.transit.voyage',
+                      'purchase.order.line', 'purchase.order.line.allocation'):
+            self.env[model].flush_model()
+
+        product_filter = "" if product_ids is None else "AND {alias}.product_id = ANY(%(product_ids)s)"
+        include_rfq = self.env['ir.config_parameter'].sudo().get_param(self._include_rfq_param)
+        params = {
+            'product_ids': product_ids,
+            'po_states': ['draft', 'sent', 'purchase'] if include_rfq else ['purchase'],
+        }
+        # Reconstrucciones serializadas (cron / acción manual). Si otra terminó después de
+        # nuestro snapshot, el upsert falla por serialización y la ejecución se reintenta.
+        cr.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (self._table,))
+        if product_ids is None:
+            cr.execute(f"DELETE FROM {self._table}")
+        else:
+            cr.execute(f"DELETE FROM {self._table} WHERE product_id = ANY(%(product_ids)s)", params)
+
+        cr.execute(f"""
+            WITH po_open AS (
+                SELECT pol.id, pol.order_id, pol.product_id,
+                       GREATEST(COALESCE(pol.date_planned::date, CURRENT_DATE), CURRENT_DATE) AS date,
+                       GREATEST(pol.product_qty - pol.qty_received - COALESCE(alloc.quantity, 0.0), 0.0) AS qty
+                  FROM purchase_order_line pol
+                  JOIN purchase_order po ON po.id = pol.order_id
+                  LEFT JOIN (
+                        SELECT purchase_line_id, SUM(quantity) AS quantity
+                          FROM purchase_order_line_allocation
+                         WHERE state NOT IN ('done', 'cancelled')
+                         GROUP BY purchase_line_id
+                  ) alloc ON alloc.purchase_line_id = pol.id
+                 WHERE po.state = ANY(%(po_states)s)
+                   AND pol.product_qty > pol.qty_received
+                   {product_filter.format(alias='pol')}
+            ),
+            -- m² de la OC ya cargados en un viaje abierto sin recepción física ni
+            -- allocation (lo asignado ya se descontó arriba): cuentan como tránsito
+            on_voyage AS (
+                SELECT tl.purchase_id AS order_id, tl.product_id, SUM(tl.product_uom_qty) AS qty
+                  FROM stock_transit_line tl
+                  JOIN stock_transit_voyage v ON v.id = tl.voyage_id
+                 WHERE tl.purchase_id IS NOT NULL
+                   AND tl.allocation_id IS NULL
+                   AND tl.quant_id IS NULL
+                   AND v.custom_status NOT IN ('delivered', 'cancel')
+                   {product_filter.format(alias='tl')}
+                 GROUP BY 1, 2
+            ),
+            -- Lo ya embarcado consume primero las líneas de OC con fecha prevista más próxima
+            po_remaining AS (
+                SELECT p.product_id, p.date,
+                       GREATEST(p.qty - GREATEST(COALESCE(ov.qty, 0.0) - (SUM(p.qty) OVER w - p.qty), 0.0), 0.0) AS qty
+                  FROM po_open p
+                  LEFT JOIN on_voyage ov ON ov.order_id = p.order_id AND ov.product_id = p.product_id
+                WINDOW w AS (PARTITION BY p.order_id, p.product_id ORDER BY p.date, p.id)
+            ),
+            supply AS (
+                SELECT q.product_id, CURRENT_DATE AS date,
+                       SUM(q.quantity - q.reserved_quantity) AS qty_onhand,
+                       0.0 AS qty_transit, 0.0 AS qty_purchase
+                  FROM stock_quant q
+                  JOIN stock_location loc ON loc.id = q.location_id
+                 WHERE loc.usage = 'internal' {product_filter.format(alias='q')}
+                 GROUP BY q.product_id
+                UNION ALL
+                SELECT tl.product_id, GREATEST(COALESCE(tl.eta, CURRENT_DATE), CURRENT_DATE),
+                       0.0, SUM(tl.product_uom_qty), 0.0
+                  FROM stock_transit_line tl
+                  JOIN stock_transit_voyage v ON v.id = tl.voyage_id
+                 WHERE tl.allocation_status = 'available'
+                   AND tl.partner_id IS NULL
+                   AND v.custom_status NOT IN ('delivered', 'cancel')
+                   {product_filter.format(alias='tl')}
+                 GROUP BY 1, 2
+                UNION ALL
+                SELECT product_id, date, 0.0, 0.0, SUM(qty)
+                  FROM po_remaining
+                 GROUP BY 1, 2
+            )
+            INSERT INTO {self._table} (product_id, date, qty_onhand, qty_transit, qty_purchase, qty, cumulative_qty)
+            SELECT product_id, date,
+                   SUM(qty_onhand), SUM(qty_transit), SUM(qty_purchase),
+                   SUM(qty_onhand + qty_transit + qty_purchase),
+                   SUM(SUM(qty_onhand + qty_transit + qty_purchase)) OVER (PARTITION BY product_id ORDER BY date)
+              FROM supply
+             WHERE product_id IS NOT NULL
+             GROUP BY product_id, date
+            ON CONFLICT (product_id, date) DO UPDATE
+               SET qty_onhand = EXCLUDED.qty_onhand,
+                   qty_transit = EXCLUDED.qty_transit,
+                   qty_purchase = EXCLUDED.qty_purchase,
+                   qty = EXCLUDED.qty,
+                   cumulative_qty = EXCLUDED.cumulative_qty
+        """, params)
+        self.invalidate_model()
+
+    @api.model
+    def _schedule_rebuild(self, product_ids):
+        """
+        Encola productos para que el cron reconstruya su línea de tiempo. La
+        transacción de usuario solo hace un INSERT en la cola al confirmar (sin
+        tocar las filas ATP) y adelanta una ejecución del cron.
+        """
+        product_ids = {pid for pid in product_ids if pid}
+        if not product_ids:
+            return
+        precommit = self.env.cr.precommit
+        pending = precommit.data.get('stock_transit_atp.products')
+        if pending is None:
+            pending = precommit.data['stock_transit_atp.products'] = set()
+
+            def _enqueue_pending():
+                self.env['stock.transit.atp.queue']._enqueue(precommit.data.pop('stock_transit_atp.products', set()))
+            precommit.add(_enqueue_pending)
+            cron = self.env.ref('stock_transit_allocation.ir_cron_refresh_transit_atp', raise_if_not_found=False)
+            if cron:
+                cron.sudo()._trigger()
+        pending.update(product_ids)
+
+    @api.model
+    def _cron_refresh_atp(self):
+        """
+        Reconstruye los productos encolados por viajes/líneas y los modificados
+        fuera del módulo (quants, compras, asignaciones) desde la última ejecución.
+        """
+        ICP = self.env['ir.config_parameter'].sudo()
+        last_run = ICP.get_param(self._last_run_param)
+        started_at = fields.Datetime.now()
+        queued = self.env['stock.transit.atp.queue']._pop()
+        # Sin ejecución previa, o una vez al día para consolidar las fechas pasadas en 'hoy'
+        if not last_run or fields.Date.to_date(last_run) < fields.Date.today():
+            self._rebuild()
+        else:
+            since = fields.Datetime.to_datetime(last_run)
+            product_ids = set(queued)
+            for model in ('stock.quant', 'purchase.order.line', 'purchase.order.line.allocation'):
+                groups = self.env[model].sudo()._read_group([('write_date', '>', since)], ['product_id'])
+                product_ids.update(product.id for product, in groups)
+            self._rebuild(product_ids)
+        ICP.set_param(self._last_run_param, fields.Datetime.to_string(started_at))
+
+    # -------------------------------------------------------------------------
+    # CONSULTAS
+    # -------------------------------------------------------------------------
+
+    @api.model
+    def _get_timelines(self, product_ids):
+        """{product_id: ([fechas], [acumulados])} ordenado por fecha."""
+        timelines = defaultdict(lambda: ([], []))
+        if not product_ids:
+            return timelines
+        self.env.cr.execute(f"""
+            SELECT product_id, date, cumulative_qty
+              FROM {self._table}
+             WHERE product_id = ANY(%s)
+             ORDER BY product_id, date
+        """, (list(product_ids),))
+        for product_id, date, cumulative in self.env.cr.fetchall():
+            dates, cumulatives = timelines[product_id]
+            dates.append(date)
+            cumulatives.append(cumulative)
+        return timelines
+
+    @api.model
+    def get_available_qty(self, product_id, date=False):
+        """Cantidad libre acumulada disponible a una fecha (hoy por defecto)."""
+        date = fields.Date.to_date(date) or fields.Date.today()
+        dates, cumulatives = self._get_timelines([product_id])[product_id]
+        index = bisect.bisect_right(dates, date)
+        return cumulatives[index - 1] if index else 0.0
+
+    @api.model
+    def get_promise_date(self, product_id, qty):
+        """Primera fecha en que el acumulado cubre 'qty'; False si no se alcanza."""
+        dates, cumulatives = self._get_timelines([product_id])[product_id]
+        return self._find_promise_date(dates, cumulatives, qty)
+
+    @api.model
+    def _find_promise_date(self, dates, cumulatives, qty):
+        today = fields.Date.today()
+        if qty <= 0:
+            return today
+        for date, cumulative in zip(dates, cumulatives):
+            if cumulative >= qty:
+                return max(date, today)
+        return False
+
+    @api.model
+    def get_timeline(self, product_ids):
+        """Línea de tiempo por producto para el cliente web."""
+        timelines = self._get_timelines(product_ids)
+        return {
+            product_id: [{'date': fields.Date.to_string(date), 'cumulative_qty': cumulative}
+                         for date, cumulative in zip(dates, cumulatives)]
+            for product_id, (dates, cumulatives) in timelines.items()
+        }
+
+
+class StockTransitAtpQueue(models.Model):
+    """
+    Cola de productos pendientes de reconstruir en la línea de tiempo ATP.
+    Solo INSERT desde las transacciones de usuario; el cron la vacía.
+    """
+    _name = 'stock.transit.atp.queue'
+    _description = 'Cola de Reconstrucción ATP'
+    _log_access = False
+
+    product_id = fields.Many2one('product.product', string='Producto', required=True, ondelete='cascade')
+
+    @api.model
+    def _enqueue(self, product_ids):
+        if not product_ids:
+            return
+        self.env.cr.execute(
+            f"INSERT INTO {self._table} (product_id) SELECT unnest(%s::int[])",
+            (sorted(product_ids),))
+
+    @api.model
+    def _pop(self):
+        """Vacía la cola y devuelve los ids de producto (sin duplicados)."""
+        self.env.cr.execute(f"DELETE FROM {self._table} RETURNING product_id")
+        return {row[0] for row in self.env.cr.fetchall()}
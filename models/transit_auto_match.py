@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+from odoo import models, fields, api, _
+from collections import defaultdict
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+class StockTransitAutoMatch(models.Model):
+    """
+    Registro de emparejamientos automáticos entre stock libre en tránsito y
+    demanda 'Mandar Pedir'. El cron solo revisa los productos con cambios
+    desde su última ejecución y crea las reservas en bloque.
+    """
+    _name = 'stock.transit.auto.match'
+    _description = 'Emparejamiento Automático de Tránsito'
+    _order = 'create_date desc, id desc'
+
+    line_id = fields.Many2one('stock.transit.line', string='Línea / Placa', required=True, ondelete='cascade', index=True)
+    sale_line_id = fields.Many2one('sale.order.line', string='Línea de Venta', required=True, ondelete='cascade', index=True)
+    order_id = fields.Many2one(related='sale_line_id.order_id', store=True, string='Orden de Venta')
+    partner_id = fields.Many2one(related='sale_line_id.order_id.partner_id', store=True, string='Cliente')
+    product_id = fields.Many2one(related='line_id.product_id', store=True, string='Producto')
+    voyage_id = fields.Many2one(related='line_id.voyage_id', store=True, string='Viaje')
+    lot_id = fields.Many2one(related='line_id.lot_id', string='Lote')
+    eta = fields.Date(related='line_id.eta', string='ETA')
+    qty = fields.Float(string='m²', digits='Product Unit of Measure')
+    active_match = fields.Boolean(string='Vigente', compute='_compute_active_match',
+        help="La línea de tránsito sigue reservada para el pedido emparejado")
+
+    _last_run_param = 'stock_transit_allocation.auto_match_last_run'
+
+    @api.depends('line_id.order_id', 'line_id.voyage_id.custom_status', 'order_id', 'sale_line_id.qty_delivered')
+    def _compute_active_match(self):
+        pending = self._filter_pending()
+        for match in self:
+            match.active_match = match in pending
+
+    def _filter_pending(self):
+        """
+        Emparejamientos que aún cubren demanda pendiente: la línea sigue reservada al
+        pedido, su viaje no se canceló y su lote todavía no se entregó al cliente.
+        Cada m² cuenta desde una sola fuente: mientras el emparejamiento está
+        vigente descuenta la demanda; cuando el lote se entrega pasa a contar solo
+        en qty_delivered. Llegar a almacén (viaje 'delivered') no cambia nada: la
+        placa sigue reservada al pedido y no se debe volver a comprar ni emparejar.
+        """
+        reserved = self.filtered(lambda m: m.line_id.order_id == m.order_id
+                                 and m.line_id.voyage_id.custom_status != 'cancel')
+        lots = reserved.line_id.lot_id
+        if not lots:
+            return reserved
+        delivered_moves = self.env['stock.move.line'].sudo().search([
+            ('move_id.sale_line_id', 'in', reserved.sale_line_id.ids),
+            ('lot_id', 'in', lots.ids),
+            ('state', '=', 'done'),
+            ('location_dest_id.usage', '=', 'customer'),
+        ])
+        delivered = {(ml.move_id.sale_line_id.id, ml.lot_id.id) for ml in delivered_moves}
+        return reserved.filtered(lambda m: (m.sale_line_id.id, m.line_id.lot_id.id) not in delivered)
+
+    @api.model
+    def _get_pending_matches(self, sale_line_ids):
+        """Emparejamientos vigentes de las líneas de venta dadas (ver _filter_pending)."""
+        if not sale_line_ids:
+            return self
+        return self.search([('sale_line_id', 'in', list(sale_line_ids))])._filter_pending()
+
+    @api.model
+    def _get_matched_qty_by_sale_line(self, sale_line_ids):
+        """m² emparejados y vigentes por línea de venta (usado por To Be Purchased y el propio cron)."""
+        result = defaultdict(float)
+        for match in self._get_pending_matches(sale_line_ids):
+            result[match.sale_line_id.id] += match.qty
+        return result
+
+    @api.model
+    def _cron_auto_match(self):
+        ICP = self.env['ir.config_parameter'].sudo()
+        last_run = ICP.get_param(self._last_run_param)
+        started_at = fields.Datetime.now()
+        matches = self._run_matcher(last_run and fields.Datetime.to_datetime(last_run))
+        ICP.set_param(self._last_run_param, fields.Datetime.to_string(started_at))
+        return matches
+
+    @api.model
+    def _run_matcher(self, since=False):
+        """
+        Empareja líneas libres (allocation_status 'available') de viajes abiertos
+        con líneas de venta 'Mandar Pedir' confirmadas y pendientes, por producto.
+        Solo se consideran productos con líneas libres o demanda modificadas desde 'since'.
+        """
+        Line = self.env['stock.transit.line']
+        SaleLine = self.env['sale.order.line']
+        free_domain = [
+            ('allocation_status', '=', 'available'),
+            ('partner_id', '=', False),
+            ('voyage_id.custom_status', 'not in', ['delivered', 'cancel']),
+        ]
+        demand_domain = [
+            ('auto_transit_assign', '=', True),
+            ('state', '=', 'sale'),
+            ('display_type', '=', False),
+        ]
+
+        # 1. Productos con cambios desde la última ejecución
+        if since:
+            changed_free = Line._read_group(free_domain + [('write_date', '>', since)], ['product_id'])
+            changed_demand = SaleLine._read_group(
+                demand_domain + ['|', ('write_date', '>', since), ('order_id.write_date', '>', since)],
+                ['product_id'])
+            product_ids = {p.id for p, in changed_free} | {p.id for p, in changed_demand}
+            if not product_ids:
+                return self
+            free_domain.append(('product_id', 'in', list(product_ids)))
+            demand_domain.append(('product_id', 'in', list(product_ids)))
+
+        free_lines = Line.search(free_domain, order='eta asc, id asc')
+        if not free_lines:
+            return self
+        demand_domain.append(('product_id', 'in', free_lines.product_id.ids))
+        sale_lines = SaleLine.search(demand_domain).sorted(
+            lambda l: (l.order_id.commitment_date or l.order_id.date_order, l.id))
+
+        # 2. Necesidad neta por línea de venta: pendiente - asignado por allocations - ya emparejado
+        open_allocations = self.env['purchase.order.line.allocation']._read_group(
+            [('sale_line_id', 'in', sale_lines.ids), ('state', '!=', 'cancelled')],
+            ['sale_line_id'], ['quantity:sum'])
+        allocated = {sol.id: qty for sol, qty in open_allocations}
+        matched = self._get_matched_qty_by_sale_line(sale_lines.ids)
+
+        need_by_product = defaultdict(list)
+        for sol in sale_lines:
+            need = sol.product_uom_qty - sol.qty_delivered - allocated.get(sol.id, 0.0) - matched.get(sol.id, 0.0)
+            if need > 0:
+                need_by_product[sol.product_id.id].append([sol, need])
+
+        # 3. Emparejar placas completas sin exceder la necesidad (primero las de ETA más próxima)
+        match_vals = []
+        lines_by_target = defaultdict(lambda: Line)
+        for line in free_lines:
+            for item in need_by_product.get(line.product_id.id, []):
+                sol, need = item
+                if line.product_uom_qty <= 0 or line.product_uom_qty > need:
+                    continue
+                item[1] -= line.product_uom_qty
+                lines_by_target[sol.order_id] |= line
+                match_vals.append({'line_id': line.id, 'sale_line_id': sol.id, 'qty': line.product_uom_qty})
+                break
+
+        if not match_vals:
+            return self
+
+        # 4. Reservas en bloque: un write por pedido (el write de la línea agrupa holds y chatter)
+        for order, lines in lines_by_target.items():
+            lines.write({'partner_id': order.partner_id.id, 'order_id': order.id})
+
+        matches = self.create(match_vals)
+        _logger.info(f"Auto-match tránsito: {len(matches)} líneas emparejadas con {len(lines_by_target)} pedidos")
+        return matches
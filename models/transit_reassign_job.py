@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+from odoo import models, fields, api, Command, _
+from odoo.exceptions import UserError
+from datetime import timedelta
+import logging
+
+from .utils.transit_manager import TransitManager
+
+_logger = logging.getLogger(__name__)
+
+
+class StockTransitReassignJob(models.Model):
+    """
+    Reasignación masiva de líneas en tránsito procesada por bloques.
+
+    El wizard de reasignación crea el trabajo; las ejecuciones pequeñas se procesan
+    en la misma petición y las grandes las procesa el cron, un bloque por
+    ejecución (cada ejecución es su propia transacción). El progreso queda en este
+    registro: si un bloque falla se descarta solo ese bloque, el trabajo queda
+    'Interrumpido' y 'Reanudar' continúa desde el último bloque guardado.
+    """
+    _name = 'stock.transit.reassign.job'
+    _description = 'Reasignación en Tránsito por Bloques'
+    _order = 'create_date desc, id desc'
+
+    user_id = fields.Many2one('res.users', string='Solicitado por', required=True, readonly=True,
+        default=lambda self: self.env.user)
+    company_id = fields.Many2one('res.company', string='Compañía', required=True, readonly=True,
+        default=lambda self: self.env.company)
+    line_ids = fields.Many2many('stock.transit.line', 'stock_transit_reassign_job_line_rel',
+        'job_id', 'line_id', string='Líneas a Reasignar', readonly=True)
+    processed_line_ids = fields.Many2many('stock.transit.line', 'stock_transit_reassign_job_processed_rel',
+        'job_id', 'line_id', string='Líneas Procesadas', readonly=True)
+    new_partner_id = fields.Many2one('res.partner', string='Nuevo Cliente', readonly=True)
+    new_order_id = fields.Many2one('sale.order', string='Orden de Venta', readonly=True)
+    reason = fields.Text(string='Motivo / Notas', readonly=True)
+    chunk_size = fields.Integer(string='Líneas por Bloque', default=500, readonly=True)
+    hold_order_id = fields.Many2one('stock.lot.hold.order', string='Orden de Reserva', readonly=True)
+    state = fields.Selection([
+        ('queued', 'En Cola'),
+        ('running', 'En Proceso'),
+        ('failed', 'Interrumpido'),
+        ('done', 'Terminado'),
+    ], string='Estado', default='queued', required=True, readonly=True, index=True)
+    last_error = fields.Text(string='Último Error', readonly=True)
+    progress_text = fields.Char(string='Progreso', compute='_compute_progress_text')
+
+    # Días que se conservan los trabajos terminados
+    _keep_done_days = 30
+
+    @api.depends('line_ids', 'processed_line_ids')
+    def _compute_progress_text(self):
+        for job in self:
+            job.progress_text = f"{len(job.processed_line_ids)} / {len(job.line_ids)}"
+
+    @api.depends('new_partner_id', 'new_order_id', 'line_ids')
+    def _compute_display_name(self):
+        for job in self:
+            target = f"{job.new_partner_id.name or _('Stock')} ({job.new_order_id.name or '-'})"
+            job.display_name = _("%(count)s líneas → %(target)s", count=len(job.line_ids), target=target)
+
+    # -------------------------------------------------------------------------
+    # EJECUCIÓN
+    # -------------------------------------------------------------------------
+
+    def _run_inline(self):
+        """Procesa todo el trabajo en la transacción actual (ejecuciones pequeñas)."""
+        self.ensure_one()
+        while self._run_chunk():
+            pass
+        if self.state == 'failed':
+            raise UserError(self.last_error)
+
+    def _run_chunk(self):
+        """
+        Procesa el siguiente bloque con los permisos de quien lo solicitó. Un fallo
+        revierte solo el bloque y deja el trabajo 'Interrumpido'.
+        Devuelve True si quedan líneas pendientes.
+        """
+        self.ensure_one()
+        job = self.with_user(self.user_id).with_company(self.company_id)
+        pending = job.line_ids - job.processed_line_ids
+        chunk = pending[:job.chunk_size] if job.chunk_size > 0 else pending
+        is_last = not (pending - chunk)
+        try:
+            with self.env.cr.savepoint():
+                if job.new_partner_id and not job.hold_order_id:
+                    job.hold_order_id = job._create_hold_order()
+                job._process_chunk(chunk)
+                job.write({
+                    'state': 'running',
+                    'last_error': False,
+                    'processed_line_ids': [Command.link(line_id) for line_id in chunk.ids],
+                })
+                if is_last:
+                    job._finish()
+        except Exception as e:
+            _logger.warning(f"Reasignación {job.id}: bloque interrumpido ({e})")
+            job.invalidate_recordset()
+            job.write({'state': 'failed', 'last_error': str(e)})
+            return False
+        return not is_last
+
+    def _create_hold_order(self):
+        return TransitManager.create_hold_order(
+            self.env, self.new_partner_id, self.new_order_id,
+            notes=f"Reasignación desde Tránsito.\nMotivo: {self.reason}\nPedido Origen: {self.new_order_id.name}",
+            company=self.company_id,
+        )
+
+    def _process_chunk(self, lines):
+        for line in lines:
+            # Se pasa 'hold_order_obj' para que NO cree una nueva, sino que use la existente
+            TransitManager.reassign_lot(
+                self.env,
+                line,
+                self.new_partner_id,
+                self.new_order_id,
+                self.reason,
+                hold_order_obj=self.hold_order_id or False
+            )
+
+    def _finish(self):
+        """Resumen por viaje y confirmación (o descarte si quedó vacía) de la Orden de Reserva."""
+        self._post_voyage_summaries()
+        hold_order = self.hold_order_id
+        if hold_order:
+            if hold_order.hold_line_ids:
+                hold_order.action_confirm()
+            else:
+                # No se reservó ningún quant físico: se elimina la cabecera vacía
+                self.hold_order_id = False
+                hold_order.unlink()
+        self.state = 'done'
+
+    def _post_voyage_summaries(self):
+        """Un solo mensaje por viaje (Voyage) con todos los lotes reasignados."""
+        target = f"{self.new_partner_id.name or 'Stock'} ({self.new_order_id.name or '-'})"
+        for voyage, lines in self.processed_line_ids.grouped('voyage_id').items():
+            if not voyage:
+                continue
+            lots = ', '.join(lines.mapped(lambda l: l.lot_id.name or l.product_id.name))
+            msg = f"🔄 <b>Reasignación:</b> {len(lines)} lotes ({lots})<br/>"
+            msg += f"A: {target}<br/>Motivo: {self.reason}"
+            voyage.message_post(body=msg)
+
+    # -------------------------------------------------------------------------
+    # CRON
+    # -------------------------------------------------------------------------
+
+    def _schedule(self):
+        cron = self.env.ref('stock_transit_allocation.ir_cron_transit_reassign_jobs', raise_if_not_found=False)
+        if cron:
+            cron.sudo()._trigger()
+
+    @api.model
+    def _cron_process_jobs(self):
+        """Procesa un bloque del trabajo pendiente más antiguo y se vuelve a disparar si queda trabajo."""
+        job = self.search([('state', 'in', ['queued', 'running'])], order='id asc', limit=1)
+        if not job:
+            return
+        job._run_chunk()
+        if self.search_count([('state', 'in', ['queued', 'running'])], limit=1):
+            job._schedule()
+
+    def action_resume(self):
+        self.filtered(lambda j: j.state == 'failed').write({'state': 'queued', 'last_error': False})
+        self._schedule()
+
+    @api.autovacuum
+    def _gc_done_jobs(self):
+        cutoff = fields.Datetime.now() - timedelta(days=self._keep_done_days)
+        self.search([('state', '=', 'done'), ('write_date', '<', cutoff)]).unlink()
@@ -1,2 +1,4 @@
 # -*- coding: utf-8 -*-
 from . import transit_manager
+from . import shortage_rebalancer
+from . import dimension_validator
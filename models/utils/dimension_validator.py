@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+import logging
+import statistics
+from collections import defaultdict
+
+try:
+    import numpy as np
+except ImportError:  # numpy es opcional: se usa el cálculo en Python puro
+    np = None
+
+_logger = logging.getLogger(__name__)
+
+# Umbral de z robusto (mediana / MAD) para marcar una discrepancia como atípica
+OUTLIER_Z = 3.5
+
+
+class DimensionValidator:
+    """
+    Validación masiva de medidas de placas: compara los m² declarados de cada
+    línea con alto × ancho del lote. Carga todo en arrays con una consulta y
+    calcula discrepancias, atípicos y totales por contenedor de forma vectorizada
+    (numpy si está instalado; si no, el mismo cálculo en Python).
+    """
+
+    @staticmethod
+    def load(env, voyage_ids=None):
+        """
+        Columnas (listas paralelas) de las líneas de los viajes dados o de los abiertos,
+        con o sin lote (sin lote no hay medidas: se marcan 'missing'). Solo se leen
+        viajes visibles para el usuario; 'checked_voyage_ids' los devuelve.
+        """
+        Voyage = env['stock.transit.voyage']
+        if voyage_ids:
+            voyages = Voyage.search([('id', 'in', list(voyage_ids))])
+            where = "l.voyage_id = ANY(%s)"
+        else:
+            voyages = Voyage.search([('custom_status', 'not in', ['delivered', 'cancel'])])
+            where = "l.voyage_id = ANY(%s) AND l.active"
+        columns = ('ids', 'voyage_ids', 'containers', 'alto', 'ancho', 'qty')
+        rows = []
+        if voyages:
+            env['stock.transit.line'].flush_model(['voyage_id', 'lot_id', 'container_number', 'product_uom_qty', 'active'])
+            env.cr.execute(f"""
+                SELECT l.id, l.voyage_id, COALESCE(l.container_number, ''),
+                       COALESCE(lot.x_alto, 0), COALESCE(lot.x_ancho, 0), COALESCE(l.product_uom_qty, 0)
+                  FROM stock_transit_line l
+                  LEFT JOIN stock_lot lot ON lot.id = l.lot_id
+                 WHERE {where}
+            """, [voyages.ids])
+            rows = env.cr.fetchall()
+        data = {name: [row[i] for row in rows] for i, name in enumerate(columns)}
+        data['checked_voyage_ids'] = voyages.ids
+        return data
+
+    @staticmethod
+    def analyze(data, tolerance=0.02, area_factor=1.0):
+        """
+        Devuelve (resultados, totales_por_contenedor):
+          - resultados: lista de (line_id, m² calculados, diferencia, flag) con flag
+            False, 'missing' (sin medidas), 'mismatch' (> tolerancia) u 'outlier'
+            (discrepancia fuera de tolerancia y atípica respecto al resto).
+          - totales: dicts con voyage_id, container, declarados, calculados, diferencia y placas marcadas.
+        """
+        if not data['ids']:
+            return [], []
+        if np is not None:
+            return DimensionValidator._analyze_numpy(data, tolerance, area_factor)
+        return DimensionValidator._analyze_python(data, tolerance, area_factor)
+
+    @staticmethod
+    def _analyze_numpy(data, tolerance, area_factor):
+        alto = np.asarray(data['alto'], dtype=float)
+        ancho = np.asarray(data['ancho'], dtype=float)
+        qty = np.asarray(data['qty'], dtype=float)
+
+        area = alto * ancho * area_factor
+        missing = (alto <= 0) | (ancho <= 0)
+        diff = qty - area
+        rel = np.divide(diff, area, out=np.zeros_like(diff), where=area > 0)
+        mismatch = ~missing & (np.abs(rel) > tolerance)
+
+        outlier = np.zeros_like(mismatch)
+        valid_rel = rel[~missing]
+        if valid_rel.size:
+            median = np.median(valid_rel)
+            mad = np.median(np.abs(valid_rel - median))
+            if mad > 0:
+                outlier = mismatch & (np.abs(0.6745 * (rel - median) / mad) > OUTLIER_Z)
+
+        flags = np.full(qty.shape, '', dtype=object)
+        flags[mismatch] = 'mismatch'
+        flags[outlier] = 'outlier'
+        flags[missing] = 'missing'
+        flagged = flags != ''
+
+        keys = np.array([f"{v}|{c}" for v, c in zip(data['voyage_ids'], data['containers'])])
+        unique_keys, inverse = np.unique(keys, return_inverse=True)
+        declared = np.bincount(inverse, weights=qty)
+        computed = np.bincount(inverse, weights=np.where(missing, 0.0, area))
+        flagged_count = np.bincount(inverse, weights=flagged.astype(float))
+
+        results = list(zip(data['ids'], area.tolist(), diff.tolist(), [flag or False for flag in flags.tolist()]))
+        totals = []
+        for key, decl, comp, count in zip(unique_keys.tolist(), declared.tolist(), computed.tolist(), flagged_count.tolist()):
+            voyage_id, container = key.split('|', 1)
+            totals.append({
+                'voyage_id': int(voyage_id), 'container': container,
+                'declared': decl, 'computed': comp, 'diff': decl - comp, 'flagged': int(count),
+            })
+        return results, totals
+
+    @staticmethod
+    def _analyze_python(data, tolerance, area_factor):
+        rows = []
+        for line_id, alto, ancho, qty in zip(data['ids'], data['alto'], data['ancho'], data['qty']):
+            missing = alto <= 0 or ancho <= 0
+            area = alto * ancho * area_factor
+            diff = qty - area
+            rel = diff / area if area > 0 else 0.0
+            rows.append([line_id, area, diff, rel, missing])
+
+        valid_rel = [row[3] for row in rows if not row[4]]
+        median = mad = 0.0
+        if valid_rel:
+            median = statistics.median(valid_rel)
+            mad = statistics.median(abs(rel - median) for rel in valid_rel)
+
+        results = []
+        totals = defaultdict(lambda: {'declared': 0.0, 'computed': 0.0, 'flagged': 0})
+        for row, voyage_id, container, qty in zip(rows, data['voyage_ids'], data['containers'], data['qty']):
+            line_id, area, diff, rel, missing = row
+            flag = False
+            if missing:
+                flag = 'missing'
+            elif abs(rel) > tolerance:
+                flag = 'mismatch'
+                if mad > 0 and abs(0.6745 * (rel - median) / mad) > OUTLIER_Z:
+                    flag = 'outlier'
+            results.append((line_id, area, diff, flag))
+
+            total = totals[(voyage_id, container)]
+            total['declared'] += qty
+            total['computed'] += 0.0 if missing else area
+            total['flagged'] += 1 if flag else 0
+
+        return results, [
+            dict(values, voyage_id=voyage_id, container=container, diff=values['declared'] - values['computed'])
+            for (voyage_id, container), values in sorted(totals.items())
+        ]
+
+    @staticmethod
+    def write_results(env, results, voyage_ids=None):
+        """
+        Guarda m² calculados, diferencia y flag de todas las líneas analizadas con un
+        solo UPDATE. Antes limpia el resultado anterior del resto de líneas de los
+        viajes revisados, para no dejar flags de una validación previa.
+        """
+        Line = env['stock.transit.line']
+        fnames = ['dimension_area', 'dimension_diff', 'dimension_flag']
+        Line.flush_model(fnames)
+        line_ids, areas, diffs, flags = (list(column) for column in zip(*results)) if results else ([], [], [], [])
+        if voyage_ids:
+            env.cr.execute("""
+                UPDATE stock_transit_line
+                   SET dimension_area = NULL, dimension_diff = NULL, dimension_flag = NULL
+                 WHERE voyage_id = ANY(%s)
+                   AND id != ALL(%s)
+                   AND (dimension_flag IS NOT NULL OR dimension_area IS NOT NULL OR dimension_diff IS NOT NULL)
+             RETURNING id
+            """, (list(voyage_ids), line_ids))
+            Line.browse([row[0] for row in env.cr.fetchall()]).invalidate_recordset(fnames)
+        if not results:
+            return
+        env.cr.execute("""
+            UPDATE stock_transit_line l
+               SET dimension_area = v.area,
+                   dimension_diff = v.diff,
+                   dimension_flag = NULLIF(v.flag, '')
+              FROM unnest(%s::int[], %s::float8[], %s::float8[], %s::varchar[]) AS v(id, area, diff, flag)
+             WHERE l.id = v.id
+        """, (line_ids, areas, diffs, [flag or '' for flag in flags]))
+        Line.browse(line_ids).invalidate_recordset(fnames)
+        _logger.info(f"Validación de medidas: {len(line_ids)} placas analizadas, "
+                     f"{sum(1 for flag in flags if flag)} marcadas")
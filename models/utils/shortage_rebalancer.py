@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+import logging
+from collections import defaultdict
+
+_logger = logging.getLogger(__name__)
+
+# Voyages cuyo contenido sigue disponible para redistribuir
+OPEN_VOYAGE_EXCLUDED_STATUS = ('delivered', 'cancel')
+
+
+class ShortageRebalancer:
+    """
+    Motor de rebalanceo de faltantes por producto sobre todos los viajes en
+    tránsito. Trabaja con diccionarios planos (dos consultas de lectura) y
+    devuelve propuestas de reasignación de líneas de tránsito.
+    """
+
+    @staticmethod
+    def load(env, product_ids=None):
+        """
+        Carga la oferta (líneas de tránsito de viajes abiertos) y la demanda
+        (allocations abiertas) de los productos indicados (o de todos).
+        """
+        line_domain = [('voyage_id.custom_status', 'not in', OPEN_VOYAGE_EXCLUDED_STATUS)]
+        alloc_domain = [('state', 'not in', ['done', 'cancelled'])]
+        if product_ids:
+            line_domain.append(('product_id', 'in', list(product_ids)))
+            alloc_domain.append(('product_id', 'in', list(product_ids)))
+
+        lines = env['stock.transit.line'].search_read(
+            line_domain, ['product_id', 'allocation_id', 'product_uom_qty', 'lot_id', 'allocation_status', 'partner_id'],
+            load=None)
+        allocations = env['purchase.order.line.allocation'].search_read(
+            alloc_domain, ['product_id', 'quantity', 'sale_order_id', 'partner_id'], load=None)
+
+        # Prioridad: fecha compromiso (o fecha de pedido) más temprana primero
+        order_ids = {a['sale_order_id'] for a in allocations if a['sale_order_id']}
+        order_dates = {
+            o['id']: o['commitment_date'] or o['date_order']
+            for o in env['sale.order'].browse(order_ids).read(['commitment_date', 'date_order'])
+        }
+        for alloc in allocations:
+            alloc['priority_date'] = order_dates.get(alloc['sale_order_id'])
+        return lines, allocations
+
+    @staticmethod
+    def compute_targets(supply, allocations, policy='proportional'):
+        """
+        Reparte 'supply' m² entre allocations de un producto.
+        - proportional: cada allocation recibe supply * demanda / demanda total (tope: su demanda).
+        - priority: por niveles de fecha; cada nivel se cubre completo antes del
+          siguiente y, si no alcanza, el nivel se reparte proporcionalmente.
+        Devuelve {allocation_id: m² objetivo}.
+        """
+        targets = {a['id']: 0.0 for a in allocations}
+        total_demand = sum(a['quantity'] for a in allocations)
+        if supply <= 0 or total_demand <= 0:
+            return targets
+
+        if policy == 'proportional':
+            ratio = min(1.0, supply / total_demand)
+            for alloc in allocations:
+                targets[alloc['id']] = alloc['quantity'] * ratio
+            return targets
+
+        tiers = defaultdict(list)
+        for alloc in allocations:
+            tiers[alloc['priority_date']].append(alloc)
+        remaining = supply
+        for tier_key in sorted(tiers, key=lambda d: (d is None, d or 0)):
+            tier = tiers[tier_key]
+            tier_demand = sum(a['quantity'] for a in tier)
+            if tier_demand <= 0:
+                continue
+            ratio = min(1.0, remaining / tier_demand)
+            for alloc in tier:
+                targets[alloc['id']] = alloc['quantity'] * ratio
+            remaining -= tier_demand * ratio
+            if remaining <= 0:
+                break
+        return targets
+
+    @staticmethod
+    def propose(lines, allocations, policy='proportional'):
+        """
+        Calcula las propuestas de reasignación para todos los productos.
+        Las placas son indivisibles: una línea solo se mueve si cabe en el
+        déficit del receptor y en el excedente del donante (o si está libre).
+        Devuelve (propuestas, resumen por producto).
+        """
+        lines_by_product = defaultdict(list)
+        for line in lines:
+            lines_by_product[line['product_id']].append(line)
+        allocs_by_product = defaultdict(list)
+        for alloc in allocations:
+            allocs_by_product[alloc['product_id']].append(alloc)
+
+        proposals = []
+        summary = []
+        for product_id, product_allocs in allocs_by_product.items():
+            alloc_ids = {a['id'] for a in product_allocs}
+
+            # Oferta redistribuible: líneas de allocations abiertas y líneas realmente
+            # libres (sin cliente). Las reservadas a un cliente fuera de allocation
+            # (reasignación manual, auto-match) o de allocations cerradas no se tocan.
+            current = defaultdict(float)
+            lines_by_alloc = defaultdict(list)
+            free_lines = []
+            for line in lines_by_product.get(product_id, []):
+                if line['allocation_id']:
+                    if line['allocation_id'] in alloc_ids:
+                        current[line['allocation_id']] += line['product_uom_qty']
+                        lines_by_alloc[line['allocation_id']].append(line)
+                elif line['allocation_status'] == 'available' and not line['partner_id']:
+                    free_lines.append(line)
+
+            supply = sum(current.values()) + sum(l['product_uom_qty'] for l in free_lines)
+            targets = ShortageRebalancer.compute_targets(supply, product_allocs, policy)
+
+            surplus = {a: current[a] - targets[a] for a in alloc_ids if current[a] > targets[a]}
+            deficits = sorted(
+                ((targets[a] - current[a], a) for a in alloc_ids if targets[a] > current[a]),
+                reverse=True,
+            )
+
+            donor_pool = free_lines + [
+                line for alloc_id in sorted(surplus, key=lambda a: -surplus[a])
+                for line in sorted(lines_by_alloc[alloc_id], key=lambda l: l['product_uom_qty'])
+            ]
+            moved = set()
+            proposals_before = len(proposals)
+            for deficit, receiver in deficits:
+                for line in donor_pool:
+                    if line['id'] in moved or line['product_uom_qty'] > deficit:
+                        continue
+                    donor = line['allocation_id']
+                    if donor and surplus.get(donor, 0.0) < line['product_uom_qty']:
+                        continue
+                    proposals.append({
+                        'line_id': line['id'],
+                        'product_id': product_id,
+                        'from_allocation_id': donor or False,
+                        'to_allocation_id': receiver,
+                        'qty': line['product_uom_qty'],
+                    })
+                    moved.add(line['id'])
+                    deficit -= line['product_uom_qty']
+                    if donor:
+                        surplus[donor] -= line['product_uom_qty']
+                    if deficit <= 0:
+                        break
+
+            summary.append({
+                'product_id': product_id,
+                'supply': supply,
+                'demand': sum(a['quantity'] for a in product_allocs),
+                'moves': len(proposals) - proposals_before,
+            })
+
+        _logger.info(f"ShortageRebalancer: {len(proposals)} reasignaciones propuestas en {len(summary)} productos")
+        return proposals, summary
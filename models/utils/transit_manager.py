@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 import logging
+from collections import defaultdict
 from odoo import fields, _
+from odoo.tools import html_escape
 
 _logger = logging.getLogger(__name__)
 
@@ -21,7 +23,7 @@ class TransitManager:
         if not lot:
             # Si no hay lote, es una línea preventiva (etapa solicitud/producción)
             # Solo actualizamos la asignación visual en la línea de tránsito
-            transit_line.write({
+            transit_line.with_context(transit_skip_assignment_logic=True).write({
                 'partner_id': new_partner_id.id if new_partner_id else False,
                 'order_id': new_order_id.id if new_partner_id else False,
                 'allocation_status': 'reserved' if new_partner_id else 'available'
@@ -32,40 +34,13 @@ class TransitManager:
         # =====================================================================
         # 2. RECUPERACIÓN DE QUANT (Cuando SÍ hay lote)
         # =====================================================================
-        quant = transit_line.quant_id
-        
-        if not quant or not quant.exists():
-            _logger.info(f"TransitManager: Buscando Quant para lote {lot.name}...")
-            
-            # Búsqueda flexible
-            domain = [
-                ('lot_id', '=', lot.id),
-                ('product_id', '=', product.id),
-                ('quantity', '>', 0),
-            ]
-            
-            # Intentar ubicación del picking o búsqueda amplia
-            location_dest = False
-            if transit_line.voyage_id.picking_id:
-                location_dest = transit_line.voyage_id.picking_id.location_dest_id
-            
-            if location_dest:
-                search_domain = domain + [('location_id', '=', location_dest.id)]
-                quant = env['stock.quant'].sudo().search(search_domain, limit=1)
-            
-            if not quant:
-                search_domain = domain + ['|', ('location_id.usage', '=', 'internal'), ('location_id.usage', '=', 'transit')]
-                quant = env['stock.quant'].sudo().search(search_domain, order='create_date desc, id desc', limit=1)
-            
-            if quant:
-                transit_line.sudo().write({'quant_id': quant.id})
-            else:
-                _logger.warning(f"TransitManager: No se encontró quant físico para el lote {lot.name}")
+        quant_by_line, holds_by_quant = TransitManager.resolve_quants_and_holds(env, transit_line)
+        quant = quant_by_line.get(transit_line.id)
 
         # =====================================================================
         # 3. ACTUALIZACIÓN VISUAL DE LA LÍNEA
         # =====================================================================
-        transit_line.write({
+        transit_line.with_context(transit_skip_assignment_logic=True).write({
             'partner_id': new_partner_id.id if new_partner_id else False,
             'order_id': new_order_id.id if new_partner_id else False,
             'allocation_status': 'reserved' if new_partner_id else 'available'
@@ -79,54 +54,29 @@ class TransitManager:
         # 4. GESTIÓN DE LA ORDEN DE RESERVA (Hold Order)
         # =====================================================================
         
+        # Los holds activos de otro cliente se cancelan siempre (liberación o
+        # reasignación); si el nuevo cliente ya tiene el lote reservado no se duplica.
+        own_holds, other_holds = TransitManager.split_holds_by_partner(holds_by_quant[quant.id], new_partner_id)
+        TransitManager.cancel_holds(other_holds)
+
         # Caso: Liberación a Stock (No hay nuevo partner)
-        if not new_partner_id:
-            existing_holds = env['stock.lot.hold'].sudo().search([
-                ('quant_id', '=', quant.id),
-                ('estado', '=', 'activo')
-            ])
-            for h in existing_holds:
-                h.action_cancelar_hold()
+        if not new_partner_id or own_holds:
             return True
 
         # Caso: Asignación a nuevo cliente
         if new_partner_id:
             # Obtener precio para la reserva
-            price_unit = 0.0
-            if hasattr(product.product_tmpl_id, 'x_price_usd_1'):
-                price_unit = product.product_tmpl_id.x_price_usd_1
-            
-            if price_unit <= 0:
-                price_unit = product.list_price
+            price_unit = TransitManager.get_hold_price(product)
 
             # Gestión de la cabecera (Header)
             order = hold_order_obj
             created_local_order = False
 
             if not order:
-                project_id = False
-                architect_id = False
-                
-                if new_order_id:
-                    project_id_obj = getattr(new_order_id, 'x_project_id', False)
-                    architect_id_obj = getattr(new_order_id, 'x_architect_id', False)
-                    project_id = project_id_obj.id if project_id_obj else False
-                    architect_id = architect_id_obj.id if architect_id_obj else False
-
-                currency = env['res.currency'].search([('name', '=', 'USD')], limit=1)
-                if not currency:
-                    currency = env.company.currency_id
-
-                order = env['stock.lot.hold.order'].sudo().create({
-                    'partner_id': new_partner_id.id,
-                    'user_id': env.user.id,
-                    'company_id': transit_line.company_id.id or env.company.id,
-                    'project_id': project_id,
-                    'arquitecto_id': architect_id,
-                    'currency_id': currency.id,
-                    'fecha_orden': fields.Datetime.now(),
-                    'notas': (notes or '') + " (Generado desde Torre de Control)",
-                })
+                order = TransitManager.create_hold_order(
+                    env, new_partner_id, new_order_id, notes,
+                    company=transit_line.company_id,
+                )
                 created_local_order = True
 
             # Crear la línea de reserva
@@ -144,4 +94,366 @@ class TransitManager:
                 order.action_confirm()
                 _logger.info(f"TransitManager: Reserva {order.name} confirmada para lote {lot.name}")
 
-        return True
\ No newline at end of file
+        return True
+
+    # =========================================================================
+    # HELPERS COMPARTIDOS
+    # =========================================================================
+
+    @staticmethod
+    def split_holds_by_partner(holds, partner):
+        """Separa holds activos en (del cliente indicado, de otros clientes)."""
+        own = holds.filtered(lambda h: partner and h.order_id.partner_id == partner)
+        return own, holds - own
+
+    @staticmethod
+    def cancel_holds(holds):
+        """Cancela holds activos; un fallo en uno no impide cancelar el resto."""
+        for hold in holds:
+            try:
+                hold.action_cancelar_hold()
+                _logger.info(f"TransitManager: Hold {hold.id} cancelado (quant {hold.quant_id.id})")
+            except Exception as e:
+                _logger.warning(f"TransitManager: No se pudo cancelar hold {hold.id}: {e}")
+
+    @staticmethod
+    def find_quant(env, transit_line):
+        """Localiza el quant físico de una línea (ubicación del picking o búsqueda amplia)."""
+        quant_by_line, __ = TransitManager.resolve_quants_and_holds(env, transit_line, write_back=False)
+        return quant_by_line.get(transit_line.id, env['stock.quant'])
+
+    @staticmethod
+    def resolve_quants_and_holds(env, transit_lines, write_back=True):
+        """
+        Resuelve quants físicos y holds activos de un conjunto de líneas con un
+        número fijo de consultas (independiente del número de líneas):
+        1. quants existentes, 2. quants en la ubicación destino del picking,
+        3. búsqueda amplia (internal/transit) para los que falten, 4. holds activos.
+        Los quants encontrados se escriben de vuelta en bloque si write_back.
+        Devuelve ({line_id: quant}, {quant_id: holds}).
+        """
+        Quant = env['stock.quant'].sudo()
+        Hold = env['stock.lot.hold'].sudo()
+        physical_lines = transit_lines.filtered('lot_id')
+        existing_quants = physical_lines.quant_id.exists()
+
+        quant_by_line = {}
+        pending = []
+        for line in physical_lines:
+            if line.quant_id and line.quant_id in existing_quants:
+                quant_by_line[line.id] = line.quant_id
+            else:
+                pending.append(line)
+
+        if pending:
+            # Búsqueda flexible
+            domain = [
+                ('lot_id', 'in', list({line.lot_id.id for line in pending})),
+                ('product_id', 'in', list({line.product_id.id for line in pending})),
+                ('quantity', '>', 0),
+            ]
+
+            # Intentar ubicación del picking...
+            by_location = {}
+            dest_location_ids = {line.voyage_id.picking_id.location_dest_id.id for line in pending} - {False}
+            if dest_location_ids:
+                for quant in Quant.search(domain + [('location_id', 'in', list(dest_location_ids))]):
+                    by_location.setdefault((quant.lot_id.id, quant.product_id.id, quant.location_id.id), quant)
+
+            # ... o búsqueda amplia para los lotes que no se encontraron
+            missing = [
+                line for line in pending
+                if (line.lot_id.id, line.product_id.id, line.voyage_id.picking_id.location_dest_id.id) not in by_location
+            ]
+            by_lot = {}
+            if missing:
+                wide_domain = [
+                    ('lot_id', 'in', list({line.lot_id.id for line in missing})),
+                    ('product_id', 'in', list({line.product_id.id for line in missing})),
+                    ('quantity', '>', 0),
+                    '|', ('location_id.usage', '=', 'internal'), ('location_id.usage', '=', 'transit'),
+                ]
+                for quant in Quant.search(wide_domain, order='create_date desc, id desc'):
+                    by_lot.setdefault((quant.lot_id.id, quant.product_id.id), quant)
+
+            found = []
+            for line in pending:
+                key = (line.lot_id.id, line.product_id.id)
+                quant = by_location.get(key + (line.voyage_id.picking_id.location_dest_id.id,)) or by_lot.get(key)
+                if quant:
+                    quant_by_line[line.id] = quant
+                    found.append((line.id, quant.id))
+                else:
+                    _logger.warning(f"TransitManager: No se encontró quant físico para el lote {line.lot_id.name}")
+
+            if found and write_back:
+                TransitManager._write_back_quants(env, found)
+
+        holds_by_quant = defaultdict(lambda: Hold)
+        quant_ids = list({quant.id for quant in quant_by_line.values()})
+        if quant_ids:
+            for hold in Hold.search([('quant_id', 'in', quant_ids), ('estado', '=', 'activo')]):
+                holds_by_quant[hold.quant_id.id] |= hold
+
+        return quant_by_line, holds_by_quant
+
+    @staticmethod
+    def _write_back_quants(env, line_quant_pairs):
+        """Guarda quant_id en varias líneas con un solo UPDATE."""
+        Line = env['stock.transit.line']
+        Line.flush_model(['quant_id'])
+        line_ids = [line_id for line_id, __ in line_quant_pairs]
+        env.cr.execute("""
+            UPDATE stock_transit_line l
+               SET quant_id = v.quant_id
+              FROM unnest(%s::int[], %s::int[]) AS v(id, quant_id)
+             WHERE l.id = v.id
+        """, (line_ids, [quant_id for __, quant_id in line_quant_pairs]))
+        Line.browse(line_ids).invalidate_recordset(['quant_id'])
+
+    @staticmethod
+    def get_hold_price(product):
+        """Precio unitario para la línea de reserva (USD de plantilla o precio de lista)."""
+        price_unit = 0.0
+        if hasattr(product.product_tmpl_id, 'x_price_usd_1'):
+            price_unit = product.product_tmpl_id.x_price_usd_1
+        if price_unit <= 0:
+            price_unit = product.list_price
+        return price_unit
+
+    @staticmethod
+    def create_hold_order(env, partner, sale_order=False, notes=None, company=False):
+        """Crea (sin confirmar) la cabecera 'stock.lot.hold.order' para un cliente/pedido."""
+        return env['stock.lot.hold.order'].sudo().create(
+            TransitManager._prepare_hold_order_vals(env, partner, sale_order, notes, company))
+
+    @staticmethod
+    def _prepare_hold_order_vals(env, partner, sale_order=False, notes=None, company=False, currency=False):
+        project_id = False
+        architect_id = False
+
+        if sale_order:
+            project_id_obj = getattr(sale_order, 'x_project_id', False)
+            architect_id_obj = getattr(sale_order, 'x_architect_id', False)
+            project_id = project_id_obj.id if project_id_obj else False
+            architect_id = architect_id_obj.id if architect_id_obj else False
+
+        if not currency:
+            currency = env['res.currency'].search([('name', '=', 'USD')], limit=1)
+        if not currency:
+            currency = env.company.currency_id
+
+        return {
+            'partner_id': partner.id,
+            'user_id': env.user.id,
+            'company_id': (company and company.id) or env.company.id,
+            'project_id': project_id,
+            'arquitecto_id': architect_id,
+            'currency_id': currency.id,
+            'fecha_orden': fields.Datetime.now(),
+            'notas': (notes or '') + " (Generado desde Torre de Control)",
+        }
+
+    @staticmethod
+    def reserve_lines(env, transit_lines, partner, sale_order=False, notes=None, hold_order_obj=False,
+                      quant_by_line=None):
+        """
+        Versión por lotes de la reserva física: una sola cabecera para todo el
+        grupo (cliente, pedido) y todas las líneas de reserva en un único create.
+        No reescribe partner/order en las líneas (el llamador ya lo hizo).
+        quant_by_line: resultado previo de resolve_quants_and_holds (evita resolver de nuevo).
+        Devuelve la orden de reserva usada (o vacía si no hubo nada que reservar).
+        """
+        hold_line_vals = []
+        if quant_by_line is None:
+            quant_by_line, __ = TransitManager.resolve_quants_and_holds(env, transit_lines)
+        for line in transit_lines:
+            quant = quant_by_line.get(line.id)
+            if not quant:
+                continue
+            hold_line_vals.append({
+                'quant_id': quant.id,
+                'lot_id': line.lot_id.id,
+                'product_id': line.product_id.id,
+                'cantidad_m2': line.product_uom_qty,
+                'precio_unitario': TransitManager.get_hold_price(line.product_id),
+            })
+
+        if not hold_line_vals:
+            return env['stock.lot.hold.order']
+
+        order = hold_order_obj
+        created_local_order = False
+        if not order:
+            order = TransitManager.create_hold_order(
+                env, partner, sale_order, notes,
+                company=transit_lines[:1].company_id,
+            )
+            created_local_order = True
+
+        for vals in hold_line_vals:
+            vals['order_id'] = order.id
+        env['stock.lot.hold.order.line'].sudo().create(hold_line_vals)
+
+        if created_local_order:
+            order.action_confirm()
+            _logger.info(f"TransitManager: Reserva {order.name} confirmada con {len(hold_line_vals)} lotes")
+        return order
+
+    @staticmethod
+    def distribute_lines(transit_lines, targets):
+        """
+        Reparte líneas entre varios destinos con demanda en m² (best-fit decreasing):
+        cada línea, de mayor a menor, va al destino donde queda el menor remanente
+        sin exceder su demanda. targets: lista de (clave, m² objetivo).
+        Devuelve ({clave: líneas}, líneas sin destino).
+        """
+        remaining = {key: qty for key, qty in targets}
+        assigned = {key: transit_lines.browse() for key, __ in targets}
+        leftover = transit_lines.browse()
+
+        for line in transit_lines.sorted(lambda l: (-l.product_uom_qty, l.id)):
+            best_key = None
+            best_rest = None
+            for key, __ in targets:
+                rest = remaining[key] - line.product_uom_qty
+                if rest < 0:
+                    continue
+                if best_rest is None or rest < best_rest:
+                    best_key, best_rest = key, rest
+            if best_key is None:
+                leftover |= line
+                continue
+            assigned[best_key] |= line
+            remaining[best_key] = best_rest
+        return assigned, leftover
+
+    @staticmethod
+    def reserve_split(env, assignments, notes=None):
+        """
+        Reserva varios destinos en una sola pasada: assignments es una lista de
+        (cliente, pedido, líneas). Resuelve quants una vez, crea todas las
+        cabeceras y todas las líneas de reserva en dos create y confirma.
+        Devuelve las órdenes de reserva confirmadas.
+        """
+        all_lines = env['stock.transit.line'].union(*[lines for __, __, lines in assignments])
+        quant_by_line, holds_by_quant = TransitManager.resolve_quants_and_holds(env, all_lines)
+
+        currency = env['res.currency'].search([('name', '=', 'USD')], limit=1)
+        header_vals = []
+        reservable = []
+        for partner, sale_order, lines in assignments:
+            lines.with_context(transit_skip_assignment_logic=True).write({
+                'partner_id': partner.id,
+                'order_id': sale_order.id,
+                'allocation_status': 'reserved',
+            })
+            physical = lines.browse()
+            for line in lines.filtered(lambda l: l.id in quant_by_line):
+                own_holds, other_holds = TransitManager.split_holds_by_partner(
+                    holds_by_quant[quant_by_line[line.id].id], partner)
+                TransitManager.cancel_holds(other_holds)
+                if not own_holds:
+                    physical |= line
+            if physical:
+                header_vals.append(TransitManager._prepare_hold_order_vals(
+                    env, partner, sale_order, notes, company=physical[:1].company_id, currency=currency))
+                reservable.append(physical)
+
+        if not header_vals:
+            return env['stock.lot.hold.order']
+
+        orders = env['stock.lot.hold.order'].sudo().create(header_vals)
+        hold_line_vals = []
+        for order, lines in zip(orders, reservable):
+            for line in lines:
+                hold_line_vals.append({
+                    'order_id': order.id,
+                    'quant_id': quant_by_line[line.id].id,
+                    'lot_id': line.lot_id.id,
+                    'product_id': line.product_id.id,
+                    'cantidad_m2': line.product_uom_qty,
+                    'precio_unitario': TransitManager.get_hold_price(line.product_id),
+                })
+        env['stock.lot.hold.order.line'].sudo().create(hold_line_vals)
+        for order in orders:
+            order.action_confirm()
+        _logger.info(f"TransitManager: {len(orders)} reservas confirmadas con {len(hold_line_vals)} lotes (reparto)")
+        return orders
+
+    # =========================================================================
+    # SIMULACIÓN (DRY-RUN)
+    # =========================================================================
+
+    @staticmethod
+    def empty_simulation():
+        """Estructura del diff de simulación."""
+        return {
+            'hold_lines': [],
+            'cancellations': [],
+            'allocation_deltas': [],
+            'unmatched': [],
+        }
+
+    @staticmethod
+    def simulate_reassignment(env, transit_lines, new_partner_id, new_order_id=False):
+        """
+        Ejecuta la misma lógica de reassign_lot sin escribir nada y devuelve
+        el diff planificado: líneas de reserva, holds a cancelar y lotes sin quant.
+        """
+        diff = TransitManager.empty_simulation()
+        quant_by_line, holds_by_quant = TransitManager.resolve_quants_and_holds(
+            env, transit_lines, write_back=False)
+
+        for line in transit_lines:
+            if not line.lot_id:
+                # Reasignación visual: no genera reserva física
+                continue
+            quant = quant_by_line.get(line.id)
+            if not quant:
+                diff['unmatched'].append({
+                    'lot': line.lot_id.name,
+                    'product': line.product_id.display_name,
+                    'reason': _("Sin quant físico"),
+                })
+                continue
+            own_holds, other_holds = TransitManager.split_holds_by_partner(holds_by_quant[quant.id], new_partner_id)
+            for hold in other_holds:
+                diff['cancellations'].append({
+                    'lot': line.lot_id.name,
+                    'hold': hold.display_name,
+                    'partner': hold.order_id.partner_id.name or '',
+                })
+            if not new_partner_id or own_holds:
+                continue
+            diff['hold_lines'].append({
+                'lot': line.lot_id.name,
+                'product': line.product_id.display_name,
+                'partner': new_partner_id.name,
+                'order': new_order_id.name if new_order_id else '',
+                'qty': line.product_uom_qty,
+            })
+        return diff
+
+    @staticmethod
+    def render_simulation_html(diff):
+        """Representación HTML (tablas simples) de un diff de simulación."""
+        sections = [
+            ('hold_lines', _("Reservas a crear"), ['lot', 'product', 'partner', 'order', 'qty']),
+            ('cancellations', _("Reservas a cancelar"), ['lot', 'hold', 'partner']),
+            ('allocation_deltas', _("Cambios en asignaciones"), ['allocation', 'qty_before', 'qty_after', 'state']),
+            ('unmatched', _("Lotes sin coincidencia"), ['lot', 'product', 'reason']),
+        ]
+        parts = []
+        for key, title, columns in sections:
+            rows = diff.get(key) or []
+            parts.append(f"<h5>{html_escape(title)} ({len(rows)})</h5>")
+            if not rows:
+                continue
+            header = ''.join(f"<th>{html_escape(col)}</th>" for col in columns)
+            body = ''.join(
+                "<tr>" + ''.join(f"<td>{html_escape(str(row.get(col, '')))}</td>" for col in columns) + "</tr>"
+                for row in rows
+            )
+            parts.append(f"<table class='table table-sm'><thead><tr>{header}</tr></thead><tbody>{body}</tbody></table>")
+        return ''.join(parts)
@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+from . import test_transit_line_write
+from . import test_voyage_header_propagation
+from . import test_index_plans
+from . import test_transit_reassign
+from . import test_allocation_receipts
+from . import test_shortage_rebalancer
+from . import test_transit_auto_match
+from . import test_transit_atp
+from . import test_carrier_event_import
+from . import test_dimension_validator
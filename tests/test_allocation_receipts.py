@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+from odoo.tests import TransactionCase, tagged
+
+
+@tagged('post_install', '-at_install')
+class TestAllocationReceipts(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.vendor = cls.env['res.partner'].create({'name': 'Proveedor'})
+        cls.customer = cls.env['res.partner'].create({'name': 'Cliente'})
+        cls.product = cls.env['product.product'].create({
+            'name': 'Placa Libro',
+            'type': 'consu',
+            'is_storable': True,
+        })
+        cls.purchase = cls.env['purchase.order'].create({
+            'partner_id': cls.vendor.id,
+            'order_line': [(0, 0, {'product_id': cls.product.id, 'product_qty': 10.0, 'price_unit': 1.0})],
+        })
+        cls.sale = cls.env['sale.order'].create({
+            'partner_id': cls.customer.id,
+            'order_line': [(0, 0, {'product_id': cls.product.id, 'product_uom_qty': 10.0})],
+        })
+        cls.allocation = cls.env['purchase.order.line.allocation'].create({
+            'purchase_line_id': cls.purchase.order_line.id,
+            'sale_line_id': cls.sale.order_line.id,
+            'quantity': 10.0,
+        })
+
+    def _register(self, event_type, qty):
+        self.env['purchase.order.line.allocation']._register_receipts([{
+            'allocation_id': self.allocation.id,
+            'event_type': event_type,
+            'quantity': qty,
+        }])
+
+    def _sync(self):
+        self.env['purchase.order.line.allocation']._cron_sync_allocation_states()
+
+    def test_state_transitions(self):
+        """pending -> in_transit -> partial -> done según el libro de recepciones."""
+        self.assertEqual(self.allocation.state, 'pending')
+
+        self._register('transit', 10.0)
+        self._sync()
+        self.assertEqual(self.allocation.state, 'in_transit')
+        self.assertEqual(self.allocation.qty_received, 0.0)
+
+        self.allocation.action_mark_received(qty=4.0)
+        self._sync()
+        self.assertEqual(self.allocation.state, 'partial')
+        self.assertEqual(self.allocation.qty_received, 4.0)
+
+        self.allocation.action_mark_received(qty=6.0)
+        self._sync()
+        self.assertEqual(self.allocation.state, 'done')
+        self.assertEqual(self.allocation.qty_received, 10.0)
+
+    def test_receipt_does_not_touch_allocation_row(self):
+        """Registrar una recepción solo inserta: la fila de la allocation no se reescribe."""
+        self.env.flush_all()
+        self.env.cr.execute("SELECT ctid FROM purchase_order_line_allocation WHERE id = %s", [self.allocation.id])
+        ctid_before = self.env.cr.fetchone()[0]
+
+        self.allocation.action_mark_received(qty=4.0)
+        self.env.flush_all()
+        self.env.cr.execute("SELECT ctid FROM purchase_order_line_allocation WHERE id = %s", [self.allocation.id])
+        self.assertEqual(self.env.cr.fetchone()[0], ctid_before)
+        # La cantidad recibida se lee del libro de inmediato; el estado espera al cron
+        self.assertEqual(self.allocation.qty_received, 4.0)
+        self.assertEqual(self.allocation.state, 'pending')
+        self._sync()
+        self.assertEqual(self.allocation.state, 'partial')
+
+    def test_cancelled_untouched(self):
+        """Las allocations canceladas no cambian de estado al recibir."""
+        self.allocation.state = 'cancelled'
+        self.allocation.action_mark_received(qty=10.0)
+        self._sync()
+        self.assertEqual(self.allocation.state, 'cancelled')
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+import base64
+from datetime import date
+
+from odoo.tests import TransactionCase, tagged
+
+
+@tagged('post_install', '-at_install')
+class TestCarrierEventImport(TransactionCase):
+    """Importación CSV de eventos de naviera: lectura, resolución de viajes, avance de estado y reporte."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        Voyage = cls.env['stock.transit.voyage']
+        # Cabecera con dos contenedores en mayúsculas/minúsculas mezcladas
+        cls.voyage_multi = Voyage.create({
+            'container_number': 'Mscu1234567 / tghu7654321',
+            'custom_status': 'booking',
+        })
+        cls.voyage_ahead = Voyage.create({
+            'container_number': 'CMAU0000001',
+            'custom_status': 'arrived_port',
+        })
+        # Contenedor solo en las líneas (respaldo de la búsqueda)
+        cls.voyage_lines = Voyage.create({'container_number': 'TBD', 'custom_status': 'booking'})
+        cls.env['stock.transit.line'].create({
+            'voyage_id': cls.voyage_lines.id,
+            'product_id': cls.env['product.product'].create({'name': 'Placa Naviera', 'type': 'consu'}).id,
+            'product_uom_qty': 1.0,
+            'container_number': 'oolu5555555',
+        })
+
+    def _import(self, content):
+        wizard = self.env['transit.carrier.event.import'].create({
+            'data_file': base64.b64encode(content.encode()),
+            'filename': 'eventos.csv',
+        })
+        wizard.action_import()
+        return wizard
+
+    def test_import_events(self):
+        wizard = self._import(
+            "Container,BL,Event_Code,Timestamp,ETA\n"
+            "mscu1234567,,lod,2026-01-10 08:00:00,2026-02-01\n"
+            "TGHU7654321,,DEP,2026-01-11 08:00:00,\n"
+            "cmau0000001,,LOD,2026-01-12 08:00:00,\n"
+            "OOLU5555555,,VA,2026-01-12 09:00:00,\n"
+            "xxxu9999999,,LOD,2026-01-12 10:00:00,\n"
+            "MSCU1234567,,ZZZ,2026-01-13 08:00:00,\n"
+        )
+
+        # Ambos contenedores de la cabecera resuelven al mismo viaje: un solo mensaje
+        self.assertEqual(self.voyage_multi.custom_status, 'on_sea')
+        self.assertEqual(self.voyage_multi.eta, date(2026, 2, 1))
+        messages = self.voyage_multi.message_ids.filtered(lambda m: 'Eventos de naviera' in (m.body or ''))
+        self.assertEqual(len(messages), 1)
+        self.assertIn('TGHU7654321', messages.body)
+
+        self.assertEqual(self.voyage_lines.custom_status, 'puerto_destino')
+        # Solo avances: un evento anterior no hace retroceder el viaje
+        self.assertEqual(self.voyage_ahead.custom_status, 'arrived_port')
+
+        self.assertEqual(wizard.state, 'done')
+        self.assertIn('6 filas leídas, 2 viajes actualizados, 2 eventos sin procesar', wizard.result_html)
+        self.assertIn('XXXU9999999', wizard.result_html)
+        self.assertIn('ZZZ', wizard.result_html)
+        self.assertNotIn('CMAU0000001', wizard.result_html)
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+from unittest import skipIf
+
+from odoo import Command
+from odoo.tests import TransactionCase, tagged
+
+from ..models.utils import dimension_validator
+from ..models.utils.dimension_validator import DimensionValidator
+
+
+@tagged('post_install', '-at_install')
+class TestDimensionValidatorParity(TransactionCase):
+    """El cálculo con numpy y el de Python puro devuelven los mismos resultados."""
+
+    def _data(self):
+        data = {name: [] for name in ('ids', 'voyage_ids', 'containers', 'alto', 'ancho', 'qty')}
+        for i in range(1, 61):
+            alto, ancho = 1.6 + (i % 4) * 0.1, 3.2 - (i % 3) * 0.1
+            qty = alto * ancho * (1 + (i % 9 - 4) * 0.003)
+            if i % 13 == 0:
+                alto = 0.0  # sin medidas
+            elif i % 11 == 0:
+                qty = alto * ancho * 1.03  # fuera de tolerancia
+            elif i == 29:
+                qty *= 1.8  # atípica
+            data['ids'].append(i)
+            data['voyage_ids'].append(9 + i % 3)
+            data['containers'].append(f"MSCU{i % 4}" if i % 7 else '')
+            data['alto'].append(alto)
+            data['ancho'].append(ancho)
+            data['qty'].append(qty)
+        return data
+
+    @skipIf(dimension_validator.np is None, "numpy no está instalado")
+    def test_numpy_and_python_agree(self):
+        data = self._data()
+        np_results, np_totals = DimensionValidator._analyze_numpy(data, 0.02, 1.0)
+        py_results, py_totals = DimensionValidator._analyze_python(data, 0.02, 1.0)
+
+        self.assertEqual([r[3] for r in np_results], [r[3] for r in py_results])
+        self.assertEqual({r[3] for r in py_results}, {False, 'missing', 'mismatch', 'outlier'})
+        for np_row, py_row in zip(np_results, py_results):
+            self.assertEqual(np_row[0], py_row[0])
+            self.assertAlmostEqual(np_row[1], py_row[1])
+            self.assertAlmostEqual(np_row[2], py_row[2])
+
+        by_key = {(t['voyage_id'], t['container']): t for t in py_totals}
+        self.assertEqual(set(by_key), {(t['voyage_id'], t['container']) for t in np_totals})
+        for total in np_totals:
+            expected = by_key[(total['voyage_id'], total['container'])]
+            self.assertEqual(total['flagged'], expected['flagged'])
+            for key in ('declared', 'computed', 'diff'):
+                self.assertAlmostEqual(total[key], expected[key])
+
+
+@tagged('post_install', '-at_install')
+class TestDimensionCheck(TransactionCase):
+    """Carga y escritura de resultados de la validación de medidas."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.product = cls.env['product.product'].create({'name': 'Placa Medidas', 'type': 'consu'})
+        cls.voyage = cls.env['stock.transit.voyage'].create({'custom_status': 'on_sea'})
+        cls.line, cls.archived_line = cls.env['stock.transit.line'].create([{
+            'voyage_id': cls.voyage.id,
+            'product_id': cls.product.id,
+            'product_uom_qty': 5.0,
+        } for __ in range(2)])
+
+    def test_line_without_lot_is_missing(self):
+        data = DimensionValidator.load(self.env, self.voyage.ids)
+        self.assertEqual(data['checked_voyage_ids'], self.voyage.ids)
+        self.assertIn(self.line.id, data['ids'])
+        results, __ = DimensionValidator.analyze(data)
+        DimensionValidator.write_results(self.env, results, data['checked_voyage_ids'])
+        self.assertEqual(self.line.dimension_flag, 'missing')
+
+    def test_stale_flags_are_cleared(self):
+        """Las líneas que ya no se analizan no conservan el flag de una validación anterior."""
+        self.archived_line.write({'dimension_flag': 'outlier', 'dimension_diff': 3.0})
+        self.archived_line.active = False
+        wizard = self.env['transit.dimension.check'].create({})
+        wizard.action_check()
+        self.assertIn(self.voyage, wizard.checked_voyage_ids)
+        self.assertEqual(self.line.dimension_flag, 'missing')
+        self.assertFalse(self.archived_line.dimension_flag)
+        self.assertFalse(self.archived_line.dimension_diff)
+
+    def test_invisible_voyages_are_skipped(self):
+        """Solo se leen viajes visibles para el usuario según sus reglas de compañía."""
+        other_company = self.env['res.company'].create({'name': 'Otra Compañía'})
+        foreign_voyage = self.env['stock.transit.voyage'].create({'company_id': other_company.id})
+        self.env['stock.transit.line'].create({
+            'voyage_id': foreign_voyage.id, 'product_id': self.product.id, 'product_uom_qty': 5.0,
+        })
+        self.env['ir.rule'].create({
+            'name': 'Viajes por compañía (test)',
+            'model_id': self.env.ref('stock_transit_allocation.model_stock_transit_voyage').id,
+            'domain_force': "[('company_id', 'in', company_ids + [False])]",
+        })
+        user = self.env['res.users'].create({
+            'name': 'Usuario Tránsito',
+            'login': 'transit_dimension_user',
+            'company_id': self.env.company.id,
+            'company_ids': [Command.set(self.env.company.ids)],
+            'group_ids': [Command.set([
+                self.env.ref('base.group_user').id,
+                self.env.ref('stock_transit_allocation.group_transit_user').id,
+            ])],
+        })
+        data = DimensionValidator.load(self.env(user=user), (self.voyage | foreign_voyage).ids)
+        self.assertEqual(data['checked_voyage_ids'], self.voyage.ids)
+        self.assertEqual(set(data['voyage_ids']), {self.voyage.id})
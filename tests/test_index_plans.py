@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+from contextlib import contextmanager
+
+from odoo.tests import TransactionCase, tagged
+from odoo.tools import SQL
+
+
+@tagged('post_install', '-at_install')
+class TestIndexPlans(TransactionCase):
+    """
+    Los dominios calientes de tránsito deben poder resolverse con sus índices.
+    Se ejecuta EXPLAIN sobre el SQL real (el que genera el ORM o el de las
+    consultas directas) con los recorridos secuenciales desactivados: si el
+    planificador no encuentra un índice aplicable, el plan no lo nombra.
+    Planes de referencia con volumen: doc/index_plans.md.
+    """
+
+    @contextmanager
+    def _no_seqscan(self):
+        self.env.cr.execute("SET LOCAL enable_seqscan = off")
+        try:
+            yield
+        finally:
+            self.env.cr.execute("SET LOCAL enable_seqscan = on")
+
+    def _index_names(self, table, suffix):
+        self.env.cr.execute(
+            "SELECT indexname FROM pg_indexes WHERE tablename = %s AND indexname LIKE %s",
+            (table, f'%{suffix}'))
+        names = [row[0] for row in self.env.cr.fetchall()]
+        self.assertTrue(names, f"No existe un índice '*{suffix}' en {table}")
+        return names
+
+    def _plan(self, query, params=None):
+        with self._no_seqscan():
+            if isinstance(query, SQL):
+                self.env.cr.execute(SQL("EXPLAIN %s", query))
+            else:
+                self.env.cr.execute(f"EXPLAIN {query}", params)
+            return '\n'.join(row[0] for row in self.env.cr.fetchall())
+
+    def assertDomainUsesIndex(self, model, domain, suffixes):
+        Model = self.env[model]
+        plan = self._plan(Model._search(domain).select())
+        self._assert_plan_uses(plan, Model._table, suffixes)
+
+    def _assert_plan_uses(self, plan, table, suffixes):
+        names = [name for suffix in suffixes for name in self._index_names(table, suffix)]
+        self.assertTrue(any(name in plan for name in names),
+                        f"Ninguno de {names} aparece en el plan:\n{plan}")
+
+    def test_transit_line_domains(self):
+        Line = 'stock.transit.line'
+        all_lines = self.env[Line].with_context(active_test=False)
+        plan = self._plan(all_lines._search([('order_id', 'in', [1, 2]), ('lot_id', '!=', False)]).select())
+        self._assert_plan_uses(plan, all_lines._table, ['order_lot_idx'])
+        plan = self._plan(all_lines._search([('voyage_id', 'in', [1])]).select())
+        self._assert_plan_uses(plan, all_lines._table, ['voyage_id_index'])
+
+        self.assertDomainUsesIndex(Line, [('lot_id', 'in', [1, 2])], ['lot_id_index'])
+        self.assertDomainUsesIndex(Line, [('quant_id', 'in', [1])], ['quant_id_index'])
+        self.assertDomainUsesIndex(Line, [('allocation_id', 'in', [1, 2])], ['allocation_id_index'])
+        self.assertDomainUsesIndex(
+            Line, [('product_id', 'in', [1, 2]), ('allocation_status', '=', 'available')], ['active_product_idx'])
+
+    def test_voyage_domains(self):
+        Voyage = 'stock.transit.voyage'
+        self.assertDomainUsesIndex(
+            Voyage, [('purchase_id', 'in', [1, 2]), ('custom_status', '!=', 'cancel')], ['purchase_open_idx'])
+        self.assertDomainUsesIndex(Voyage, [('reception_picking_id', '=', 1)], ['reception_picking_id_index'])
+        self.assertDomainUsesIndex(Voyage, [('custom_status', '=', 'on_sea')], ['active_status_idx'])
+
+    def test_allocation_domains(self):
+        Allocation = 'purchase.order.line.allocation'
+        self.assertDomainUsesIndex(Allocation, [
+            ('purchase_order_id', 'in', [1]), ('product_id', 'in', [1, 2]), ('state', 'not in', ['done', 'cancelled']),
+        ], ['purchase_open_idx', 'purchase_state_idx'])
+        self.assertDomainUsesIndex(
+            Allocation, [('purchase_order_id', '=', 1), ('state', '=', 'pending')], ['purchase_state_idx', 'purchase_open_idx'])
+        self.assertDomainUsesIndex(
+            'purchase.order.line.allocation.receipt', [('allocation_id', 'in', [1, 2])],
+            ['allocation_date_idx', 'allocation_id_index'])
+
+    def test_carrier_event_queries(self):
+        Import = self.env['transit.carrier.event.import']
+        containers = ['MSKU1234567', 'TGHU7654321']
+        plan = self._plan(Import._voyage_container_query, (containers, containers))
+        self._assert_plan_uses(plan, 'stock_transit_voyage', ['container_tokens_idx'])
+        plan = self._plan(Import._voyage_bl_query, (['BL-001'],))
+        self._assert_plan_uses(plan, 'stock_transit_voyage', ['bl_upper_idx'])
+        plan = self._plan(Import._line_container_query, (containers,))
+        self._assert_plan_uses(plan, 'stock_transit_line', ['container_upper_idx'])
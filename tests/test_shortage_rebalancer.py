@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+from odoo.tests import TransactionCase, tagged
+
+from ..models.utils.shortage_rebalancer import ShortageRebalancer
+
+
+@tagged('post_install', '-at_install')
+class TestShortageRebalancer(TransactionCase):
+    """Selección de oferta redistribuible en ShortageRebalancer.propose."""
+
+    PRODUCT = 1
+
+    def _line(self, line_id, qty, allocation_id=False, status='available', partner_id=False):
+        return {
+            'id': line_id,
+            'product_id': self.PRODUCT,
+            'allocation_id': allocation_id,
+            'product_uom_qty': qty,
+            'lot_id': False,
+            'allocation_status': status,
+            'partner_id': partner_id,
+        }
+
+    def _alloc(self, alloc_id, qty):
+        return {'id': alloc_id, 'product_id': self.PRODUCT, 'quantity': qty, 'priority_date': None}
+
+    def test_free_line_fills_deficit(self):
+        """Una línea disponible sin cliente se propone para la allocation con déficit."""
+        proposals, summary = ShortageRebalancer.propose(
+            [self._line(1, 5.0)], [self._alloc(10, 5.0)])
+        self.assertEqual([(p['line_id'], p['from_allocation_id'], p['to_allocation_id']) for p in proposals],
+                         [(1, False, 10)])
+        self.assertEqual(summary[0]['supply'], 5.0)
+
+    def test_reserved_lines_are_not_free(self):
+        """Líneas reservadas a un cliente fuera de allocation no cuentan como oferta."""
+        lines = [
+            self._line(1, 5.0, status='reserved', partner_id=7),
+            self._line(2, 5.0, partner_id=7),
+        ]
+        proposals, summary = ShortageRebalancer.propose(lines, [self._alloc(10, 5.0)])
+        self.assertFalse(proposals)
+        self.assertEqual(summary[0]['supply'], 0.0)
+
+    def test_closed_allocation_lines_are_not_donors(self):
+        """Las líneas de allocations cerradas (fuera de la demanda abierta) no se mueven."""
+        lines = [self._line(1, 5.0, allocation_id=99, status='reserved', partner_id=7)]
+        proposals, summary = ShortageRebalancer.propose(lines, [self._alloc(10, 5.0)])
+        self.assertFalse(proposals)
+        self.assertEqual(summary[0]['supply'], 0.0)
+
+    def test_surplus_donor_moves_to_deficit(self):
+        """El excedente de una allocation abierta cubre el déficit de otra."""
+        lines = [
+            self._line(1, 5.0, allocation_id=10, status='reserved', partner_id=7),
+            self._line(2, 5.0, allocation_id=10, status='reserved', partner_id=7),
+        ]
+        proposals, __ = ShortageRebalancer.propose(lines, [self._alloc(10, 5.0), self._alloc(11, 5.0)])
+        self.assertEqual(len(proposals), 1)
+        self.assertEqual(proposals[0]['from_allocation_id'], 10)
+        self.assertEqual(proposals[0]['to_allocation_id'], 11)
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+from datetime import timedelta
+
+from odoo import fields
+from odoo.tests import TransactionCase, tagged
+
+
+@tagged('post_install', '-at_install')
+class TestTransitAtpPurchaseSupply(TransactionCase):
+    """La oferta de compras del ATP descuenta solo lo ya cargado en viajes, por línea de OC."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.product = cls.env['product.product'].create({'name': 'Placa ATP', 'type': 'consu', 'is_storable': True})
+        cls.purchase = cls.env['purchase.order'].create({
+            'partner_id': cls.env['res.partner'].create({'name': 'Proveedor ATP'}).id,
+            'order_line': [
+                (0, 0, {'product_id': cls.product.id, 'product_qty': 30.0,
+                        'date_planned': fields.Datetime.now() + timedelta(days=20)}),
+                (0, 0, {'product_id': cls.product.id, 'product_qty': 30.0,
+                        'date_planned': fields.Datetime.now() + timedelta(days=40)}),
+            ],
+        })
+        cls.purchase.button_confirm()
+        cls.voyage = cls.env['stock.transit.voyage'].create({
+            'purchase_id': cls.purchase.id,
+            'eta': fields.Date.today() + timedelta(days=10),
+        })
+        cls.env['stock.transit.line'].create({
+            'voyage_id': cls.voyage.id,
+            'product_id': cls.product.id,
+            'product_uom_qty': 35.0,
+        })
+
+    def _timeline(self):
+        Atp = self.env['stock.transit.atp']
+        Atp._rebuild([self.product.id])
+        return Atp.search([('product_id', '=', self.product.id)])
+
+    def test_partial_voyage_keeps_purchase_remainder(self):
+        """Un viaje parcial no elimina la OC: lo embarcado consume primero la línea más próxima."""
+        timeline = self._timeline()
+        self.assertEqual(sum(timeline.mapped('qty_transit')), 35.0)
+        purchase = timeline.filtered('qty_purchase')
+        self.assertEqual(purchase.mapped('qty_purchase'), [25.0])
+        self.assertEqual(purchase.date, fields.Date.today() + timedelta(days=40))
+        self.assertEqual(timeline[-1].cumulative_qty, 60.0)
+
+    def test_cancelled_voyage_returns_quantity_to_purchase(self):
+        """Lo cargado en un viaje cancelado vuelve a contar como compra pendiente."""
+        self.voyage.custom_status = 'cancel'
+        timeline = self._timeline()
+        self.assertEqual(sum(timeline.mapped('qty_transit')), 0.0)
+        self.assertEqual(sum(timeline.mapped('qty_purchase')), 60.0)
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+from odoo.tests import TransactionCase, tagged
+
+
+@tagged('post_install', '-at_install')
+class TestTransitAutoMatch(TransactionCase):
+    """Los m² emparejados cuentan una sola vez entre demanda y existencia de To Be Purchased."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.vendor = cls.env['res.partner'].create({'name': 'Proveedor Placas'})
+        cls.product = cls.env['product.product'].create({
+            'name': 'Placa Mandar Pedir',
+            'type': 'consu',
+            'is_storable': True,
+        })
+        # 10 m² pendientes en una OC abierta: es la misma mercancía que viaja en el tránsito
+        cls.purchase = cls.env['purchase.order'].create({
+            'partner_id': cls.vendor.id,
+            'order_line': [(0, 0, {'product_id': cls.product.id, 'product_qty': 10.0})],
+        })
+        cls.voyage = cls.env['stock.transit.voyage'].create({'purchase_id': cls.purchase.id})
+        cls.line = cls.env['stock.transit.line'].create({
+            'voyage_id': cls.voyage.id,
+            'product_id': cls.product.id,
+            'product_uom_qty': 10.0,
+        })
+        cls.order_a = cls._create_order('Cliente A')
+        cls.order_b = cls._create_order('Cliente B')
+
+    @classmethod
+    def _create_order(cls, name):
+        order = cls.env['sale.order'].create({
+            'partner_id': cls.env['res.partner'].create({'name': name}).id,
+            'order_line': [(0, 0, {
+                'product_id': cls.product.id,
+                'product_uom_qty': 10.0,
+                'auto_transit_assign': True,
+            })],
+        })
+        order.action_confirm()
+        return order
+
+    def _board_row(self):
+        rows = [r for r in self.env['purchase.manager.logic'].get_data() if r['id'] == self.product.id]
+        self.assertEqual(len(rows), 1)
+        return rows[0]
+
+    def test_matched_line_reduces_demand_once(self):
+        """La placa emparejada sale de la demanda y de lo pendiente de la OC, no solo de una."""
+        before = self._board_row()
+        self.assertEqual(before['qty_so'], 20.0)
+        self.assertEqual(before['qty_p'], 10.0)
+        self.assertEqual(before['qty_to_buy'], 10.0)
+
+        matches = self.env['stock.transit.auto.match']._run_matcher()
+        self.assertEqual(matches.sale_line_id, self.order_a.order_line)
+        self.assertEqual(self.line.order_id, self.order_a)
+
+        after = self._board_row()
+        self.assertEqual([l['so_id'] for l in after['so_lines']], [self.order_b.id])
+        self.assertEqual(after['qty_so'], 10.0)
+        self.assertEqual(after['qty_p'], 0.0)
+        # Sin corregir la existencia quedaría 0: el pedido B se quedaría sin comprar
+        self.assertEqual(after['qty_to_buy'], 10.0)
+
+    def test_arrived_match_keeps_counting_until_delivered(self):
+        """Un viaje llegado no libera el emparejamiento ni permite volver a emparejar la línea de venta."""
+        match = self.env['stock.transit.auto.match']._run_matcher()
+        self.voyage.custom_status = 'delivered'
+        self.assertTrue(match.active_match)
+
+        # Nueva placa libre: le corresponde al pedido B, no otra vez al A
+        second_voyage = self.env['stock.transit.voyage'].create({})
+        self.env['stock.transit.line'].create({
+            'voyage_id': second_voyage.id,
+            'product_id': self.product.id,
+            'product_uom_qty': 10.0,
+        })
+        new_match = self.env['stock.transit.auto.match']._run_matcher()
+        self.assertEqual(new_match.sale_line_id, self.order_b.order_line)
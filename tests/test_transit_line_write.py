@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+from odoo.tests import TransactionCase, tagged
+
+
+@tagged('post_install', '-at_install')
+class TestTransitLineWrite(TransactionCase):
+    """Camino por lotes de StockTransitLine.write (asignaciones y refrescos diferidos)."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.partner = cls.env['res.partner'].create({'name': 'Cliente Lote'})
+        cls.product = cls.env['product.product'].create({'name': 'Placa Lote', 'type': 'consu', 'is_storable': True})
+        cls.order = cls.env['sale.order'].create({
+            'partner_id': cls.partner.id,
+            'order_line': [(0, 0, {'product_id': cls.product.id, 'product_uom_qty': 30.0})],
+        })
+        cls.voyage = cls.env['stock.transit.voyage'].create({})
+        cls.lines = cls.env['stock.transit.line'].create([{
+            'voyage_id': cls.voyage.id,
+            'product_id': cls.product.id,
+            'product_uom_qty': 10.0,
+        } for __ in range(3)])
+
+    def _assignment_messages(self):
+        return self.voyage.message_ids.filtered(lambda m: 'Asignación' in (m.body or ''))
+
+    def test_batch_assignment(self):
+        """Asignar varias líneas las reserva juntas y deja un solo mensaje en el viaje."""
+        self.lines.write({'partner_id': self.partner.id, 'order_id': self.order.id})
+        self.assertEqual(set(self.lines.mapped('allocation_status')), {'reserved'})
+        self.assertEqual(len(self._assignment_messages()), 1)
+
+        self.lines.write({'partner_id': False, 'order_id': False})
+        self.assertEqual(set(self.lines.mapped('allocation_status')), {'available'})
+
+    def test_unrelated_write_does_not_schedule(self):
+        """Escribir comentarios no programa refresco de sábana ni reconstrucción ATP."""
+        precommit = self.env.cr.precommit
+        precommit.clear()
+        self.lines.write({'notes': 'Revisar embalaje'})
+        self.assertNotIn('stock_transit_sheet.refresh_scheduled', precommit.data)
+        self.assertNotIn('stock_transit_atp.products', precommit.data)
+
+        self.lines.write({'product_uom_qty': 12.0})
+        self.assertTrue(precommit.data.get('stock_transit_sheet.refresh_scheduled'))
+        self.assertEqual(precommit.data.get('stock_transit_atp.products'), {self.product.id})
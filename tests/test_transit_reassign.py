@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+from unittest.mock import patch
+
+from odoo.tests import TransactionCase, tagged
+
+from ..models.utils.transit_manager import TransitManager
+
+
+class TransitReassignCase(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.partner_a = cls.env['res.partner'].create({'name': 'Cliente A'})
+        cls.partner_b = cls.env['res.partner'].create({'name': 'Cliente B'})
+        cls.product = cls.env['product.product'].create({
+            'name': 'Placa Tránsito',
+            'type': 'consu',
+            'is_storable': True,
+            'tracking': 'lot',
+        })
+        cls.lot = cls.env['stock.lot'].create({'name': 'LOT-TR-001', 'product_id': cls.product.id})
+        cls.location = cls.env.ref('stock.stock_location_stock')
+        cls.env['stock.quant']._update_available_quantity(cls.product, cls.location, 5.0, lot_id=cls.lot)
+        cls.quant = cls.env['stock.quant'].search([
+            ('product_id', '=', cls.product.id), ('lot_id', '=', cls.lot.id), ('location_id', '=', cls.location.id),
+        ], limit=1)
+        cls.order_a = cls._create_order(cls.partner_a, cls.product)
+        cls.order_b = cls._create_order(cls.partner_b, cls.product)
+        cls.voyage = cls.env['stock.transit.voyage'].create({})
+        cls.line = cls.env['stock.transit.line'].create({
+            'voyage_id': cls.voyage.id,
+            'product_id': cls.product.id,
+            'lot_id': cls.lot.id,
+            'quant_id': cls.quant.id,
+            'product_uom_qty': 5.0,
+        })
+
+    @classmethod
+    def _create_order(cls, partner, product):
+        order = cls.env['sale.order'].create({
+            'partner_id': partner.id,
+            'order_line': [(0, 0, {'product_id': product.id, 'product_uom_qty': 20.0})],
+        })
+        order.action_confirm()
+        return order
+
+    def _active_holds(self):
+        return self.env['stock.lot.hold'].sudo().search([
+            ('quant_id', '=', self.quant.id), ('estado', '=', 'activo'),
+        ])
+
+
+@tagged('post_install', '-at_install')
+class TestTransitReassign(TransitReassignCase):
+
+    def test_reassign_cancels_previous_hold(self):
+        """Reasignar un lote cancela el hold del cliente anterior y deja solo el del nuevo."""
+        TransitManager.reassign_lot(self.env, self.line, self.partner_a, self.order_a)
+        holds = self._active_holds()
+        self.assertEqual(holds.order_id.partner_id, self.partner_a)
+
+        TransitManager.reassign_lot(self.env, self.line, self.partner_b, self.order_b)
+        holds = self._active_holds()
+        self.assertEqual(len(holds), 1)
+        self.assertEqual(holds.order_id.partner_id, self.partner_b)
+        self.assertEqual(self.line.partner_id, self.partner_b)
+        self.assertEqual(self.line.allocation_status, 'reserved')
+
+    def test_reassign_same_partner_keeps_single_hold(self):
+        """Reasignar al mismo cliente no duplica el hold existente."""
+        TransitManager.reassign_lot(self.env, self.line, self.partner_a, self.order_a)
+        first = self._active_holds()
+        TransitManager.reassign_lot(self.env, self.line, self.partner_a, self.order_a)
+        self.assertEqual(self._active_holds(), first)
+
+    def test_release_cancels_hold(self):
+        """Liberar a stock (sin cliente) cancela el hold y deja la línea disponible."""
+        TransitManager.reassign_lot(self.env, self.line, self.partner_a, self.order_a)
+        TransitManager.reassign_lot(self.env, self.line, False)
+        self.assertFalse(self._active_holds())
+        self.assertFalse(self.line.partner_id)
+        self.assertEqual(self.line.allocation_status, 'available')
+
+
+@tagged('post_install', '-at_install')
+class TestTransitReassignJob(TransitReassignCase):
+    """Reasignación masiva por bloques desde el wizard (sin commits en la petición)."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.visual_lines = cls.env['stock.transit.line'].create([{
+            'voyage_id': cls.voyage.id,
+            'product_id': cls.product.id,
+            'product_uom_qty': 2.0,
+        } for __ in range(3)])
+
+    def _wizard(self, lines, chunk_size):
+        return self.env['transit.reassign.wizard'].create({
+            'line_ids': [(6, 0, lines.ids)],
+            'new_partner_id': self.partner_b.id,
+            'new_order_id': self.order_b.id,
+            'reason': 'Cambio de cliente',
+            'chunk_size': chunk_size,
+        })
+
+    def _summaries(self):
+        return self.voyage.message_ids.filtered(lambda m: 'Reasignación:' in (m.body or ''))
+
+    def test_small_run_is_inline(self):
+        """Hasta 'chunk_size' líneas se procesan en la misma petición."""
+        wizard = self._wizard(self.visual_lines, chunk_size=10)
+        wizard.action_apply()
+        self.assertEqual(wizard.job_id.state, 'done')
+        self.assertEqual(self.visual_lines.partner_id, self.partner_b)
+        self.assertEqual(len(self._summaries()), 1)
+
+    def test_large_run_processed_by_cron(self):
+        """Con más líneas que el bloque, el cron procesa un bloque por ejecución."""
+        wizard = self._wizard(self.visual_lines, chunk_size=2)
+        wizard.action_apply()
+        job = wizard.job_id
+        self.assertEqual(job.state, 'queued')
+        self.assertFalse(self.visual_lines.partner_id)
+
+        Job = self.env['stock.transit.reassign.job']
+        Job._cron_process_jobs()
+        self.assertEqual(job.state, 'running')
+        self.assertEqual(len(job.processed_line_ids), 2)
+        self.assertFalse(self._summaries())
+
+        Job._cron_process_jobs()
+        self.assertEqual(job.state, 'done')
+        self.assertEqual(job.processed_line_ids, self.visual_lines)
+        self.assertEqual(self.visual_lines.partner_id, self.partner_b)
+        self.assertEqual(len(self._summaries()), 1)
+
+    def test_failed_chunk_resumes(self):
+        """Un bloque fallido se descarta; al reanudar se continúa desde lo guardado."""
+        wizard = self._wizard(self.visual_lines, chunk_size=2)
+        wizard.action_apply()
+        job = wizard.job_id
+        Job = self.env['stock.transit.reassign.job']
+        Job._cron_process_jobs()
+
+        with patch.object(type(Job), '_process_chunk', side_effect=ValueError('fallo simulado')):
+            Job._cron_process_jobs()
+        self.assertEqual(job.state, 'failed')
+        self.assertIn('fallo simulado', job.last_error)
+        self.assertEqual(len(job.processed_line_ids), 2)
+
+        Job._cron_process_jobs()
+        self.assertEqual(job.state, 'failed', "Un trabajo interrumpido no se reintenta solo")
+
+        job.action_resume()
+        Job._cron_process_jobs()
+        self.assertEqual(job.state, 'done')
+        self.assertEqual(job.processed_line_ids, self.visual_lines)
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+import logging
+import time
+from datetime import timedelta
+
+from odoo import fields
+from odoo.tests import TransactionCase, tagged
+
+_logger = logging.getLogger(__name__)
+
+
+class TransitPropagationCase(TransactionCase):
+
+    @classmethod
+    def _create_voyage(cls, product, line_count):
+        voyage = cls.env['stock.transit.voyage'].create({'eta': fields.Date.today() + timedelta(days=10)})
+        cls.env['stock.transit.line'].create([{
+            'voyage_id': voyage.id,
+            'product_id': product.id,
+            'product_uom_qty': 5.0,
+        } for __ in range(line_count)])
+        return voyage
+
+
+@tagged('post_install', '-at_install')
+class TestVoyageHeaderPropagation(TransitPropagationCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.product = cls.env['product.product'].create({'name': 'Placa Cabecera', 'type': 'consu', 'is_storable': True})
+        cls.voyage = cls._create_voyage(cls.product, 5)
+        cls.new_eta = fields.Date.today() + timedelta(days=40)
+
+    def test_lines_see_new_header(self):
+        """El UPDATE directo deja caché, búsquedas y write_date de las líneas al día."""
+        lines = self.voyage.line_ids
+        lines.mapped('eta')  # valor antiguo en caché
+        self.voyage.write({'eta': self.new_eta, 'shipping_line': 'MSC'})
+        self.assertEqual(set(lines.mapped('eta')), {self.new_eta})
+        self.assertEqual(set(lines.mapped('shipping_line')), {'MSC'})
+        self.assertEqual(self.env['stock.transit.line'].search_count([
+            ('voyage_id', '=', self.voyage.id), ('eta', '=', self.new_eta),
+        ]), 5)
+
+    def test_dependents_see_new_header(self):
+        """La sábana y la línea de tiempo ATP se construyen con la nueva ETA."""
+        self.voyage.write({'eta': self.new_eta})
+
+        self.env['stock.transit.sheet']._refresh_sheet()
+        sheet = self.env['stock.transit.sheet'].search([('voyage_id', '=', self.voyage.id)])
+        self.assertEqual(set(sheet.mapped('eta')), {self.new_eta})
+
+        Atp = self.env['stock.transit.atp']
+        Atp._rebuild([self.product.id])
+        transit = Atp.search([('product_id', '=', self.product.id), ('qty_transit', '>', 0)])
+        self.assertEqual(transit.date, self.new_eta)
+        self.assertEqual(transit.qty_transit, 25.0)
+
+    def test_query_count_independent_of_lines(self):
+        """La propagación no emite consultas por línea."""
+        big_voyage = self._create_voyage(self.product, 1200)
+        self.env.flush_all()
+        start = self.env.cr.sql_log_count
+        big_voyage.write({'eta': self.new_eta})
+        self.env.flush_all()
+        self.assertLess(self.env.cr.sql_log_count - start, 50)
+
+
+@tagged('post_install', '-at_install', '-standard', 'transit_benchmark')
+class BenchVoyageHeaderPropagation(TransitPropagationCase):
+    """
+    Medición opt-in (--test-tags transit_benchmark): tiempo de propagar una ETA
+    a viajes de 1k+ líneas frente a escribir línea a línea por el ORM.
+    Resultados de referencia en doc/header_propagation.md.
+    """
+
+    def test_benchmark(self):
+        product = self.env['product.product'].create({'name': 'Placa Bench', 'type': 'consu', 'is_storable': True})
+        for line_count in (1000, 5000):
+            voyage = self._create_voyage(product, line_count)
+            self.env.flush_all()
+            eta = voyage.eta + timedelta(days=7)
+
+            start = time.perf_counter()
+            voyage.write({'eta': eta})
+            self.env.flush_all()
+            propagated = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for line in voyage.line_ids:
+                line.write({'eta': eta + timedelta(days=1)})
+            self.env.flush_all()
+            per_line = time.perf_counter() - start
+
+            _logger.info("Propagación de cabecera, %s líneas: UPDATE único %.3fs, ORM por línea %.3fs",
+                         line_count, propagated, per_line)
+            self.assertLess(propagated, per_line)
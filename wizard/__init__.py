@@ -1,3 +1,7 @@
 # -*- coding: utf-8 -*-
 from . import transit_reassign_wizard
 from . import sale_order_consolidate_purchase
+from . import transit_simulation_result
+from . import transit_rebalance_wizard
+from . import transit_carrier_event_import
+from . import transit_dimension_check
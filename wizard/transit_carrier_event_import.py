@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+import base64
+import csv
+import io
+import logging
+from collections import defaultdict
+from datetime import datetime
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError
+from odoo.tools import html_escape
+
+_logger = logging.getLogger(__name__)
+
+
+class TransitCarrierEventImport(models.TransientModel):
+    """
+    Importación masiva de eventos de naviera/forwarder (CSV).
+
+    Columnas (cabecera obligatoria): container, bl, event_code, timestamp, eta.
+    Se requiere 'container' o 'bl'; 'eta' es opcional. El archivo se recorre fila a
+    fila quedándose solo con el último evento por contenedor/BL; los viajes se
+    resuelven con una búsqueda indexada y los cambios se aplican con un write por
+    combinación de valores. Cada viaje recibe un único mensaje con sus eventos.
+    """
+    _name = 'transit.carrier.event.import'
+    _description = 'Importar Eventos de Naviera'
+
+    # Código de evento (estilo EDI 315 / DCSA) -> custom_status del viaje
+    _event_status_map = {
+        'BKD': 'booking', 'BKG': 'booking',
+        'GTI': 'puerto_origen', 'GIN': 'puerto_origen', 'RCV': 'puerto_origen',
+        'LOD': 'on_sea', 'AE': 'on_sea', 'VD': 'on_sea', 'DEP': 'on_sea',
+        'TSA': 'on_sea', 'TSD': 'on_sea',
+        'VA': 'puerto_destino', 'ARR': 'puerto_destino',
+        'UV': 'arrived_port', 'DIS': 'arrived_port',
+        'GTO': 'reception_pending', 'OA': 'reception_pending',
+    }
+
+    # Búsquedas de viajes sobre los índices de expresión de stock.transit.voyage /
+    # stock.transit.line (su uso lo comprueba tests/test_index_plans.py)
+    _voyage_container_query = """
+        SELECT v.id, token
+          FROM stock_transit_voyage v,
+               unnest(regexp_split_to_array(upper(v.container_number), '[[:space:],;/]+')) AS token
+         WHERE regexp_split_to_array(upper(v.container_number), '[[:space:],;/]+') && %s::text[]
+           AND token = ANY(%s::text[])
+         ORDER BY v.id DESC
+    """
+    _voyage_bl_query = """
+        SELECT id, upper(bl_number)
+          FROM stock_transit_voyage
+         WHERE upper(bl_number) = ANY(%s::text[])
+         ORDER BY id DESC
+    """
+    _line_container_query = """
+        SELECT upper(container_number), voyage_id
+          FROM stock_transit_line
+         WHERE upper(container_number) = ANY(%s::text[])
+           AND container_number IS NOT NULL
+         ORDER BY voyage_id DESC
+    """
+
+    data_file = fields.Binary(string='Archivo CSV', required=True)
+    filename = fields.Char(string='Nombre de Archivo')
+    delimiter = fields.Selection([
+        (',', 'Coma (,)'),
+        (';', 'Punto y coma (;)'),
+        ('\t', 'Tabulador'),
+    ], string='Separador', default=',', required=True)
+    state = fields.Selection([('draft', 'Borrador'), ('done', 'Procesado')], default='draft', readonly=True)
+    result_html = fields.Html(string='Resultado', readonly=True, sanitize=True)
+
+    def action_import(self):
+        self.ensure_one()
+        events, unmatched, row_count = self._parse_events()
+        voyages_by_key = self._resolve_voyages(events.keys())
+
+        # Último evento por viaje (un viaje puede tener varios contenedores en el archivo)
+        events_by_voyage = defaultdict(list)
+        for key, event in events.items():
+            voyage = voyages_by_key.get(key)
+            if voyage:
+                events_by_voyage[voyage].append(event)
+            else:
+                unmatched.append(dict(event, reason=_("Contenedor/BL no encontrado")))
+
+        updated = self._apply_events(events_by_voyage)
+        self.write({
+            'state': 'done',
+            'result_html': self._render_result(row_count, updated, unmatched),
+        })
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': self._name,
+            'res_id': self.id,
+            'view_mode': 'form',
+            'target': 'new',
+        }
+
+    def _parse_events(self):
+        """
+        Lee el CSV en streaming. Devuelve ({(container, bl): evento más reciente},
+        [filas no procesables], filas leídas).
+        """
+        stream = io.TextIOWrapper(io.BytesIO(base64.b64decode(self.data_file)), encoding='utf-8-sig', newline='')
+        reader = csv.DictReader(stream, delimiter=self.delimiter)
+        if not reader.fieldnames or 'event_code' not in [name.strip().lower() for name in reader.fieldnames]:
+            raise UserError(_("El archivo debe tener cabecera con al menos las columnas 'container' o 'bl' y 'event_code'."))
+
+        events = {}
+        unmatched = []
+        row_count = 0
+        for row_number, raw in enumerate(reader, start=2):
+            row_count += 1
+            row = {(k or '').strip().lower(): (v or '').strip() for k, v in raw.items()}
+            event = {
+                'row': row_number,
+                'container': row.get('container', '').upper(),
+                'bl': row.get('bl', '').upper(),
+                'code': row.get('event_code', '').upper(),
+            }
+            if not event['container'] and not event['bl']:
+                unmatched.append(dict(event, reason=_("Sin contenedor ni BL")))
+                continue
+            status = self._event_status_map.get(event['code'])
+            if not status:
+                unmatched.append(dict(event, reason=_("Código de evento desconocido")))
+                continue
+            try:
+                event['timestamp'] = fields.Datetime.to_datetime(row['timestamp']) if row.get('timestamp') else False
+                event['eta'] = fields.Date.to_date(row['eta']) if row.get('eta') else False
+            except ValueError:
+                unmatched.append(dict(event, reason=_("Fecha inválida")))
+                continue
+            event['status'] = status
+
+            key = (event['container'], event['bl'])
+            previous = events.get(key)
+            if not previous or (event['timestamp'] or datetime.min) >= (previous['timestamp'] or datetime.min):
+                events[key] = event
+        return events, unmatched, row_count
+
+    def _resolve_voyages(self, keys):
+        """
+        {(container, bl): viaje} sin distinguir mayúsculas, con consultas sobre
+        índices de expresión: contenedores de cabecera (la cabecera puede listar
+        varios), BL y, como respaldo, el contenedor de las líneas.
+        """
+        keys = list(keys)
+        containers = sorted({container for container, bl in keys if container})
+        bls = sorted({bl for container, bl in keys if bl})
+        Voyage = self.env['stock.transit.voyage']
+        Voyage.flush_model(['container_number', 'bl_number'])
+        self.env['stock.transit.line'].flush_model(['container_number', 'voyage_id'])
+        cr = self.env.cr
+
+        voyage_id_by_container = {}
+        voyage_id_by_bl = {}
+        if containers:
+            cr.execute(self._voyage_container_query, (containers, containers))
+            for voyage_id, container in cr.fetchall():
+                voyage_id_by_container.setdefault(container, voyage_id)
+        if bls:
+            cr.execute(self._voyage_bl_query, (bls,))
+            for voyage_id, bl in cr.fetchall():
+                voyage_id_by_bl.setdefault(bl, voyage_id)
+
+        missing = [container for container in containers if container not in voyage_id_by_container]
+        if missing:
+            cr.execute(self._line_container_query, (missing,))
+            for container, voyage_id in cr.fetchall():
+                voyage_id_by_container.setdefault(container, voyage_id)
+
+        result = {}
+        for container, bl in keys:
+            voyage_id = voyage_id_by_container.get(container) or voyage_id_by_bl.get(bl)
+            if voyage_id:
+                result[(container, bl)] = Voyage.browse(voyage_id)
+        # Respeta permisos/reglas del usuario que importa
+        allowed = Voyage.search([('id', 'in', [voyage.id for voyage in result.values()])])
+        return {key: voyage for key, voyage in result.items() if voyage in allowed}
+
+    def _apply_events(self, events_by_voyage):
+        """
+        Aplica los estados/ETA (solo avances de estado; los viajes entregados o
+        cancelados no se tocan) con un write por combinación de valores y publica
+        un mensaje por viaje. Devuelve los viajes actualizados.
+        """
+        Voyage = self.env['stock.transit.voyage']
+        status_order = [key for key, __ in Voyage._fields['custom_status'].selection]
+        status_labels = dict(Voyage._fields['custom_status'].selection)
+
+        voyages_by_vals = defaultdict(lambda: Voyage)
+        messages = {}
+        for voyage, events in events_by_voyage.items():
+            if voyage.custom_status in ('delivered', 'cancel'):
+                continue
+            vals = {}
+            best = max(events, key=lambda e: status_order.index(e['status']))
+            if status_order.index(best['status']) > status_order.index(voyage.custom_status):
+                vals['custom_status'] = best['status']
+            etas = [e['eta'] for e in events if e['eta']]
+            if etas and max(etas) != voyage.eta:
+                vals['eta'] = max(etas)
+            if not vals:
+                continue
+            voyages_by_vals[tuple(sorted(vals.items()))] |= voyage
+
+            changes = []
+            if 'custom_status' in vals:
+                changes.append(f"{status_labels[voyage.custom_status]} → {status_labels[vals['custom_status']]}")
+            if 'eta' in vals:
+                changes.append(f"ETA {voyage.eta or '-'} → {vals['eta']}")
+            event_list = ', '.join(
+                f"{e['code']} {e['container'] or e['bl']}"
+                + (f" ({fields.Datetime.to_string(e['timestamp'])})" if e['timestamp'] else '')
+                for e in events
+            )
+            messages[voyage] = (
+                f"📡 <b>Eventos de naviera</b> ({html_escape(self.filename or '')}): {html_escape(event_list)}"
+                f"<br/>{html_escape(' | '.join(changes))}"
+            )
+
+        # El seguimiento estándar se desactiva: el mensaje agregado lo sustituye
+        for vals_key, voyages in voyages_by_vals.items():
+            voyages.with_context(tracking_disable=True).write(dict(vals_key))
+
+        updated = Voyage
+        for voyage, body in messages.items():
+            voyage.message_post(body=body)
+            updated |= voyage
+        _logger.info(f"Eventos de naviera: {len(updated)} viajes actualizados con {len(voyages_by_vals)} escrituras")
+        return updated
+
+    def _render_result(self, row_count, updated, unmatched):
+        rows = ''.join(
+            f"<tr><td>{event['row']}</td><td>{html_escape(event['container'])}</td>"
+            f"<td>{html_escape(event['bl'])}</td><td>{html_escape(event['code'])}</td>"
+            f"<td>{html_escape(event['reason'])}</td></tr>"
+            for event in sorted(unmatched, key=lambda e: e['row'])
+        )
+        summary = html_escape(_("%(rows)s filas leídas, %(voyages)s viajes actualizados, %(unmatched)s eventos sin procesar.",
+                                rows=row_count, voyages=len(updated), unmatched=len(unmatched)))
+        if not rows:
+            return f"<p>{summary}</p>"
+        return (
+            f"<p>{summary}</p><table class='table table-sm'><thead><tr>"
+            f"<th>{html_escape(_('Fila'))}</th><th>{html_escape(_('Contenedor'))}</th><th>BL</th>"
+            f"<th>{html_escape(_('Evento'))}</th><th>{html_escape(_('Motivo'))}</th>"
+            f"</tr></thead><tbody>{rows}</tbody></table>"
+        )
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+from odoo import models, fields, api, _
+from odoo.tools import html_escape
+from ..models.utils.dimension_validator import DimensionValidator
+
+
+class TransitDimensionCheck(models.TransientModel):
+    _name = 'transit.dimension.check'
+    _description = 'Validación de Medidas de Placas'
+
+    # Conversión de alto × ancho a m² (1.0 si las medidas del lote están en metros)
+    _area_factor_param = 'stock_transit_allocation.dimension_area_factor'
+    # Máximo de contenedores listados en el resumen
+    _summary_limit = 200
+
+    voyage_ids = fields.Many2many('stock.transit.voyage', string='Viajes',
+        help="Vacío para validar todos los viajes abiertos")
+    tolerance_pct = fields.Float(string='Tolerancia (%)', default=2.0, required=True)
+    summary_html = fields.Html(string='Resumen por Contenedor', readonly=True, sanitize=True)
+    checked_count = fields.Integer(string='Placas Analizadas', readonly=True)
+    flagged_count = fields.Integer(string='Placas Observadas', readonly=True)
+    checked_voyage_ids = fields.Many2many('stock.transit.voyage', 'transit_dimension_check_checked_rel',
+        string='Viajes Analizados', readonly=True)
+    state = fields.Selection([('draft', 'Borrador'), ('done', 'Validado')], default='draft', readonly=True)
+
+    @api.model
+    def default_get(self, fields_list):
+        res = super().default_get(fields_list)
+        if self.env.context.get('active_model') == 'stock.transit.voyage' and 'voyage_ids' in fields_list:
+            res['voyage_ids'] = [(6, 0, self.env.context.get('active_ids', []))]
+        return res
+
+    def action_check(self):
+        self.ensure_one()
+        area_factor = float(self.env['ir.config_parameter'].sudo().get_param(self._area_factor_param, 1.0))
+        data = DimensionValidator.load(self.env, self.voyage_ids.ids)
+        results, totals = DimensionValidator.analyze(data, self.tolerance_pct / 100.0, area_factor)
+        DimensionValidator.write_results(self.env, results, data['checked_voyage_ids'])
+
+        self.write({
+            'checked_count': len(results),
+            'flagged_count': sum(1 for result in results if result[3]),
+            'checked_voyage_ids': [(6, 0, data['checked_voyage_ids'])],
+            'summary_html': self._render_totals(totals),
+            'state': 'done',
+        })
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': self._name,
+            'res_id': self.id,
+            'view_mode': 'form',
+            'target': 'new',
+        }
+
+    def action_view_flagged(self):
+        self.ensure_one()
+        action = self.env['ir.actions.act_window']._for_xml_id('stock_transit_allocation.action_transit_line_dimension_flagged')
+        action['domain'] = [('voyage_id', 'in', self.checked_voyage_ids.ids), ('dimension_flag', '!=', False)]
+        return action
+
+    def _render_totals(self, totals):
+        """Contenedores con placas observadas o diferencia total, de mayor a menor discrepancia."""
+        tolerance = self.tolerance_pct / 100.0
+        relevant = [
+            total for total in totals
+            if total['flagged'] or (total['computed'] and abs(total['diff']) / total['computed'] > tolerance)
+        ]
+        relevant.sort(key=lambda total: abs(total['diff']), reverse=True)
+        if not relevant:
+            return f"<p>{html_escape(_('Sin discrepancias por contenedor.'))}</p>"
+
+        voyages = self.env['stock.transit.voyage'].browse({total['voyage_id'] for total in relevant[:self._summary_limit]})
+        names = {voyage.id: voyage.name for voyage in voyages}
+        rows = ''.join(
+            f"<tr><td>{html_escape(names.get(total['voyage_id'], ''))}</td><td>{html_escape(total['container'])}</td>"
+            f"<td>{total['declared']:.2f}</td><td>{total['computed']:.2f}</td>"
+            f"<td>{total['diff']:.2f}</td><td>{total['flagged']}</td></tr>"
+            for total in relevant[:self._summary_limit]
+        )
+        return (
+            "<table class='table table-sm'><thead><tr>"
+            f"<th>{html_escape(_('Viaje'))}</th><th>{html_escape(_('Contenedor'))}</th>"
+            f"<th>{html_escape(_('m² Declarados'))}</th><th>{html_escape(_('m² Calculados'))}</th>"
+            f"<th>{html_escape(_('Diferencia'))}</th><th>{html_escape(_('Placas Observadas'))}</th>"
+            f"</tr></thead><tbody>{rows}</tbody></table>"
+        )
@@ -1,5 +1,5 @@
 # -*- coding: utf-8 -*-
-from odoo import models, fields, api, _
+from odoo import models, fields, api, Command, _
 from odoo.exceptions import UserError
 # Asegúrate de que la ruta de importación coincida con tu estructura de carpetas
 from ..models.utils.transit_manager import TransitManager
@@ -22,83 +22,172 @@ class TransitReassignWizard(models.TransientModel):
     
     reason = fields.Text(string='Motivo / Notas', required=True)
 
+    assignment_mode = fields.Selection([
+        ('single', 'Un solo Pedido'),
+        ('split', 'Repartir entre Pedidos'),
+    ], string='Modo', default='single', required=True)
+    target_ids = fields.One2many('transit.reassign.wizard.target', 'wizard_id', string='Pedidos Destino')
+
+    simulation_html = fields.Html(string='Vista Previa', readonly=True, sanitize=True)
+
+    # Procesamiento por bloques (reanudable): ver stock.transit.reassign.job
+    chunk_size = fields.Integer(string='Líneas por Bloque', default=500,
+        help="Con más líneas que este valor, la reasignación se procesa en segundo plano "
+             "por bloques; un proceso interrumpido puede reanudarse desde el último bloque guardado.")
+    job_id = fields.Many2one('stock.transit.reassign.job', string='Proceso', readonly=True)
+
+    def action_simulate(self):
+        """Simula la reasignación (sin escribir) y muestra el diff en el wizard."""
+        self.ensure_one()
+        if self.assignment_mode == 'split':
+            assigned, leftover = self._distribute_split()
+            diff = TransitManager.empty_simulation()
+            for target in self.target_ids:
+                target_diff = TransitManager.simulate_reassignment(
+                    self.env, assigned[target.id], target.partner_id, target.order_id)
+                for key, rows in target_diff.items():
+                    diff[key].extend(rows)
+            diff['unmatched'].extend({
+                'lot': line.lot_id.name or '',
+                'product': line.product_id.display_name,
+                'reason': _("Excede la demanda de los pedidos destino"),
+            } for line in leftover)
+            self.simulation_html = TransitManager.render_simulation_html(diff)
+            return self._reopen()
+
+        if self.new_partner_id and not self.new_order_id:
+            raise UserError(_("No puede asignar mercancía a un cliente sin especificar a qué Orden de Venta (Pedido) pertenece."))
+
+        diff = TransitManager.simulate_reassignment(self.env, self.line_ids, self.new_partner_id, self.new_order_id)
+        self.simulation_html = TransitManager.render_simulation_html(diff)
+        return self._reopen()
+
     def action_apply(self):
-        """Aplica la reasignación con validaciones y crea Orden de Reserva consolidada"""
+        """
+        Aplica la reasignación con validaciones y crea Orden de Reserva consolidada.
+        Hasta 'chunk_size' líneas se procesan en esta petición; con más, se crea un
+        proceso en segundo plano que el cron ejecuta bloque a bloque.
+        """
         self.ensure_one()
+        if self.assignment_mode == 'split':
+            return self._apply_split()
         
         # Validación básica: Si hay cliente, debe haber pedido de venta
         if self.new_partner_id and not self.new_order_id:
             raise UserError(_("No puede asignar mercancía a un cliente sin especificar a qué Orden de Venta (Pedido) pertenece."))
 
-        hold_order = False
-
-        # -------------------------------------------------------------------------
-        # PASO 1: Crear la cabecera de la Orden de Reserva (UNA SOLA VEZ)
-        # -------------------------------------------------------------------------
-        if self.new_partner_id:
-            # Datos opcionales del proyecto/arquitecto desde la Sale Order (si existen campos 'x_')
-            project_id = getattr(self.new_order_id, 'x_project_id', False)
-            architect_id = getattr(self.new_order_id, 'x_architect_id', False)
-            
-            # Buscar moneda USD, fallback a moneda de la compañía
-            currency = self.env['res.currency'].search([('name', '=', 'USD')], limit=1)
-            if not currency:
-                currency = self.env.company.currency_id
-
-            # Creamos el objeto 'stock.lot.hold.order'
-            hold_order = self.env['stock.lot.hold.order'].create({
-                'partner_id': self.new_partner_id.id,
-                'user_id': self.env.user.id,
-                'company_id': self.env.company.id,
-                'project_id': project_id.id if project_id else False,
-                'arquitecto_id': architect_id.id if architect_id else False,
-                'currency_id': currency.id,
-                'fecha_orden': fields.Datetime.now(),
-                'notas': f"Reasignación desde Tránsito.\nMotivo: {self.reason}\nPedido Origen: {self.new_order_id.name}",
-            })
-
-        # -------------------------------------------------------------------------
-        # PASO 2: Iterar las líneas pasando el objeto 'hold_order' ya creado
-        # -------------------------------------------------------------------------
-        for line in self.line_ids:
-            # Llamamos al Manager pasando 'hold_order_obj' para que NO cree una nueva, sino que use la existente
-            TransitManager.reassign_lot(
-                self.env, 
-                line, 
-                self.new_partner_id, 
-                self.new_order_id, 
-                self.reason,
-                hold_order_obj=hold_order 
-            )
-            
-            # Log en el chatter del viaje (Voyage)
-            msg = f"🔄 <b>Reasignación:</b> Lote {line.lot_id.name}<br/>"
-            msg += f"A: {self.new_partner_id.name or 'Stock'} ({self.new_order_id.name or '-'})"
-            if line.voyage_id:
-                line.voyage_id.message_post(body=msg)
-
-        # -------------------------------------------------------------------------
-        # PASO 3: Confirmar la Orden de Reserva al finalizar el bucle
-        # -------------------------------------------------------------------------
+        job = self.env['stock.transit.reassign.job'].create({
+            'line_ids': [Command.set(self.line_ids.ids)],
+            'new_partner_id': self.new_partner_id.id,
+            'new_order_id': self.new_order_id.id,
+            'reason': self.reason,
+            'chunk_size': self.chunk_size,
+        })
+        self.job_id = job
+
+        if self.chunk_size > 0 and len(self.line_ids) > self.chunk_size:
+            job._schedule()
+            return {
+                'type': 'ir.actions.client',
+                'tag': 'display_notification',
+                'params': {
+                    'title': 'Reasignación en Proceso',
+                    'message': _('%(lines)s líneas se reasignarán en segundo plano por bloques de %(size)s. '
+                                 'Puede seguir el avance en Torre de Control > Reasignaciones por Bloques.',
+                                 lines=len(self.line_ids), size=self.chunk_size),
+                    'type': 'info',
+                    'sticky': False,
+                    'next': {'type': 'ir.actions.act_window_close'},
+                }
+            }
+
+        job._run_inline()
+        hold_order = job.hold_order_id
         if hold_order:
-            # Verificar si realmente se crearon líneas (puede que algunos quants no existieran y se saltaron)
-            if hold_order.hold_line_ids:
-                hold_order.action_confirm()
-                
-                # Notificación visual 'Sticky' de éxito
-                return {
-                    'type': 'ir.actions.client',
-                    'tag': 'display_notification',
-                    'params': {
-                        'title': 'Reasignación Exitosa',
-                        'message': f'Se generó la Orden de Reserva {hold_order.name} correctamente.',
-                        'type': 'success',
-                        'sticky': False,
-                        'next': {'type': 'ir.actions.act_window_close'},
-                    }
+            # Notificación visual 'Sticky' de éxito
+            return {
+                'type': 'ir.actions.client',
+                'tag': 'display_notification',
+                'params': {
+                    'title': 'Reasignación Exitosa',
+                    'message': f'Se generó la Orden de Reserva {hold_order.name} correctamente.',
+                    'type': 'success',
+                    'sticky': False,
+                    'next': {'type': 'ir.actions.act_window_close'},
                 }
-            else:
-                # Si no se crearon líneas (ej. no había quants físicos encontrados), borramos la cabecera vacía
-                hold_order.unlink()
+            }
+        return {'type': 'ir.actions.act_window_close'}
+
+    def _distribute_split(self):
+        """Reparte las líneas seleccionadas entre los pedidos destino (y escribe lo asignado)."""
+        if not self.target_ids:
+            raise UserError(_("Agregue al menos un pedido destino con su metraje objetivo."))
+        if any(target.target_qty <= 0 for target in self.target_ids):
+            raise UserError(_("El metraje objetivo de cada pedido debe ser mayor a cero."))
+        assigned, leftover = TransitManager.distribute_lines(
+            self.line_ids, [(target.id, target.target_qty) for target in self.target_ids])
+        for target in self.target_ids:
+            target.assigned_qty = sum(assigned[target.id].mapped('product_uom_qty'))
+        return assigned, leftover
+
+    def _apply_split(self):
+        """Reparte las líneas entre varios pedidos y crea todas las reservas en una pasada."""
+        assigned, leftover = self._distribute_split()
+        assignments = [
+            (target.partner_id, target.order_id, assigned[target.id])
+            for target in self.target_ids if assigned[target.id]
+        ]
+        if not assignments:
+            raise UserError(_("Ninguna línea cabe en la demanda de los pedidos destino."))
+
+        hold_orders = TransitManager.reserve_split(self.env, assignments, notes=f"Reparto desde Tránsito. Motivo: {self.reason}")
+
+        # Un solo mensaje por viaje con el reparto completo
+        all_lines = self.env['stock.transit.line'].union(*[lines for __, __, lines in assignments])
+        for voyage, voyage_lines in all_lines.grouped('voyage_id').items():
+            if not voyage:
+                continue
+            msg = "🔄 <b>Reparto entre pedidos:</b><br/>"
+            for partner, order, lines in assignments:
+                lines = lines & voyage_lines
+                if lines:
+                    msg += f"{partner.name} ({order.name}): {len(lines)} lotes, {sum(lines.mapped('product_uom_qty')):.2f} m²<br/>"
+            msg += f"Motivo: {self.reason}"
+            voyage.message_post(body=msg)
+
+        message = _('%(lines)s líneas repartidas en %(orders)s órdenes de reserva.',
+                    lines=len(all_lines), orders=len(hold_orders))
+        if leftover:
+            message += ' ' + _('%s líneas quedaron sin asignar (exceden la demanda).', len(leftover))
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': 'Reparto Aplicado',
+                'message': message,
+                'type': 'warning' if leftover else 'success',
+                'sticky': bool(leftover),
+                'next': {'type': 'ir.actions.act_window_close'},
+            }
+        }
+
+    def _reopen(self):
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': self._name,
+            'res_id': self.id,
+            'view_mode': 'form',
+            'target': 'new',
+        }
+
+
+class TransitReassignWizardTarget(models.TransientModel):
+    _name = 'transit.reassign.wizard.target'
+    _description = 'Pedido Destino del Reparto en Tránsito'
 
-        return {'type': 'ir.actions.act_window_close'}
\ No newline at end of file
+    wizard_id = fields.Many2one('transit.reassign.wizard', required=True, ondelete='cascade')
+    partner_id = fields.Many2one('res.partner', string='Cliente', required=True)
+    order_id = fields.Many2one('sale.order', string='Orden de Venta', required=True,
+        domain="[('partner_id', '=', partner_id), ('state', 'in', ['sale', 'done'])]")
+    target_qty = fields.Float(string='m² Objetivo', digits='Product Unit of Measure', required=True)
+    assigned_qty = fields.Float(string='m² Asignados', digits='Product Unit of Measure', readonly=True)
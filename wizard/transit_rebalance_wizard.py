@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+from collections import defaultdict
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError
+from odoo.tools import html_escape
+from ..models.utils.shortage_rebalancer import ShortageRebalancer
+
+
+class TransitRebalanceWizard(models.TransientModel):
+    _name = 'transit.rebalance.wizard'
+    _description = 'Rebalanceo de Faltantes en Tránsito'
+
+    product_ids = fields.Many2many('product.product', string='Productos',
+        help="Vacío para analizar todos los productos con asignaciones abiertas")
+    policy = fields.Selection([
+        ('proportional', 'Proporcional a la demanda'),
+        ('priority', 'Por prioridad (fecha compromiso)'),
+    ], string='Política', default='proportional', required=True)
+    proposal_ids = fields.One2many('transit.rebalance.proposal', 'wizard_id', string='Propuestas')
+    summary_html = fields.Html(string='Resumen', readonly=True, sanitize=True)
+    state = fields.Selection([
+        ('draft', 'Borrador'),
+        ('proposed', 'Propuesto'),
+        ('done', 'Aplicado'),
+    ], default='draft', readonly=True)
+
+    def action_compute(self):
+        """Calcula el reparto objetivo y las reasignaciones propuestas (sin escribir en tránsito)."""
+        self.ensure_one()
+        lines, allocations = ShortageRebalancer.load(self.env, self.product_ids.ids)
+        proposals, summary = ShortageRebalancer.propose(lines, allocations, self.policy)
+
+        products = self.env['product.product'].browse([row['product_id'] for row in summary])
+        names = {product.id: product.display_name for product in products}
+        rows = ''.join(
+            f"<tr><td>{html_escape(names.get(row['product_id'], ''))}</td>"
+            f"<td>{row['supply']:.2f}</td><td>{row['demand']:.2f}</td><td>{row['moves']}</td></tr>"
+            for row in summary
+        )
+        self.write({
+            'proposal_ids': [(5, 0, 0)] + [(0, 0, proposal) for proposal in proposals],
+            'summary_html': (
+                "<table class='table table-sm'><thead><tr>"
+                f"<th>{html_escape(_('Producto'))}</th><th>{html_escape(_('m² en tránsito'))}</th>"
+                f"<th>{html_escape(_('m² demandados'))}</th><th>{html_escape(_('Movimientos'))}</th>"
+                f"</tr></thead><tbody>{rows}</tbody></table>"
+            ),
+            'state': 'proposed',
+        })
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': self._name,
+            'res_id': self.id,
+            'view_mode': 'form',
+            'target': 'new',
+        }
+
+    def action_apply(self):
+        """Aplica en bloque las propuestas marcadas: un write por allocation destino."""
+        self.ensure_one()
+        selected = self.proposal_ids.filtered('apply')
+        if not selected:
+            raise UserError(_("No hay propuestas seleccionadas para aplicar."))
+
+        lines_by_target = defaultdict(lambda: self.env['stock.transit.line'])
+        for proposal in selected:
+            lines_by_target[proposal.to_allocation_id] |= proposal.line_id
+
+        for allocation, lines in lines_by_target.items():
+            # El write de stock.transit.line agrupa reservas y mensajes por viaje
+            lines.write({
+                'partner_id': allocation.partner_id.id,
+                'order_id': allocation.sale_order_id.id,
+                'allocation_id': allocation.id,
+            })
+
+        self.state = 'done'
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': _('Rebalanceo Aplicado'),
+                'message': _('%s líneas reasignadas.', len(selected)),
+                'type': 'success',
+                'sticky': False,
+                'next': {'type': 'ir.actions.act_window_close'},
+            }
+        }
+
+
+class TransitRebalanceProposal(models.TransientModel):
+    _name = 'transit.rebalance.proposal'
+    _description = 'Propuesta de Reasignación por Faltante'
+
+    wizard_id = fields.Many2one('transit.rebalance.wizard', required=True, ondelete='cascade')
+    apply = fields.Boolean(string='Aplicar', default=True)
+    line_id = fields.Many2one('stock.transit.line', string='Línea / Placa', required=True, ondelete='cascade')
+    voyage_id = fields.Many2one(related='line_id.voyage_id', string='Viaje')
+    lot_id = fields.Many2one(related='line_id.lot_id', string='Lote')
+    product_id = fields.Many2one('product.product', string='Producto')
+    qty = fields.Float(string='m²', digits='Product Unit of Measure')
+    from_allocation_id = fields.Many2one('purchase.order.line.allocation', string='Desde')
+    to_allocation_id = fields.Many2one('purchase.order.line.allocation', string='Hacia', required=True)
+    to_partner_id = fields.Many2one(related='to_allocation_id.partner_id', string='Cliente Destino')
+    to_order_id = fields.Many2one(related='to_allocation_id.sale_order_id', string='Pedido Destino')
@@ -0,0 +1,10 @@
+# -*- coding: utf-8 -*-
+from odoo import models, fields
+
+
+class TransitSimulationResult(models.TransientModel):
+    _name = 'transit.simulation.result'
+    _description = 'Resultado de Simulación de Tránsito'
+
+    name = fields.Char(string='Simulación', readonly=True)
+    summary_html = fields.Html(string='Resultado', readonly=True, sanitize=True)